@@ -0,0 +1,381 @@
+# AsyncGetWeather.py
+# Description: asyncio counterpart of GetWeather, based on aiohttp
+#     Many cities can be refreshed from one event loop without spawning threads
+# By Monster Kid
+
+import time
+import asyncio
+import aiohttp
+from HeFengClient import HeFengClient
+from utils.SingleFlight import AsyncSingleFlight
+from utils.RateLimiter import RateLimiter
+from utils.Metrics import MetricsRegistry
+from utils.Tracer import Tracer
+
+class AsyncGetWeather(HeFengClient):
+    """
+    AsyncGetWeather class to get weather infomation asynchronously
+    It has the same request methods as GetWeather, but all of them are coroutines. It's not a GetWeather:
+    only URLs, language, cache and rate limiter are shared, refer to HeFengClient.
+    set_hf_language is not a coroutine.
+    NOTE: an AsyncGetWeather object must be used in one event loop only, because the aiohttp session is bound to it
+    Methods:
+        - get_ow_current, get_ow_forecast: OpenWeather API
+        - get_hf_location, get_hf_current, get_hf_7days, get_hf_24hours, get_hf_rain,
+          get_hf_warning, get_hf_indices, get_hf_air, get_hf_air_forecast: HeFeng API
+        - get_json: GET request through the pooled aiohttp session, return decoded json
+        - fetch: get a HeFeng response from the cache, or request it and cache it
+        - get_json_hedged: GET request with a deadline, hedged when it's slower than usual
+        - close: close the pooled aiohttp session
+    """
+
+    def __init__(self, language: str = 'en', pool_size: int = HeFengClient.POOL_SIZE,
+                 timeout: tuple = HeFengClient.TIMEOUT, cache_ttl: dict = None,
+                 cache_size: int = HeFengClient.CACHE_SIZE, rate_limiter: RateLimiter = None,
+                 deadlines: dict = None, hedge: bool = True, base_url: str = None, metrics: MetricsRegistry = None,
+                 tracer: Tracer = None):
+        """
+        Init AsyncGetWeather class
+        Parameters:
+            :param language: language(str)
+            :param pool_size: max number of keep-alive connections per host(int)
+            :param timeout: default timeout of each request, (connect, read) in seconds(tuple)
+            :param cache_ttl: TTL of each endpoint in seconds, default is HF_TTL(dict)
+            :param cache_size: max number of cached responses, 0 disables the cache(int)
+            :param rate_limiter: rate limiter of HeFeng requests, can be shared by many objects(RateLimiter)
+            :param deadlines: deadline of each endpoint in seconds, default is HF_DEADLINE(dict)
+            :param hedge: whether to hedge slow requests(bool)
+            :param base_url: scheme and host of all the HeFeng APIs, refer to HeFengClient(str)
+            :param metrics: registry of the request metrics, can be shared(MetricsRegistry)
+            :param tracer: tracer of the requests, can be shared(Tracer)
+        """
+
+        super().__init__(language, pool_size, timeout, cache_ttl, cache_size, rate_limiter, deadlines, base_url,
+                         metrics, tracer)
+        # Hedging: if a request is slower than the p95 latency of its endpoint, send a duplicate
+        # and take whichever answers first
+        self.hedge = hedge
+        # number of hedged requests
+        self.hedged = 0
+        # Pooled aiohttp session, created on first request (it must be created inside the event loop)
+        self.session = None
+        # Coroutine version of the single-flight group
+        self.flights = AsyncSingleFlight()
+
+    ## --- Session --- ##
+
+    def get_session(self) -> aiohttp.ClientSession:
+        """
+        Get the pooled aiohttp session, create it if it does not exist
+        Must be called in the event loop. No lock is needed, the event loop is single-threaded
+        Return:
+            :return: the shared session(aiohttp.ClientSession)
+        """
+
+        if self.session is None or self.session.closed:
+            # keep pool_size connections alive for each host, cache DNS results
+            connector = aiohttp.TCPConnector(limit_per_host=self.pool_size, ttl_dns_cache=300)
+            timeout = aiohttp.ClientTimeout(sock_connect=self.timeout[0], sock_read=self.timeout[1])
+            # aiohttp decompresses gzip responses automatically
+            self.session = aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                                 headers={'Accept-Encoding': 'gzip, deflate'})
+        return self.session
+
+    async def get_json(self, url: str, timeout: tuple = None, endpoint: str = None) -> dict:
+        """
+        GET request through the pooled aiohttp session
+        Parameters:
+            :param url: request url(str)
+            :param timeout: timeout of this request, default is self.timeout(tuple)
+            :param endpoint: name of the endpoint, to record the metrics of the response(str)
+        Return:
+            :return: decoded response(dict)
+        """
+
+        session = self.get_session()
+        client_timeout = None
+        if timeout is not None:
+            client_timeout = aiohttp.ClientTimeout(sock_connect=timeout[0], sock_read=timeout[1])
+        async with session.get(url, timeout=client_timeout) as response:
+            # HeFeng API may answer with a wrong content type, do not check it
+            body = await response.read()
+        return self.decode_json(body, endpoint)
+
+    async def timed_get_json(self, endpoint: str, url: str) -> dict:
+        """
+        GET request, record its latency if it succeeds
+        """
+        start = time.monotonic()
+        data = await self.get_json(url, endpoint=endpoint)
+        self.latency.record(endpoint, time.monotonic() - start)
+        self.metrics.observe('request_latency', time.monotonic() - start, endpoint=endpoint)
+        return data
+
+    async def get_json_hedged(self, endpoint: str, url: str) -> dict:
+        """
+        GET request with the deadline of its endpoint
+        If hedging is on and the request is slower than the p95 latency of its endpoint,
+        send a duplicate(if the rate limiter allows) and take whichever answers first
+        Parameters:
+            :param endpoint: name of the endpoint(str)
+            :param url: request url(str)
+        Return:
+            :return: decoded response(dict), raise asyncio.TimeoutError if the deadline is missed
+        """
+
+        deadline = time.monotonic() + self.get_deadline(endpoint)
+        budget = self.latency.percentile(endpoint, 0.95) if self.hedge else None
+        tasks = {asyncio.ensure_future(self.timed_get_json(endpoint, url))}
+        error = None
+        try:
+            # wait for the primary request within its p95 budget, then hedge once
+            if budget is not None and budget < deadline - time.monotonic():
+                done, _ = await asyncio.wait(tasks, timeout=budget)
+                if not done:
+                    code, delay = self.rate_limiter.reserve(wait=False)
+                    if code is None:
+                        self.hedged += 1
+                        self.metrics.inc('hedged', endpoint=endpoint)
+                        tasks.add(asyncio.ensure_future(self.timed_get_json(endpoint, url)))
+            # take the first successful answer before the deadline
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0, deadline - time.monotonic()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise asyncio.TimeoutError()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def fetch(self, endpoint: str, location: str, url: str) -> dict:
+        """
+        Get a HeFeng response from the cache, or request it and cache it
+        Only successful responses are cached. Concurrent requests of the same key share one call
+        Requests are rate limited. If the limiter blocks a request, {'code': '429' or '402'} is returned
+        Requests are hedged and have a total deadline, refer to get_json_hedged.
+        If a request misses the deadline of its endpoint, {'code': '500'} is returned
+        Parameters:
+            :param endpoint: name of the endpoint, key of HF_TTL(str)
+            :param location: location of the request(str)
+            :param url: request url(str)
+        Return:
+            :return: decoded response(dict)
+        """
+
+        key = (endpoint, location, self.hf_language)
+
+        async def request():
+            code, delay = self.rate_limiter.reserve()
+            if code is not None:
+                self.metrics.inc('rate_limited', endpoint=endpoint, code=code)
+                return {'code': code}
+            await asyncio.sleep(delay)
+            try:
+                data = await self.get_json_hedged(endpoint, url)
+            except asyncio.TimeoutError:
+                self.metrics.inc('responses', endpoint=endpoint, code=self.CODE_TIMEOUT)
+                return {'code': self.CODE_TIMEOUT}
+            self.metrics.inc('responses', endpoint=endpoint, code=data.get('code'))
+            self.rate_limiter.report(data.get('code'))
+            if data.get('code') == '200':
+                self.cache.put(key, data)
+            return data
+
+        data = self.cache.get(key)
+        self.metrics.inc('cache', endpoint=endpoint, result='miss' if data is None else 'hit')
+        if data is None:
+            data = await self.flights.do(key, request)
+        return data
+
+    async def close(self):
+        """
+        Close the pooled aiohttp session
+        """
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    ## --- GET request --- ##
+
+    ## OpenWeather API ##
+
+    async def get_ow_current(self, city_name: str) -> dict:
+        """
+        Get current weather infomation of the city
+        Parameters:
+            :param city_name: name of the city(str)
+        Return:
+            :return: weather infomation(dict)
+            please refer to OpenWeather API document
+        """
+        return await self.get_json(self.ow_url_current + '&q=' + city_name)
+
+    async def get_ow_forecast(self, city_name: str) -> dict:
+        """
+        Get forecast weather infomation of the city
+        Parameters:
+            :param city_name: name of the city(str)
+        Return:
+            :return: weather infomation(dict)
+            please refer to OpenWeather API document
+        """
+        return await self.get_json(self.ow_url_forecast + '&q=' + city_name)
+
+    ## HeFeng API ##
+
+    async def get_hf_location(self, location: str) -> dict:
+        """
+        Get location information of the city
+        Parameters:
+            :param location: name of the city(str)
+        Return:
+            :return: the first location found {'id', 'lat', 'lon', ...}(dict), None if not found
+        """
+        data = await self.fetch('location', location, self.hf_url_location + '&location=' + location)
+        # check if the request is successful, if not return None
+        if data['code'] != '200':
+            return None
+        # response is a list of location sorted by priority, return the first one
+        return data["location"][0]
+
+    async def get_hf_current(self, id: str) -> dict:
+        """
+        Get current weather infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - now: obsTime, temp, feelsLike, icon, text, wind360, windDir, windScale, windSpeed, humidity, precip, pressure, vis, cloud, dew
+            - refer: sources, license
+        """
+        return await self.fetch('now', id, self.hf_url_current + '&location=' + id)
+
+    async def get_hf_7days(self, id: str) -> dict:
+        """
+        Get 7 days weather infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - daily: fxDate, sunrise, sunset, moonrise, moonset, moonPhase, tempMax, tempMin, iconDay, textDay, iconNight, textNight, wind360Day, windDirDay, windScaleDay, windSpeedDay, wind360Night, windDirNight, windScaleNight, windSpeedNight, humidity, precip, pressure, vis, cloud, uvIndex
+            - refer: sources, license
+        """
+        return await self.fetch('7d', id, self.hf_url_7days + '&location=' + id)
+
+    async def get_hf_24hours(self, id: str) -> dict:
+        """
+        Get 24 hours weather infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - hourly: fxTime, temp, icon, text, wind360, windDir, windScale, windSpeed, humidity, precip, pressure, cloud, dew
+            - refer: sources, license
+        """
+        return await self.fetch('24h', id, self.hf_url_24hours + '&location=' + id)
+
+    async def get_hf_rain(self, lat: str, lon: str) -> dict:
+        """
+        Get rain infomation of the city, every 5 minutes in the next 2 hours
+        Parameters:
+            :param lat: latitude of the city(str)
+            :param lon: longitude of the city(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - summary: description of the rain
+            - minutely: fxTime, precip, type
+            - refer: sources, license
+        """
+        # round to 2 decimal places after the decimal point
+        lat = str(round(float(lat), 2))
+        lon = str(round(float(lon), 2))
+        return await self.fetch('rain', lon + ',' + lat, self.hf_url_rain + '&location=' + lon + ',' + lat)
+
+    async def get_hf_warning(self, id: str) -> dict:
+        """
+        Get warning infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - warning: id, sender, pubTime, title, startTime, endTime, status, level, type, typeName, text, related, relatedName
+            - refer: sources, license
+        """
+        return await self.fetch('warning', id, self.hf_url_warning + '&location=' + id)
+
+    async def get_hf_indices(self, id: str) -> dict:
+        """
+        Get indices infomation of the city, all types of the next 3 days
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - daily: date, type, name, level, category, text
+            - refer: sources, license
+        """
+        return await self.fetch('indices', id, self.hf_url_indices + '&location=' + id + "&type=0")
+
+    async def get_hf_air(self, id: str) -> dict:
+        """
+        Get air infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - now: pubTime, aqi, level, category, primary, pm10, pm2p5, no2, so2, co, o3
+            - refer: sources, license
+        """
+        return await self.fetch('air', id, self.hf_url_air + '&location=' + id)
+
+    async def get_hf_air_forecast(self, id: str) -> dict:
+        """
+        Get air forecast infomation of the city
+        Parameters:
+            :param id: location id of the city, refer to get_hf_location(str)
+        Return:
+            :return: weather infomation(dict)
+            - code
+            - updateTime
+            - daily: fxDate, aqi, level, category, primary
+            - refer: sources, license
+        """
+        return await self.fetch('air_forecast', id, self.hf_url_air_forecast + '&location=' + id)
+
+
+## --- Test --- ##
+
+if __name__ == '__main__':
+    async def main():
+        gw = AsyncGetWeather()
+        city = await gw.get_hf_location('Beijing')
+        print(city)
+        results = await asyncio.gather(gw.get_hf_current(city['id']), gw.get_hf_7days(city['id']),
+                                       gw.get_hf_rain(city['lat'], city['lon']))
+        for data in results:
+            print(data)
+            print('###')
+        await gw.close()
+
+    asyncio.run(main())
@@ -0,0 +1,298 @@
+# BatchWeather.py
+# Description: headless batch fetcher, fetch the weather of many cities and write it as JSON Lines
+#     No Tk is imported, it runs on a server. Useful to generate regional reports of hundreds of cities
+# Usage(from the root of the project):
+#     python BatchWeather.py Beijing Shanghai                   some cities by name
+#     python BatchWeather.py --country China --state Hebei      the cities of all_city.csv in a state
+#     python BatchWeather.py --country China --sections now,7d -o report.jsonl
+#     python BatchWeather.py --country China --shards 4 -o china.jsonl    a sweep split across 4 processes
+# By Monster Kid
+
+import sys
+import json
+import time
+import queue
+import asyncio
+import argparse
+import multiprocessing
+from WeatherAssistant import WeatherAssistant
+from utils.RateLimiter import RateLimiter, SharedRateLimiter
+
+class BatchWeather(object):
+    """
+    BatchWeather: fetch the weather of many cities with a WeatherAssistant
+    - At most `concurrency` cities are fetched at once, every request goes through the rate limiter
+      of the assistant, so the whole batch shares one API quota
+    - A record is written as soon as its city is fetched, the records are in order of completion
+    Methods:
+        - select_cities: select cities of all_city.csv by country and state
+        - fetch_city: fetch a city and make its record
+        - run: fetch the cities and write the records
+        - run_async: coroutine version of run
+    """
+
+    def __init__(self, weather_assistant: WeatherAssistant, concurrency: int = 8, sections: list = None):
+        """
+        Init BatchWeather
+        Parameters:
+            :param weather_assistant: the assistant whose cache, store and rate limiter are used(WeatherAssistant)
+            :param concurrency: max number of cities fetched at once(int)
+            :param sections: sections of the weather to fetch, None means all, refer to EMPTY_WEATHER_DICT(list)
+        """
+
+        self.weather_assistant = weather_assistant
+        self.concurrency = concurrency
+        self.sections = list(WeatherAssistant.EMPTY_WEATHER_DICT) if sections is None else list(sections)
+        # counters of the last run
+        self.done = 0
+        self.good = 0
+        self.errors = 0
+
+    @staticmethod
+    def select_cities(all_cities: dict, country: str = None, state: str = None) -> list:
+        """
+        Select the cities of all_city.csv by country and state, states themselves are not selected
+        Parameters:
+            :param all_cities: all cities, refer to WeatherAssistant.load_all_cities(dict)
+            :param country: English(case insensitive) or Chinese name of the country, None means any(str)
+            :param state: English(case insensitive) or Chinese name of the state, None means any(str)
+        Return:
+            :return: English names of the cities, in the order of all_city.csv(list)
+        """
+
+        def matches(city, key, value):
+            return value is None or value.lower() == city['en'][key].lower() or value == city['zh'][key]
+
+        return [name for name, city in all_cities.items() if city['type'] == 'city'
+                and matches(city, 'CountryName', country) and matches(city, 'StateName', state)]
+
+    async def fetch_city(self, city_name: str) -> dict:
+        """
+        Fetch a city and make its record
+        Parameters:
+            :param city_name: English name of the city(str)
+        Return:
+            :return: {'city', 'state', 'country', 'time', 'failed', 'weather', 'error'}(dict)
+                - failed: sections without a good response(list)
+                - weather: the responses of the sections, None if failed without response(dict)
+                - error: the exception that stopped the fetch, e.g. a failure of the store, None if no exception(str)
+        """
+
+        error = None
+        try:
+            weather = await self.weather_assistant.fetch_weather_async(city_name, self.sections)
+        except Exception as e:
+            # the record says why, so a failure of the store is not mistaken for missing weather
+            weather = dict.fromkeys(self.sections)
+            error = '{}: {}'.format(type(e).__name__, e)
+            self.errors += 1
+        city = self.weather_assistant.all_cities.get(city_name, {}).get('en', {})
+        return {
+            'city': city_name,
+            'state': city.get('StateName'),
+            'country': city.get('CountryName'),
+            'time': time.time(),
+            'failed': [section for section in self.sections if not WeatherAssistant.is_good(weather[section])],
+            'weather': weather,
+            'error': error,
+        }
+
+    async def run_async(self, city_names: list, write):
+        """
+        Coroutine version of run, must run in the event loop of the assistant
+        """
+
+        self.done, self.good, self.errors = 0, 0, 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(city_name):
+            async with semaphore:
+                record = await self.fetch_city(city_name)
+            self.done += 1
+            self.good += not record['failed']
+            write(record)
+
+        await asyncio.gather(*[worker(city_name) for city_name in city_names])
+
+    def run(self, city_names: list, write):
+        """
+        Fetch the cities and write the records
+        Parameters:
+            :param city_names: English names of the cities(list)
+            :param write: function(record), called in the event loop for each city as soon as it's fetched
+        Return:
+            :return: {'cities', 'good', 'errors', 'seconds'}(dict), errors: records with an error
+        """
+        start = time.perf_counter()
+        self.weather_assistant.run(self.run_async(city_names, write))
+        return {'cities': self.done, 'good': self.good, 'errors': self.errors, 'seconds': time.perf_counter() - start}
+
+
+def json_lines_writer(file):
+    """
+    Make a write function for BatchWeather.run, each record is a line of json, flushed at once
+    """
+    def write(record):
+        file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        file.flush()
+    return write
+
+
+def shard_worker(shard: int, city_names: list, options: dict, rate_limiter: SharedRateLimiter, messages):
+    """
+    Process of a shard: fetch its cities with its own WeatherAssistant, and send the records to the parent
+    The shards share data/weather.db, ResponseStore opens it in WAL mode with a busy timeout
+    Messages: ('record', shard, json line, good, error) for each city, then ('done', shard, stats)
+    """
+
+    weather_assistant = WeatherAssistant(options['language'], do_not_update=True, base_url=options['base_url'])
+    weather_assistant.get_weather.rate_limiter = rate_limiter
+    try:
+        batch = BatchWeather(weather_assistant, options['concurrency'], options['sections'])
+        # the records are serialized in the shard, the parent only writes the lines
+        stats = batch.run(city_names, lambda record: messages.put(
+            ('record', shard, json.dumps(record, ensure_ascii=False), not record['failed'],
+             record['error'] is not None)))
+    except Exception as e:
+        stats = {'error': repr(e)}
+    finally:
+        weather_assistant.close()
+    messages.put(('done', shard, stats))
+
+
+def run_shards(city_names: list, shards: int, options: dict, rate_limiter: SharedRateLimiter, output,
+               progress_interval: float = 5) -> list:
+    """
+    Fetch the cities in `shards` processes, and merge the records into one JSON Lines output
+    The cities are dealt round-robin, so every shard gets cities of every region.
+    All the processes share one rate limiter, so the whole sweep respects one rate and one daily budget.
+    The progress and the throughput of each shard are printed to stderr every `progress_interval` seconds
+    Parameters:
+        :param city_names: English names of the cities(list)
+        :param shards: number of processes(int)
+        :param options: {'language', 'base_url', 'concurrency', 'sections'}, options of the shards(dict)
+        :param rate_limiter: the limiter shared by the shards(SharedRateLimiter)
+        :param output: file the lines are written to
+    Return:
+        :return: stats of each shard [{'shard', 'cities', 'done', 'good', 'errors', 'seconds', 'rate', 'error'}](list)
+    """
+
+    messages = multiprocessing.Queue()
+    parts = [city_names[shard::shards] for shard in range(shards)]
+    processes = [multiprocessing.Process(target=shard_worker, args=(shard, part, options, rate_limiter, messages),
+                                         name='shard-{}'.format(shard), daemon=True)
+                 for shard, part in enumerate(parts)]
+    stats = [{'shard': shard, 'cities': len(part), 'done': 0, 'good': 0, 'errors': 0, 'seconds': None,
+              'rate': None, 'error': None} for shard, part in enumerate(parts)]
+    start = time.perf_counter()
+    for process in processes:
+        process.start()
+
+    def report():
+        for shard_stats in stats:
+            seconds = shard_stats['seconds'] or time.perf_counter() - start
+            shard_stats['rate'] = shard_stats['done'] / seconds if seconds else 0
+            print('shard {shard}: {done}/{cities} cities, {good} complete, {errors} errors, {rate:.1f} cities/s'.format(
+                **shard_stats),
+                  file=sys.stderr)
+
+    running = set(range(shards))
+    last_report = start
+    while running:
+        try:
+            message = messages.get(timeout=1)
+        except queue.Empty:
+            # a shard that crashed never sends 'done'
+            for shard in [shard for shard in running if not processes[shard].is_alive()]:
+                stats[shard]['error'] = 'exit code {}'.format(processes[shard].exitcode)
+                stats[shard]['seconds'] = time.perf_counter() - start
+                running.discard(shard)
+            message = None
+        if message is not None and message[0] == 'record':
+            _, shard, line, good, error = message
+            output.write(line + '\n')
+            stats[shard]['done'] += 1
+            stats[shard]['good'] += good
+            stats[shard]['errors'] += error
+        elif message is not None and message[0] == 'done':
+            _, shard, shard_stats = message
+            stats[shard]['seconds'] = time.perf_counter() - start
+            stats[shard]['error'] = shard_stats.get('error')
+            running.discard(shard)
+        if time.perf_counter() - last_report >= progress_interval:
+            last_report = time.perf_counter()
+            output.flush()
+            report()
+
+    output.flush()
+    for process in processes:
+        process.join()
+    report()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Fetch the weather of many cities and write it as JSON Lines')
+    parser.add_argument('cities', nargs='*', help='English names of the cities')
+    parser.add_argument('--country', default=None, help='select the cities of a country in all_city.csv')
+    parser.add_argument('--state', default=None, help='select the cities of a state in all_city.csv')
+    parser.add_argument('--limit', type=int, default=0, help='at most this many cities, 0 means all')
+    parser.add_argument('--sections', default=None,
+                        help='comma separated sections, e.g. now,7d. Default: ' + ','.join(WeatherAssistant.EMPTY_WEATHER_DICT))
+    parser.add_argument('--concurrency', type=int, default=8, help='max cities fetched at once')
+    parser.add_argument('--rate', type=float, default=5, help='max requests per second of the whole batch')
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--daily-budget', type=int, default=1000, help='max requests per day, 0 means unlimited')
+    parser.add_argument('--language', default='en', help='language of the weather, en or zh')
+    parser.add_argument('--base-url', default=None, help='scheme and host of the API, e.g. a MockQWeather server')
+    parser.add_argument('--shards', type=int, default=1,
+                        help='number of processes, more than 1 splits the cities across processes')
+    parser.add_argument('-o', '--output', default=None, help='output file, default: standard output')
+    args = parser.parse_args()
+
+    sections = None if args.sections is None else args.sections.split(',')
+    if sections is not None and set(sections) - set(WeatherAssistant.EMPTY_WEATHER_DICT):
+        parser.error('unknown sections: ' + ','.join(set(sections) - set(WeatherAssistant.EMPTY_WEATHER_DICT)))
+
+    weather_assistant = WeatherAssistant(args.language, do_not_update=True, base_url=args.base_url)
+    weather_assistant.get_weather.rate_limiter = RateLimiter(args.rate, args.burst, args.daily_budget)
+    city_names = list(args.cities)
+    if args.country is not None or args.state is not None:
+        city_names += BatchWeather.select_cities(weather_assistant.all_cities, args.country, args.state)
+    if args.limit:
+        city_names = city_names[:args.limit]
+    if not city_names:
+        weather_assistant.close()
+        parser.error('no city, give names or --country/--state')
+
+    output = sys.stdout if args.output is None else open(args.output, 'w', encoding='utf-8')
+    if args.shards > 1:
+        # the shards have their own assistants, the loop thread of this one must not be forked
+        weather_assistant.close()
+        options = {'language': args.language, 'base_url': args.base_url, 'concurrency': args.concurrency,
+                   'sections': sections}
+        rate_limiter = SharedRateLimiter(args.rate, args.burst, args.daily_budget)
+        start = time.perf_counter()
+        try:
+            stats = run_shards(city_names, args.shards, options, rate_limiter, output)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        print('{} cities, {} complete, {} errors, {:.1f} s'.format(sum(shard['done'] for shard in stats),
+                                                                    sum(shard['good'] for shard in stats),
+                                                                    sum(shard['errors'] for shard in stats),
+                                                                    time.perf_counter() - start), file=sys.stderr)
+        return
+
+    try:
+        batch = BatchWeather(weather_assistant, args.concurrency, sections)
+        stats = batch.run(city_names, json_lines_writer(output))
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        weather_assistant.close()
+    print('{cities} cities, {good} complete, {errors} errors, {seconds:.1f} s'.format(**stats), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
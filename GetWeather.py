@@ -2,11 +2,20 @@
 # Get Weather class. Get weather infomation from OpenWeather API
 # By Monster Kid
 
+import time
+import threading
 import requests
-
-class GetWeather(object):
+from requests.adapters import HTTPAdapter
+from HeFengClient import HeFengClient
+from utils.SingleFlight import SingleFlight
+from utils.RateLimiter import RateLimiter
+from utils.Metrics import MetricsRegistry
+from utils.Tracer import Tracer
+
+class GetWeather(HeFengClient):
     """
-    GetWeather class to get weather infomation
+    GetWeather class to get weather infomation, the requests are made with requests
+    URLs, language, cache and rate limiter are shared with AsyncGetWeather, refer to HeFengClient
     Methods:
         - get_ow_current: get current weather infomation from OpenWeather API
         - get_ow_forecast: get forecast weather infomation from OpenWeather API
@@ -19,73 +28,121 @@ class GetWeather(object):
         - get_hf_indices: get indices infomation from HeFeng API
         - get_hf_air: get air infomation from HeFeng API
         - get_hf_air_forecast: get air forecast infomation from HeFeng API
+        - get_json: GET request through the pooled session, return decoded json
+        - fetch: get a HeFeng response from the cache, or request it and cache it
+        - close: close the pooled session
     """
 
-    # OpenWeather API URL
-    OW_URL_CURRENT = 'http://api.openweathermap.org/data/2.5/weather?'
-    OW_URL_FORECAST = 'http://api.openweathermap.org/data/2.5/forecast?'
-    # OpenWeather developer key
-    OW_KEY = '5054a579440524d0c6cd3a2ea339d3a7'
-    # HeFeng API URL
-    HF_URL_LOCATION = 'https://geoapi.qweather.com/v2/city/lookup?'
-    HF_URL_CURRENT = 'https://devapi.qweather.com/v7/weather/now?'
-    HF_URL_7DAYS = 'https://devapi.qweather.com/v7/weather/7d?'
-    HF_URL_24HOURS = 'https://devapi.qweather.com/v7/weather/24h?'
-    HF_URL_RAIN = 'https://devapi.qweather.com/v7/minutely/5m?'
-    HF_URL_WARNING = 'https://devapi.qweather.com/v7/warning/now?'
-    HF_URL_INDICES = 'https://devapi.qweather.com/v7/indices/3d?'
-    HF_URL_AIR = 'https://devapi.qweather.com/v7/air/now?'
-    HF_URL_AIR_FORECAST = 'https://devapi.qweather.com/v7/air/5d?'
-    # HeFeng developer key
-    HF_KEY = '55c7da0804024e868a70beb00fcd8c03'
-
-    def __init__(self, language: str = 'en'):
+    def __init__(self, language: str = 'en', pool_size: int = HeFengClient.POOL_SIZE,
+                 timeout: tuple = HeFengClient.TIMEOUT, cache_ttl: dict = None, cache_size: int = HeFengClient.CACHE_SIZE,
+                 rate_limiter: RateLimiter = None, deadlines: dict = None, base_url: str = None,
+                 metrics: MetricsRegistry = None, tracer: Tracer = None):
         """
         Init GetWeather class
+        Parameters: refer to HeFengClient
+        """
+
+        super().__init__(language, pool_size, timeout, cache_ttl, cache_size, rate_limiter, deadlines, base_url,
+                         metrics, tracer)
+        # Concurrent requests of the same (endpoint, location, language) share one call
+        self.flights = SingleFlight()
+        # Pooled HTTP session, created on first request
+        # All the requests share the same session, so TCP and TLS handshakes are done only once per connection
+        self.session = None
+        self.session_lock = threading.Lock()
+
+    ## --- Session --- ##
+
+    def get_session(self) -> requests.Session:
+        """
+        Get the pooled session, create it if it does not exist
+        Return:
+            :return: the shared session(requests.Session)
+        """
+
+        # double-checked locking, the session is shared by all the threads
+        if self.session is None:
+            with self.session_lock:
+                if self.session is None:
+                    session = requests.Session()
+                    # keep pool_size connections alive for each host(geoapi, devapi and openweathermap)
+                    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, pool_block=False)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    # HeFeng API always compresses the response, ask for gzip explicitly
+                    session.headers.update({'Accept-Encoding': 'gzip, deflate'})
+                    self.session = session
+        return self.session
+
+    def get_json(self, url: str, timeout: tuple = None, endpoint: str = None) -> dict:
+        """
+        GET request through the pooled session
         Parameters:
-            :param language: language(str)
-        """
-
-        # OpenWeather API URL(deprecated)
-        self.ow_url_current = self.OW_URL_CURRENT + 'appid=' + self.OW_KEY
-        self.ow_url_forecast = self.OW_URL_FORECAST + 'appid=' + self.OW_KEY
-
-        # Concatenate URL with developer key(actually redundant, because set_hf_language will concatenate URL again)
-        self.hf_language = language
-        self.hf_url_location = self.HF_URL_LOCATION + 'key=' + self.HF_KEY
-        self.hf_url_current = self.HF_URL_CURRENT + 'key=' + self.HF_KEY
-        self.hf_url_7days = self.HF_URL_7DAYS + 'key=' + self.HF_KEY
-        self.hf_url_24hours = self.HF_URL_24HOURS + 'key=' + self.HF_KEY
-        self.hf_url_rain = self.HF_URL_RAIN + 'key=' + self.HF_KEY
-        self.hf_url_warning = self.HF_URL_WARNING + 'key=' + self.HF_KEY
-        self.hf_url_indices = self.HF_URL_INDICES + 'key=' + self.HF_KEY
-        self.hf_url_air = self.HF_URL_AIR + 'key=' + self.HF_KEY
-        self.hf_url_air_forecast = self.HF_URL_AIR_FORECAST + 'key=' + self.HF_KEY
-        # set language
-        self.set_hf_language(language)
-    
-    ## --- Set language --- ##
+            :param url: request url(str)
+            :param timeout: timeout of this request, default is self.timeout(tuple)
+            :param endpoint: name of the endpoint, to record the metrics of the response(str)
+        Return:
+            :return: decoded response(dict)
+        """
+
+        response = self.get_session().get(url, timeout=timeout or self.timeout)
+        return self.decode_json(response.content, endpoint)
+
+    def close(self):
+        """
+        Close the pooled session
+        """
+        with self.session_lock:
+            if self.session is not None:
+                self.session.close()
+                self.session = None
 
-    def set_hf_language(self, language: str):
+    def fetch(self, endpoint: str, location: str, url: str) -> dict:
         """
-        Set language of HeFeng API, change URL accordingly
+        Get a HeFeng response from the cache, or request it and cache it
+        Only successful responses are cached. Concurrent requests of the same key share one call
+        Requests are rate limited. If the limiter blocks a request, {'code': '429' or '402'} is returned
+        NOTE: the synchronous path has no total deadline and no hedging(refer to AsyncGetWeather.get_json_hedged).
+        The deadline of the endpoint is only the read timeout, which applies to each socket read.
+        If a request times out, fails to connect or answers invalid json, {'code': '500'} is returned,
+        the same code as a missed deadline of the asynchronous path
         Parameters:
-            :param language: language(str)
-        """
-        # check language
-        if language not in ['zh', 'en']:
-            raise ValueError('Language must be "zh" or "en"')
-        # set language
-        self.hf_language = language
-        # concatenate URL with language
-        self.hf_url_current = self.HF_URL_CURRENT + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_7days = self.HF_URL_7DAYS + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_24hours = self.HF_URL_24HOURS + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_rain = self.HF_URL_RAIN + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_warning = self.HF_URL_WARNING + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_indices = self.HF_URL_INDICES + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_air = self.HF_URL_AIR + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
-        self.hf_url_air_forecast = self.HF_URL_AIR_FORECAST + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+            :param endpoint: name of the endpoint, key of HF_TTL(str)
+            :param location: location of the request(str)
+            :param url: request url(str)
+        Return:
+            :return: decoded response(dict)
+        """
+
+        key = (endpoint, location, self.hf_language)
+
+        def request():
+            code, delay = self.rate_limiter.reserve()
+            if code is not None:
+                self.metrics.inc('rate_limited', endpoint=endpoint, code=code)
+                return {'code': code}
+            time.sleep(delay)
+            # requests has no total deadline, the deadline is the read timeout
+            start = time.monotonic()
+            try:
+                data = self.get_json(url, timeout=(self.timeout[0], self.get_deadline(endpoint)), endpoint=endpoint)
+            except (requests.RequestException, ValueError) as e:
+                # timeout, connection error or invalid json(JSONDecodeError is a ValueError)
+                self.metrics.inc('responses', endpoint=endpoint, code=self.CODE_TIMEOUT)
+                return {'code': self.CODE_TIMEOUT}
+            self.latency.record(endpoint, time.monotonic() - start)
+            self.metrics.observe('request_latency', time.monotonic() - start, endpoint=endpoint)
+            self.metrics.inc('responses', endpoint=endpoint, code=data.get('code'))
+            self.rate_limiter.report(data.get('code'))
+            if data.get('code') == '200':
+                self.cache.put(key, data)
+            return data
+
+        data = self.cache.get(key)
+        self.metrics.inc('cache', endpoint=endpoint, result='miss' if data is None else 'hit')
+        if data is None:
+            data = self.flights.do(key, request)
+        return data
 
     ## --- GET request --- ##
 
@@ -103,10 +160,8 @@ class GetWeather(object):
 
         # create request url
         url = self.ow_url_current + '&q=' + city_name
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response
+        data = self.get_json(url)
 
         return data 
 
@@ -122,10 +177,8 @@ class GetWeather(object):
 
         # create request url
         url = self.ow_url_forecast + '&q=' + city_name
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response
+        data = self.get_json(url)
 
         return data
 
@@ -137,15 +190,13 @@ class GetWeather(object):
         Parameters:
             :param location: name of the city(str)
         Return:
-            :return: id of the city(str)
+            :return: the first location found {'id', 'lat', 'lon', ...}(dict), None if not found
         """
 
         # create request url
         url = self.hf_url_location + '&location=' + location
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('location', location, url)
         # check if the request is successful, if not return None
         if data['code'] != '200':
             return None
@@ -168,10 +219,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_current + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('now', id, url)
 
         return data
 
@@ -190,10 +239,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_7days + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('7d', id, url)
 
         return data
     
@@ -212,10 +259,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_24hours + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('24h', id, url)
 
         return data
 
@@ -238,10 +283,8 @@ class GetWeather(object):
         lat = str(round(float(lat), 2))
         lon = str(round(float(lon), 2))
         url = self.hf_url_rain + '&location=' + lon + ',' + lat
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('rain', lon + ',' + lat, url)
 
         return data
 
@@ -260,10 +303,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_warning + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('warning', id, url)
 
         return data
 
@@ -282,10 +323,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_indices + '&location=' + id + "&type=0"
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('indices', id, url)
 
         return data
 
@@ -304,10 +343,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_air + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('air', id, url)
 
         return data
 
@@ -326,10 +363,8 @@ class GetWeather(object):
 
         # create request url
         url = self.hf_url_air_forecast + '&location=' + id
-        # GET request
-        response = requests.get(url)
-        # decode the response
-        data = response.json()
+        # GET request and decode the response(or read it from the cache)
+        data = self.fetch('air_forecast', id, url)
 
         return data
 
@@ -337,24 +372,23 @@ class GetWeather(object):
 ## --- Test --- ##
 
 if __name__ == '__main__':
+    # HeFeng API only, OpenWeather API is deprecated
+    # Set QWEATHER_BASE_URL to run it against utils/MockQWeather.py
     gw = GetWeather()
-    data1 = gw.get_ow_current('Sydney')
-    data2 = gw.get_ow_forecast('Sydney')
-    print(data1)
-    print(data2)
-    print('----------------------------------------')
-    print()
-    city = 'Beijing'
-    id = gw.get_hf_location(city)
-    data_current = gw.get_hf_current(city)
-    data_7days = gw.get_hf_7days(city)
-    data_24hours = gw.get_hf_24hours(city)
-    data_rain = gw.get_hf_rain(city)
-    data_warning = gw.get_hf_warning(city)
-    data_indices = gw.get_hf_indices(city)
-    data_air = gw.get_hf_air(city)
-    data_air_forecast = gw.get_hf_air_forecast(city)
-    print(id)
+    city = gw.get_hf_location('Beijing')
+    if city is None:
+        print('Beijing is not found')
+        raise SystemExit(1)
+    id = city['id']
+    data_current = gw.get_hf_current(id)
+    data_7days = gw.get_hf_7days(id)
+    data_24hours = gw.get_hf_24hours(id)
+    data_rain = gw.get_hf_rain(city['lat'], city['lon'])
+    data_warning = gw.get_hf_warning(id)
+    data_indices = gw.get_hf_indices(id)
+    data_air = gw.get_hf_air(id)
+    data_air_forecast = gw.get_hf_air_forecast(id)
+    print(city)
     print('###')
     print(data_current)
     print('###')
@@ -373,4 +407,4 @@ if __name__ == '__main__':
     print(data_air_forecast)
     print('----------------------------------------')
     print()
-
+    gw.close()
@@ -0,0 +1,193 @@
+# HeFengClient.py
+# Description: what GetWeather and AsyncGetWeather share: the URLs, the language, the response cache,
+#     the rate limiter, the deadlines and the metrics. The requests themselves are made by the two clients
+# By Monster Kid
+
+import os
+import json
+from utils.ResponseCache import ResponseCache
+from utils.RateLimiter import RateLimiter
+from utils.LatencyTracker import LatencyTracker
+from utils.Metrics import MetricsRegistry
+from utils.Tracer import Tracer
+
+class HeFengClient(object):
+    """
+    HeFengClient: base of GetWeather(requests) and AsyncGetWeather(aiohttp), it makes no request itself
+    Methods:
+        - get_hf_url: get the URL of a HeFeng API on the configured base URL
+        - set_hf_language: set language of HeFeng API, change URL accordingly
+        - decode_json: decode a json response and record its metrics
+        - get_deadline: get the deadline of an endpoint
+    """
+
+    # OpenWeather API URL
+    OW_URL_CURRENT = 'http://api.openweathermap.org/data/2.5/weather?'
+    OW_URL_FORECAST = 'http://api.openweathermap.org/data/2.5/forecast?'
+    # OpenWeather developer key
+    OW_KEY = '5054a579440524d0c6cd3a2ea339d3a7'
+    # HeFeng API URL
+    HF_URL_LOCATION = 'https://geoapi.qweather.com/v2/city/lookup?'
+    HF_URL_CURRENT = 'https://devapi.qweather.com/v7/weather/now?'
+    HF_URL_7DAYS = 'https://devapi.qweather.com/v7/weather/7d?'
+    HF_URL_24HOURS = 'https://devapi.qweather.com/v7/weather/24h?'
+    HF_URL_RAIN = 'https://devapi.qweather.com/v7/minutely/5m?'
+    HF_URL_WARNING = 'https://devapi.qweather.com/v7/warning/now?'
+    HF_URL_INDICES = 'https://devapi.qweather.com/v7/indices/3d?'
+    HF_URL_AIR = 'https://devapi.qweather.com/v7/air/now?'
+    HF_URL_AIR_FORECAST = 'https://devapi.qweather.com/v7/air/5d?'
+    # HeFeng developer key
+    HF_KEY = '55c7da0804024e868a70beb00fcd8c03'
+    # Environment variable of the HeFeng base URL, e.g. http://127.0.0.1:8765 for utils/MockQWeather.py
+    HF_BASE_URL_ENV = 'QWEATHER_BASE_URL'
+
+    # Connection pool size. WeatherAssistant.update_weather fans out 8 requests at once,
+    # so 8 keep-alive connections per host are enough to never open a new one
+    POOL_SIZE = 8
+    # Default timeout of every request: (connect timeout, read timeout) in seconds
+    TIMEOUT = (3.05, 10)
+
+    # Time to live of the cached responses of each endpoint, in seconds
+    # HeFeng updates the data at very different rates, refer to HeFeng API document
+    HF_TTL = {
+        'location': 24 * 3600,  # location of a city never changes
+        'now': 5 * 60,          # updated every 10-20 minutes
+        '7d': 2 * 3600,         # updated a few times a day
+        '24h': 30 * 60,         # updated every hour
+        'rain': 5 * 60,         # updated every 5 minutes
+        'warning': 5 * 60,      # warnings must be up to date
+        'indices': 2 * 3600,    # updated a few times a day
+        'air': 30 * 60,         # updated every hour
+        'air_forecast': 6 * 3600,  # updated once a day
+    }
+    # Max number of cached responses. 9 endpoints per city, so about 28 cities
+    CACHE_SIZE = 256
+    # Deadline of the requests of each endpoint, in seconds. One stuck request never blocks the others
+    HF_DEADLINE = {
+        'location': 5,
+        'now': 5,
+        '7d': 8,
+        '24h': 8,
+        'rain': 5,
+        'warning': 5,
+        'indices': 8,
+        'air': 8,
+        'air_forecast': 8,
+    }
+    # Code returned when a request misses its deadline(HeFeng uses 500 for timeout)
+    CODE_TIMEOUT = '500'
+
+    def __init__(self, language: str = 'en', pool_size: int = POOL_SIZE, timeout: tuple = TIMEOUT,
+                 cache_ttl: dict = None, cache_size: int = CACHE_SIZE, rate_limiter: RateLimiter = None,
+                 deadlines: dict = None, base_url: str = None, metrics: MetricsRegistry = None,
+                 tracer: Tracer = None):
+        """
+        Init HeFengClient
+        Parameters:
+            :param language: language(str)
+            :param pool_size: max number of keep-alive connections per host(int)
+            :param timeout: default timeout of each request, (connect, read) in seconds(tuple)
+            :param cache_ttl: TTL of each endpoint in seconds, default is HF_TTL(dict)
+            :param cache_size: max number of cached responses, 0 disables the cache(int)
+            :param rate_limiter: rate limiter of HeFeng requests, can be shared by many objects.
+                Default is a new RateLimiter(RateLimiter)
+            :param deadlines: deadline of each endpoint in seconds, default is HF_DEADLINE(dict)
+            :param base_url: scheme and host of all the HeFeng APIs, e.g. http://127.0.0.1:8765(str).
+                Default is the HF_BASE_URL_ENV environment variable, or the real HeFeng hosts if it's not set
+            :param metrics: registry of the request metrics, can be shared. Default is a new MetricsRegistry
+            :param tracer: tracer of the requests, can be shared. Default is a new disabled Tracer
+        """
+
+        # Rate limiter, it also backs off when the API answers 429 or 402
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        # Response cache, key is (endpoint, location, language)
+        ttl = dict(self.HF_TTL)
+        ttl.update(cache_ttl or {})
+        self.cache = ResponseCache(ttl, max_size=cache_size)
+        # Deadlines and recent latencies of each endpoint
+        self.deadlines = dict(self.HF_DEADLINE)
+        self.deadlines.update(deadlines or {})
+        self.latency = LatencyTracker()
+        # Request metrics: latency, codes, cache hits, bytes and decode time of each endpoint
+        self.metrics = metrics if metrics is not None else MetricsRegistry()
+        self.tracer = tracer if tracer is not None else Tracer()
+
+        # Settings of the pooled session of the subclass
+        self.pool_size = pool_size
+        self.timeout = timeout
+
+        # OpenWeather API URL(deprecated)
+        self.ow_url_current = self.OW_URL_CURRENT + 'appid=' + self.OW_KEY
+        self.ow_url_forecast = self.OW_URL_FORECAST + 'appid=' + self.OW_KEY
+
+        # Concatenate URL with developer key(actually redundant, because set_hf_language will concatenate URL again)
+        self.hf_base_url = base_url if base_url is not None else os.environ.get(self.HF_BASE_URL_ENV)
+        self.hf_language = language
+        self.hf_url_location = self.get_hf_url(self.HF_URL_LOCATION) + 'key=' + self.HF_KEY
+        self.hf_url_current = self.get_hf_url(self.HF_URL_CURRENT) + 'key=' + self.HF_KEY
+        self.hf_url_7days = self.get_hf_url(self.HF_URL_7DAYS) + 'key=' + self.HF_KEY
+        self.hf_url_24hours = self.get_hf_url(self.HF_URL_24HOURS) + 'key=' + self.HF_KEY
+        self.hf_url_rain = self.get_hf_url(self.HF_URL_RAIN) + 'key=' + self.HF_KEY
+        self.hf_url_warning = self.get_hf_url(self.HF_URL_WARNING) + 'key=' + self.HF_KEY
+        self.hf_url_indices = self.get_hf_url(self.HF_URL_INDICES) + 'key=' + self.HF_KEY
+        self.hf_url_air = self.get_hf_url(self.HF_URL_AIR) + 'key=' + self.HF_KEY
+        self.hf_url_air_forecast = self.get_hf_url(self.HF_URL_AIR_FORECAST) + 'key=' + self.HF_KEY
+        # set language
+        self.set_hf_language(language)
+    
+    ## --- URL --- ##
+
+    def get_hf_url(self, url: str) -> str:
+        """
+        Get the URL of a HeFeng API, on hf_base_url if it's set
+        Parameters:
+            :param url: one of the HF_URL_* constants(str)
+        Return:
+            :return: the URL(str)
+        """
+        if not self.hf_base_url:
+            return url
+        # replace the scheme and host, keep the path and the query
+        return self.hf_base_url.rstrip('/') + url[url.index('/', url.index('//') + 2):]
+
+    ## --- Set language --- ##
+
+    def set_hf_language(self, language: str):
+        """
+        Set language of HeFeng API, change URL accordingly
+        Parameters:
+            :param language: language(str)
+        """
+        # check language
+        if language not in ['zh', 'en']:
+            raise ValueError('Language must be "zh" or "en"')
+        # set language
+        self.hf_language = language
+        # concatenate URL with language
+        self.hf_url_current = self.get_hf_url(self.HF_URL_CURRENT) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_7days = self.get_hf_url(self.HF_URL_7DAYS) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_24hours = self.get_hf_url(self.HF_URL_24HOURS) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_rain = self.get_hf_url(self.HF_URL_RAIN) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_warning = self.get_hf_url(self.HF_URL_WARNING) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_indices = self.get_hf_url(self.HF_URL_INDICES) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_air = self.get_hf_url(self.HF_URL_AIR) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+        self.hf_url_air_forecast = self.get_hf_url(self.HF_URL_AIR_FORECAST) + 'key=' + self.HF_KEY + '&lang=' + self.hf_language
+
+    ## --- Response --- ##
+
+    def decode_json(self, body: bytes, endpoint: str = None) -> dict:
+        """
+        Decode a json response, record its size and decode time if the endpoint is given
+        """
+        if endpoint is None:
+            return json.loads(body)
+        with self.metrics.timer('json_decode', endpoint=endpoint), self.tracer.span('json_decode', endpoint=endpoint):
+            data = json.loads(body)
+        self.metrics.inc('bytes_received', len(body), endpoint=endpoint)
+        return data
+
+    def get_deadline(self, endpoint: str) -> float:
+        """
+        Get the deadline of an endpoint in seconds, default is the read timeout
+        """
+        return self.deadlines.get(endpoint, self.timeout[1])
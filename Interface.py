@@ -7,7 +7,6 @@ import tkinter as tk
 import tkinter.ttk as ttk
 import os
 import json
-import time
 import threading
 import warnings
 from tkinter import messagebox
@@ -15,7 +14,8 @@ from WeatherAssistant import WeatherAssistant
 from utils.predict_city import predict_city
 from utils.SerialPages import *
 from assets.multi_lang_dict import *
-from utils.TimerThread import TimerThread
+from utils.RefreshScheduler import RefreshScheduler
+from utils.BackgroundRefresher import BackgroundRefresher
 
 ##########################################################################
 # """
@@ -65,6 +65,7 @@ class Interface(object):
         city_listbox_selected(self, event)
         city_listbox_unselected(self, event)
         city_listbox_click(self, event)
+        on_closing(self)
         --- Functions and Utilities ---
         save_settings(self)             save the settings to the settings file
         load_settings(self)             load the settings from the settings file
@@ -73,6 +74,9 @@ class Interface(object):
         remove_city(self)               remove the current city from the city list
         shift_city(self)                shift the selected city to the current city
         update_weather(self)            update the weather infomation
+        on_city_refreshed(self, city)   display the weather refreshed by the background refresher
+        dump_metrics(self)              dump the metrics to a json file
+        toggle_trace(self)              start tracing, or stop and save the trace
         handle_code(self, dict)         handle the error code returned by the API
         --- UI Updating Functions ---
         update_ui(self)                     update all the UI elements
@@ -81,6 +85,9 @@ class Interface(object):
         update_weather_serial(self)         update the weather serial display
         undate_chart_serial(self)           update the chart serial display
         update_city_listbox(self, *args)    update the city listbox
+        on_search_text_changed(self, *args) update the predictions when the text of the searchbox changes
+        schedule_prefetch(self)             prefetch the top predictions when the user stops typing
+        prefetch_predictions(self)          prefetch the weather of the top predictions
         clear_all_labels(self)              clear all the labels on the right side
         --- Settings Functions ---
         change_language(self, language)         change the language of the program
@@ -95,6 +102,21 @@ class Interface(object):
         "language": "English",
         "update_interval": 300, 
     }
+    # Prefetch the top predictions when the user stops typing for this long, in milliseconds
+    PREFETCH_DELAY = 400
+    # Number of predictions to prefetch
+    PREFETCH_CANDIDATES = 2
+    # Parts of the UI that display each section of the weather, only these are redrawn when the section changes
+    SECTION_PARTS = {
+        "now": ["labels", "now_weather", "wind"],
+        "7d": ["labels", "sun_moon", "chart_7d"],
+        "24h": ["chart_24h"],
+        "rain": ["chart_rain"],
+        "warning": ["warnings"],
+        "indices": ["index"],
+        "air": ["air"],
+        "air_forecast": [],
+    }
 
     def __init__(self, master):
 
@@ -102,13 +124,25 @@ class Interface(object):
         self.settings = self.load_settings()
 
         ## ----- Controller ----- ##
-        self.weather_assistant = WeatherAssistant(language=language_alias_dict[self.settings["language"]])
+        # Do not wait for the network, the last good weather is displayed first and updated in background
+        self.weather_assistant = WeatherAssistant(language=language_alias_dict[self.settings["language"]], do_not_update=True)
+        # Parts of the UI to redraw, everything is drawn at first. The weather assistant emits an event
+        # for each section that changed, it's usually in another thread so the parts are only marked here
+        self.changed_parts = set(part for parts in self.SECTION_PARTS.values() for part in parts)
+        self.changed_lock = threading.Lock()
+        self.weather_assistant.events.subscribe("section_changed", self.on_section_changed)
 
         ## ----- Threads ----- ##
         # Thread lock to control access to the weather assistant and the UI
         self.thread_lock = threading.Lock()
-        # Timer thread
-        self.timer_thread = TimerThread(self.settings["update_interval"], self.update_weather)
+        # Refresh scheduler thread: each section of the weather is refreshed on its own cadence,
+        # current weather at the update interval set by the user. It slows down when the API is rate limited
+        self.refresh_scheduler = RefreshScheduler(self.update_weather_thread, self.weather_assistant.section_update_time,
+                                                  {"now": self.settings["update_interval"]},
+                                                  self.weather_assistant.get_weather.rate_limiter.next_delay)
+        # Background refresher: keeps the weather of every city in the city list warm, current city first,
+        # so shifting city does not wait for the network
+        self.background_refresher = BackgroundRefresher(self.weather_assistant, on_refreshed=self.on_city_refreshed)
 
         ## ----- Master ----- ##
         self.master = master
@@ -119,6 +153,7 @@ class Interface(object):
         self.master.resizable(False, False)
         self.master.bind('<Button-1>', self.on_background_click)
         self.master.bind('<Return>', self.on_master_return)
+        self.master.protocol("WM_DELETE_WINDOW", self.on_closing)
         self.master.columnconfigure(0, weight=1)
         self.master.rowconfigure(0, weight=1)
         
@@ -150,7 +185,7 @@ class Interface(object):
         self.city_entry.grid(row=0, column=0, sticky=tk.N+tk.S+tk.W+tk.E)
         # City entry string variable to trace the change of the entry
         self.city_entry_var = tk.StringVar()
-        self.city_entry_var.trace_add('write', self.update_city_listbox)
+        self.city_entry_var.trace_add('write', self.on_search_text_changed)
         self.city_entry.config(textvariable=self.city_entry_var)
         self.city_entry.bind('<FocusIn>', self.searchbox_selected)
         self.city_entry.bind('<FocusOut>', self.searchbox_unselected)
@@ -164,6 +199,9 @@ class Interface(object):
         self.city_listbox.bind('<FocusOut>', self.city_listbox_unselected)
         # The prediction list
         self.prediction_list = []
+        # The pending prefetch of the predictions: id of the tk timer and the future of the prefetch
+        self.prefetch_timer = None
+        self.prefetch_future = None
 
         ## ----- Right side ----- ##
         # The right frame
@@ -196,11 +234,13 @@ class Interface(object):
         self.index_page = IndexPage(self.weather_serial, language=self.settings["language"])
         self.sun_moon_page = SunMoonPage(self.weather_serial, language=self.settings["language"])
         self.wind_page = WindPage(self.weather_serial, language=self.settings["language"])
+        self.diagnostics_page = DiagnosticsPage(self.weather_serial, language=self.settings["language"])
         self.weather_serial.add_page(self.now_weather_page)
         self.weather_serial.add_page(self.air_page)
         self.weather_serial.add_page(self.index_page)
         self.weather_serial.add_page(self.sun_moon_page)
         self.weather_serial.add_page(self.wind_page)
+        self.weather_serial.add_page(self.diagnostics_page)
         self.weather_serial.place(relx=0, rely=self.rf_ratios[0]+self.rf_ratios[1]+self.rf_ratios[2]+self.rf_ratios[3]+self.rf_ratios[4], relwidth=1, relheight=self.rf_ratios[5])
         # Chart serial display
         self.chart_serial = SerialDisplay(self.right_frame, language=self.settings["language"])
@@ -218,11 +258,29 @@ class Interface(object):
         # Finalizing the layout
         self.master.focus()
         self.master.update()
+        # Paint the last weather at once, it's revalidated in background if it's stale
+        if self.weather_assistant.current_city is not None:
+            self.weather_assistant.apply_snapshot(self.weather_assistant.read_weather(
+                self.weather_assistant.current_city, on_fresh=self.on_city_refreshed))
         self.update_ui()
-        self.timer_thread.start()
+        self.refresh_scheduler.start()
+        # Update the weather of all the cities in background, current city first
+        self.background_refresher.start()
 
     ## ----- Callback functions ----- ##
 
+    def on_closing(self):
+        """
+        When the window is closed, stop the background work before closing the connections of the weather assistant
+        """
+        self.refresh_scheduler.stop()
+        self.background_refresher.stop()
+        if self.prefetch_future is not None:
+            self.prefetch_future.cancel()
+        # the pending revalidations are cancelled and awaited by close
+        self.weather_assistant.close()
+        self.master.destroy()
+
     def on_background_click(self, event):
         """
         When click on the background, the searchbox loses focus
@@ -326,6 +384,9 @@ class Interface(object):
         self.settings_menu.add_cascade(label=text_update_interval, menu=self.update_interval_submenu, underline=0)
         # Help Menu
         self.help_menu = tk.Menu(self.menu, tearoff=False)
+        self.help_menu.add_command(label=language_dict[self.settings["language"]]["dump_metrics_command"], command=self.dump_metrics)
+        trace_command = "stop_trace_command" if self.weather_assistant.tracer.enabled else "start_trace_command"
+        self.help_menu.add_command(label=language_dict[self.settings["language"]][trace_command], command=self.toggle_trace)
         self.help_menu.add_command(label=language_dict[self.settings["language"]]["help_menu"], command=lambda: messagebox.showinfo("About us", "Weather Assistant\nBy Monster Kid\nSupport: Hefeng Weather"))
         self.menu.add_cascade(label=language_dict[self.settings["language"]]["help_menu"], menu=self.help_menu)
     
@@ -360,12 +421,18 @@ class Interface(object):
 
         # It's accessing the weather assistant and the UI, so it must acquire the lock
         self.thread_lock.acquire()
-        self.last_update_time_label.config(text=language_dict[self.settings["language"]]["updating"])
+        self.show_updating()
         # Add the city in the weather assistant
-        res = self.weather_assistant.add_city(city)
+        # the new weather is swapped in by on_city_refreshed, under the lock
+        res = self.weather_assistant.add_city(city, on_fresh=self.on_city_refreshed)
         # Message box and update the UI
         if res == "success":
             self.update_ui()
+            # no weather to display yet, it's being fetched
+            if self.weather_assistant.weather_time is None:
+                self.show_updating()
+            self.refresh_scheduler.reschedule()
+            self.background_refresher.wake()
             messagebox.showinfo(language_dict[self.settings["language"]]["success"], \
                                 language_dict[self.settings["language"]]["city_added"])
             # clear the searchbox
@@ -394,10 +461,14 @@ class Interface(object):
 
         # I don't write the comments, please refer to the add_city_thread function
         self.thread_lock.acquire()
-        self.last_update_time_label.config(text=language_dict[self.settings["language"]]["updating"])
-        res = self.weather_assistant.remove_city(self.weather_assistant.current_city)
+        self.show_updating()
+        res = self.weather_assistant.remove_city(self.weather_assistant.current_city, on_fresh=self.on_city_refreshed)
         if res == "success":
             self.update_ui()
+            if self.weather_assistant.weather_time is None and self.weather_assistant.current_city is not None:
+                self.show_updating()
+            self.refresh_scheduler.reschedule()
+            self.background_refresher.wake()
             messagebox.showinfo(language_dict[self.settings["language"]]["success"], \
                                 language_dict[self.settings["language"]]["city_removed"])
         else:
@@ -424,34 +495,136 @@ class Interface(object):
         """
 
         self.thread_lock.acquire()
-        self.last_update_time_label.config(text=language_dict[self.settings["language"]]["updating"])
-        res = self.weather_assistant.shift_city(city)
+        # the weather is read at once, if it's stale it's revalidated in background and displayed when it lands
+        res = self.weather_assistant.shift_city(city, on_fresh=self.on_city_refreshed)
         if res == "success":
             self.update_ui()
+            # no weather to display yet, it's being fetched
+            if self.weather_assistant.weather_time is None:
+                self.show_updating()
+            self.refresh_scheduler.reschedule()
+            self.background_refresher.wake()
         else:
             messagebox.showerror(language_dict[self.settings["language"]]["error"], \
                                 language_dict[self.settings["language"]][res])
         self.thread_lock.release()
     
-    def update_weather(self):
+    def update_weather(self, sections=None):
         """
         Update the weather infomation
         """
 
-        thread = threading.Thread(target=self.update_weather_thread)
+        thread = threading.Thread(target=self.update_weather_thread, args=(sections,))
         thread.start()
         
-    def update_weather_thread(self):
+    def update_weather_thread(self, sections=None):
         """
         Thread: Update the weather infomation
+        The lock is only held to swap the new weather in and redraw, not during the requests
+        :param sections: the sections of the weather to update, None means all
+        """
+
+        tracer = self.weather_assistant.tracer
+        weather_assistant = self.weather_assistant
+        try:
+            self.thread_lock.acquire()
+            try:
+                self.show_updating()
+            finally:
+                self.thread_lock.release()
+            # fetch without the lock, so adding or shifting a city doesn't wait for the network
+            try:
+                with tracer.span("update_weather", sections=str(sections)):
+                    weather_key, snapshot = weather_assistant.fetch_current_weather(sections)
+            except Exception:
+                # offline, display the last good weather
+                weather_key, snapshot = None, None
+            with tracer.span("lock_wait"):
+                self.thread_lock.acquire()
+            try:
+                if weather_key is None:
+                    weather_assistant.load_stored_weather()
+                # current city or language may have changed while fetching
+                elif weather_key == (weather_assistant.current_city, weather_assistant.language):
+                    weather_assistant.apply_snapshot(snapshot)
+                self.update_ui()
+            finally:
+                self.thread_lock.release()
+        finally:
+            # align the schedule of the updated sections to the new data, even if the update failed
+            self.refresh_scheduler.reschedule(sections)
+    
+    def on_section_changed(self, section, city):
+        """
+        Called by the weather assistant when a section of the weather of current city changed
+        Mark the parts displaying the section, they are redrawn by the next update_ui
         """
+        with self.changed_lock:
+            self.changed_parts.update(self.SECTION_PARTS.get(section, []))
 
-        self.thread_lock.acquire()
+    def mark_changed(self, *parts):
+        """
+        Mark parts of the UI to redraw, e.g. all of them after the language changed
+        """
+        if not parts:
+            parts = [part for parts in self.SECTION_PARTS.values() for part in parts]
+        with self.changed_lock:
+            self.changed_parts.update(parts)
+
+    def show_updating(self):
+        """
+        Show "updating" in the last update label, it's replaced by the next update_ui
+        """
         self.last_update_time_label.config(text=language_dict[self.settings["language"]]["updating"])
-        self.weather_assistant.update_weather()
+        self.mark_changed("labels")
+
+    def on_city_refreshed(self, city):
+        """
+        Called after a city is refreshed, by the background refresher or a revalidation of read_weather
+        If it's the current city, display the new weather
+        """
+
+        if city != self.weather_assistant.current_city:
+            return
+        thread = threading.Thread(target=self.refresh_ui_thread)
+        thread.start()
+
+    def refresh_ui_thread(self):
+        """
+        Thread: Display the refreshed weather of current city, without updating it
+        The snapshot was built in background, it's swapped in under the lock so update_ui never reads half of it
+        """
+
+        self.thread_lock.acquire()
+        self.weather_assistant.load_stored_weather()
         self.update_ui()
         self.thread_lock.release()
-    
+        self.refresh_scheduler.reschedule()
+
+    def dump_metrics(self):
+        """
+        Dump the metrics to a json file, to see where the time goes when it's slow
+        """
+        path = self.weather_assistant.dump_metrics()
+        messagebox.showinfo(language_dict[self.settings["language"]]["diagnostics_title"], \
+                            language_dict[self.settings["language"]]["metrics_dumped"].format(os.path.abspath(path)))
+
+    def toggle_trace(self):
+        """
+        Start tracing the refreshes, or stop tracing and save the trace to a Chrome trace-event file
+        """
+        tracer = self.weather_assistant.tracer
+        if not tracer.enabled:
+            tracer.start()
+        else:
+            tracer.stop()
+            path = self.weather_assistant.TRACE_FILE
+            count = tracer.export(path)
+            messagebox.showinfo(language_dict[self.settings["language"]]["diagnostics_title"], \
+                                language_dict[self.settings["language"]]["trace_saved"].format(count, os.path.abspath(path)))
+        # the command label changed
+        self.create_menu()
+
     def handle_code(self, dict: dict) -> tuple:
         """
         Handle the error code returned by the API
@@ -482,13 +655,28 @@ class Interface(object):
 
     def update_ui(self):
         """
-        Update all the UI elements
-        """
-        self.update_labels()
-        self.update_city_listbox()
-        self.update_weather_serial()
-        self.undate_chart_serial()
-        self.update_warnings()
+        Update the UI elements whose sections of the weather changed, refer to on_section_changed
+        The render time of each part is recorded, and displayed in the diagnostics page
+        """
+        metrics = self.weather_assistant.metrics
+        tracer = self.weather_assistant.tracer
+        with self.changed_lock:
+            parts, self.changed_parts = self.changed_parts, set()
+        with metrics.timer("ui_render", part="all"), tracer.span("update_ui", parts=len(parts)):
+            # the age of stored weather grows, it's displayed in the labels
+            if "labels" in parts or self.weather_assistant.weather_from_store:
+                with metrics.timer("ui_render", part="labels"), tracer.span("update_labels"):
+                    self.update_labels()
+            with metrics.timer("ui_render", part="city_listbox"), tracer.span("update_city_listbox"):
+                self.update_city_listbox()
+            with metrics.timer("ui_render", part="weather_serial"), tracer.span("update_weather_serial"):
+                self.update_weather_serial(parts)
+            with metrics.timer("ui_render", part="chart_serial"), tracer.span("undate_chart_serial"):
+                self.undate_chart_serial(parts)
+            if "warnings" in parts:
+                with metrics.timer("ui_render", part="warnings"), tracer.span("update_warnings"):
+                    self.update_warnings()
+        self.diagnostics_page.update(**self.weather_assistant.diagnostics())
 
     def update_labels(self):
         """
@@ -504,29 +692,31 @@ class Interface(object):
         self.city_name_label.config(text=self.weather_assistant.all_cities[self.weather_assistant.current_city][language_alias_dict[self.settings["language"]]]["Name"])
 
         # Update current weather
+        model = self.weather_assistant.model
         code, err = self.handle_code(self.weather_assistant.weather['now'])
-        if code != "200":
+        if code != "200" or model.now is None:
             # If error, display the error message
             self.current_temperature_label.config(text=language_dict[self.settings["language"]][err])
             # self.current_weather_label.config(text=language_dict[self.settings["language"]]["update_failure"])
             # self.last_update_time_label.config(text=language_dict[self.settings["language"]]["update_failure"])
         else:
             # If success, display the current weather
-            self.current_temperature_label.config(text=str(int(self.weather_assistant.weather['now']['now']['temp'])) + "°C")
-            self.current_weather_label.config(text=self.weather_assistant.weather['now']['now']['text'])
-            # datetime string is ISO 8601 format
-            parsed_time = time.strptime(self.weather_assistant.weather['now']['updateTime'], "%Y-%m-%dT%H:%M%z")
-            text = language_dict[self.settings["language"]]["last_update"] + time.strftime("%Y-%m-%d %H:%M", parsed_time)
-            text += " " + self.weather_assistant.weather['now']['refer']['sources'][0]
-            text += " " + self.weather_assistant.weather['now']['refer']['license'][0]
+            self.current_temperature_label.config(text=str(model.now.temp) + "°C")
+            self.current_weather_label.config(text=model.now.text)
+            text = language_dict[self.settings["language"]]["last_update"] + model.now.update_time
+            text += " " + model.now.source
+            # If the weather is loaded from the store, mark it with its age
+            if self.weather_assistant.weather_from_store:
+                age = int(self.weather_assistant.weather_age() // 60)
+                text += language_dict[self.settings["language"]]["stored_weather"].format(age)
             self.last_update_time_label.config(text=text)
 
         # Update max min temperature
         code, err = self.handle_code(self.weather_assistant.weather['7d'])
-        if code != "200":
+        if code != "200" or model.daily is None:
             pass
         else:
-            self.max_min_temperature_label.config(text=str(int(self.weather_assistant.weather['7d']['daily'][0]['tempMin'])) + "°C / " + str(int(self.weather_assistant.weather['7d']['daily'][0]['tempMax'])) + "°C")
+            self.max_min_temperature_label.config(text=str(model.daily.temp_min[0]) + "°C / " + str(model.daily.temp_max[0]) + "°C")
     
     def update_warnings(self):
         """
@@ -554,76 +744,87 @@ class Interface(object):
                 warning_page = WarningPage(self.warning_serial, warning["title"])
                 self.warning_serial.add_page(warning_page) 
     
-    def update_weather_serial(self):
+    def update_weather_serial(self, parts):
         """
-        Update the weather serial display
+        Update the pages of the weather serial display
+        :param parts: the parts to redraw, the other pages are kept, refer to SECTION_PARTS
         """
 
-        # Clear all the pages
-        self.weather_serial.clear()
-        # Check if there's a current city
+        weather = self.weather_assistant.weather
+        # Check if there's a current city, if not, clear the pages
         if self.weather_assistant.current_city == None:
+            for part, page in [("now_weather", self.now_weather_page), ("wind", self.wind_page),
+                               ("index", self.index_page), ("air", self.air_page), ("sun_moon", self.sun_moon_page)]:
+                if part in parts:
+                    page.clear()
             return
         # Update now weather page
-        code, err = self.handle_code(self.weather_assistant.weather['now'])
-        if code != "200":
-            self.now_weather_page.clear()
-        else:
-            self.now_weather_page.update(**self.weather_assistant.weather['now']['now'])
+        if "now_weather" in parts:
+            code, err = self.handle_code(weather['now'])
+            if code != "200":
+                self.now_weather_page.clear()
+            else:
+                self.now_weather_page.update(**weather['now']['now'])
         # Update wind page
-        code, err = self.handle_code(self.weather_assistant.weather['now'])
-        if code != "200" or self.weather_assistant.weather['now']['now'] == None:
-            self.wind_page.clear()
-        else:
-            self.wind_page.update(**self.weather_assistant.weather['now']['now'])
+        if "wind" in parts:
+            code, err = self.handle_code(weather['now'])
+            if code != "200" or weather['now']['now'] == None:
+                self.wind_page.clear()
+            else:
+                self.wind_page.update(**weather['now']['now'])
         # Update index page
-        code, err = self.handle_code(self.weather_assistant.weather['indices'])
-        if code != "200":
-            self.index_page.clear()
-            self.index_page.update()
-        else:
-            self.index_page.update(**self.weather_assistant.weather['indices'])
+        if "index" in parts:
+            code, err = self.handle_code(weather['indices'])
+            if code != "200":
+                self.index_page.update()
+            else:
+                self.index_page.update(**weather['indices'])
         # Update air page
-        code, err = self.handle_code(self.weather_assistant.weather['air'])
-        if code != "200":
-            self.air_page.clear()
-        else:
-            self.air_page.update(**self.weather_assistant.weather['air']['now'])
+        if "air" in parts:
+            code, err = self.handle_code(weather['air'])
+            if code != "200":
+                self.air_page.clear()
+            else:
+                self.air_page.update(**weather['air']['now'])
         # Update sun moon page
-        code, err = self.handle_code(self.weather_assistant.weather['7d'])
-        if code != "200":
-            self.sun_moon_page.clear()
-        else:
-            self.sun_moon_page.update(**self.weather_assistant.weather['7d']['daily'][0])
+        if "sun_moon" in parts:
+            code, err = self.handle_code(weather['7d'])
+            if code != "200" or self.weather_assistant.model.daily is None:
+                self.sun_moon_page.clear()
+            else:
+                self.sun_moon_page.update(**self.weather_assistant.model.daily.today)
     
-    def undate_chart_serial(self):
+    def undate_chart_serial(self, parts):
         """
-        Update the chart serial display
+        Update the pages of the chart serial display
+        :param parts: the parts to redraw, the other charts are kept, refer to SECTION_PARTS
         """
 
-        # Clear all the pages
-        self.chart_serial.clear()
-        # Check if there's a current city
-        if self.weather_assistant.current_city == None:
-            return
-        code, err = self.handle_code(self.weather_assistant.weather['24h'])
+        weather = self.weather_assistant.weather
+        # The series are parsed arrays, ready to plot
+        model = self.weather_assistant.model
+        no_city = self.weather_assistant.current_city == None
         # Update 24 hours chart page
-        if code != "200":
-            self.chart_24hours_page.clear()
-        else:
-            self.chart_24hours_page.update(**self.weather_assistant.weather['24h'])
+        if "chart_24h" in parts:
+            code, err = self.handle_code(weather['24h'])
+            if no_city or code != "200" or model.hourly is None:
+                self.chart_24hours_page.clear()
+            else:
+                self.chart_24hours_page.update(model.hourly)
         # Update 7 days chart page
-        code, err = self.handle_code(self.weather_assistant.weather['7d'])
-        if code != "200":
-            self.chart_7days_page.clear()
-        else:
-            self.chart_7days_page.update(**self.weather_assistant.weather['7d'])
+        if "chart_7d" in parts:
+            code, err = self.handle_code(weather['7d'])
+            if no_city or code != "200" or model.daily is None:
+                self.chart_7days_page.clear()
+            else:
+                self.chart_7days_page.update(model.daily)
         # Update rain chart page
-        code, err = self.handle_code(self.weather_assistant.weather['rain'])
-        if code != "200":
-            self.chart_rain_page.clear()
-        else:
-            self.chart_rain_page.update(**self.weather_assistant.weather['rain'])
+        if "chart_rain" in parts:
+            code, err = self.handle_code(weather['rain'])
+            if no_city or code != "200" or model.minutely is None:
+                self.chart_rain_page.clear()
+            else:
+                self.chart_rain_page.update(model.minutely)
     
     def clear_all_labels(self):
         """
@@ -647,14 +848,13 @@ class Interface(object):
             self.city_listbox.delete(0, tk.END)
             # predict the city name
             text = self.city_entry.get()
-            self.prediction_list = predict_city(text, self.weather_assistant.all_cities, language=self.settings["language"])
+            self.prediction_list = predict_city(text, self.weather_assistant.all_cities, language=self.settings["language"],
+                                                index=self.weather_assistant.city_index)
             # add the prediction list to the listbox
+            alias = language_alias_dict[self.settings["language"]]
             for city in self.prediction_list:
-                display = city[language_alias_dict[self.settings["language"]]]["Name"]
-                state = city[language_alias_dict[self.settings["language"]]]["StateName"] if city['type'] == 'city' else None
-                country = city[language_alias_dict[self.settings["language"]]]["CountryName"]
-                display += ", " + state if state is not None and state != "None" else ""
-                self.city_listbox.insert(tk.END, display)
+                # "Name, StateName", precomputed by load_all_cities
+                self.city_listbox.insert(tk.END, city[alias]["DisplayName"])
         else:
             # display the city list
             self.city_listbox.delete(0, tk.END)
@@ -662,6 +862,42 @@ class Interface(object):
                 display = self.weather_assistant.all_cities[city][language_alias_dict[self.settings["language"]]]["Name"]
                 self.city_listbox.insert(tk.END, display)
     
+    def on_search_text_changed(self, *args):
+        """
+        Called in the main thread when the text of the searchbox changes
+        Update the predictions, and prefetch the top ones when the user stops typing
+        """
+
+        self.update_city_listbox()
+        self.schedule_prefetch()
+
+    def schedule_prefetch(self):
+        """
+        Prefetch the top predictions after PREFETCH_DELAY, the pending prefetch is cancelled
+        So only the predictions of the text the user stops at are prefetched
+        Must be called in the main thread, Tk timers are not thread-safe
+        """
+
+        if self.prefetch_timer is not None:
+            self.master.after_cancel(self.prefetch_timer)
+            self.prefetch_timer = None
+        if self.prefetch_future is not None:
+            self.prefetch_future.cancel()
+            self.prefetch_future = None
+        if self.prediction_list:
+            self.prefetch_timer = self.master.after(self.PREFETCH_DELAY, self.prefetch_predictions)
+
+    def prefetch_predictions(self):
+        """
+        Prefetch the weather of the top predictions in background, within the prefetch budget
+        """
+
+        self.prefetch_timer = None
+        city_names = [city["en"]["Name"] for city in self.prediction_list[:self.PREFETCH_CANDIDATES]]
+        city_names = [city for city in city_names if city not in self.weather_assistant.cities]
+        if city_names:
+            self.prefetch_future = self.weather_assistant.prefetch(city_names)
+
     ## ----- Settings Functions ----- ##
 
     def change_language(self, language):
@@ -678,15 +914,21 @@ class Interface(object):
         self.create_menu()
         
         self.thread_lock.acquire()
-        # change the language in the weather assistant
-        self.weather_assistant.set_language(language_alias_dict[self.settings["language"]])
+        # change the language in the weather assistant, the weather fetched before in this language is displayed
+        # at once and revalidated in background
+        self.weather_assistant.set_language(language_alias_dict[self.settings["language"]], on_fresh=self.on_city_refreshed)
         # change the language in the serial displays
         self.weather_serial.set_language(self.settings["language"])
         self.warning_serial.set_language(self.settings["language"])
         self.chart_serial.set_language(self.settings["language"])
-        # update the UI
+        # update the UI, all the texts are in the new language
+        self.mark_changed()
         self.update_ui()
+        if self.weather_assistant.weather_time is None and self.weather_assistant.current_city is not None:
+            self.show_updating()
         self.thread_lock.release()
+        self.refresh_scheduler.reschedule()
+        self.background_refresher.wake()
     
     def change_update_interval(self, interval):
         """
@@ -696,10 +938,8 @@ class Interface(object):
         # change the update interval in the settings
         self.settings["update_interval"] = interval
         self.save_settings()
-        # kill the timer thread and restart it
-        self.timer_thread.stop()
-        self.timer_thread = TimerThread(self.settings["update_interval"], self.update_weather)
-        self.timer_thread.start()
+        # current weather is refreshed at the update interval
+        self.refresh_scheduler.set_interval("now", self.settings["update_interval"])
         # update the update interval submenu
         # this is a dirty way to do this
         self.thread_lock.acquire()
@@ -3,60 +3,164 @@
 #     This is the controller of the program
 # By Monster Kid
 
-from GetWeather import *
-import concurrent.futures
+import json
+import time
+import zlib
+import asyncio
+import datetime
+from AsyncGetWeather import AsyncGetWeather
+from utils.LoopThread import LoopThread
+from utils.ResponseStore import ResponseStore
+from utils.CircuitBreaker import CircuitBreaker
+from utils.RateLimiter import RateLimiter
+from utils.Metrics import MetricsRegistry
+from utils.Tracer import Tracer
+from utils.WeatherModel import WeatherModel
+from utils.EventBus import EventBus
+from utils.SingleFlight import AsyncSingleFlight
+from utils.predict_city import CityIndex, normalize_name
 
 class WeatherAssistant(object):
     """
     WeatherAssistant class to manage weather infomation
+    When the weather of current city changes, a 'section_changed' event is emitted on `events` for each
+    changed section(payload: section, city), so the UI only redraws what changed
     Methods:
         - add_city: add a city to city list
         - remove_city: remove a city from city list
         - shift_city: shift current city
         - update_weather: update current and forecast weather
+        - update_weather_async: coroutine version of update_weather
+        - fetch_current_weather: fetch the weather of current city without making it current weather
+        - refresh_city_async: fetch weather of any city and keep it as the snapshot of the city
+        - read_snapshot: read the latest weather of a city without requesting
+        - read_weather: read the weather of a city at once, and revalidate it in background if it's stale
+        - revalidate, revalidate_async: refresh a city in background and notify the caller
+        - snapshot_age: get the age of the latest weather of a city
+        - apply_snapshot: make a snapshot the weather of current city
+        - make_snapshot: parse a weather dict into a snapshot
+        - prefetch: prefetch the weather of some cities in background, e.g. the predictions of the search box
+        - prefetch_city_async: prefetch the location and some sections of a city, within the prefetch budget
+        - fetch_weather_async: fetch weather of any city without changing the state
+        - resolve_location_async: get id, latitude and longitude of a city, cached
+        - run: run a coroutine in the event loop of the assistant and wait for the result
+        - close, close_async: close the pooled session and the loop thread of the assistant
+        - load_locations: load precomputed locations of all cities
+        - load_stored_weather: load the last good weather of current city from the snapshots or the store
+        - weather_age: get the age of the weather infomation
+        - is_good: whether a response is good
+        - signature: updateTime or content hash of a response, to tell whether it changed
+        - section_update_time: get the time the provider updated a section
+        - diagnostics: summary of the metrics
+        - dump_metrics: dump all the metrics to a json file
     """
 
     # the file to store city list
     CITIES_FILE = 'data/cities.txt' 
     # the file to store all cities (around the world)
     ALL_CITY = 'data/all_city.csv'
+    # the file of precomputed locations of all cities (utils/get_all_cities/ResolveCityIds.py)
+    LOCATION_FILE = 'data/city_locations.csv'
+    # the file to store the last good responses
+    STORE_FILE = 'data/weather.db'
     # empty weather information dictionary
     EMPTY_WEATHER_DICT = {'now' : None, '7d' : None, '24h' : None, 'rain' : None, 'warning' : None, 'indices' : None,
                       'air' : None, 'air_forecast' : None}
+    # timeout of each request in the fan-out, in seconds
+    REQUEST_TIMEOUT = 15
+    # the file the metrics are dumped to, refer to dump_metrics
+    METRICS_FILE = 'data/metrics.json'
+    # the file the trace is exported to, refer to Tracer.export
+    TRACE_FILE = 'data/trace.json'
+    # sections prefetched for the predictions of the search box
+    PREFETCH_SECTIONS = ['now', '7d']
+    # stale-while-revalidate, refer to read_weather: weather older than FRESH_AGE is displayed and revalidated,
+    # weather older than FRESH_AGE + MAX_STALE is not displayed anymore. In seconds
+    FRESH_AGE = 600
+    MAX_STALE = 86400
 
-    def __init__(self, language: str = 'en', do_not_update: bool = False):
+    def __init__(self, language: str = 'en', do_not_update: bool = False, loop: asyncio.AbstractEventLoop = None,
+                 base_url: str = None):
         """
         Initialize WeatherAssistant
             :param language: language of the weather infomation
             :param do_not_update: whether to update weather infomation after initialization
+            :param loop: event loop to run the requests in. If None, the assistant starts its own loop thread.
+                If a loop is given, use the coroutine methods inside it, the synchronous methods would block it.
+            :param base_url: scheme and host of the HeFeng APIs, e.g. a local utils/MockQWeather.py server.
+                None means the QWEATHER_BASE_URL environment variable or the real API, refer to GetWeather
         """
-    
-        # Initialize GetWeather
-        self.get_weather = GetWeather(language)
-        # set language of self and get_weather
+
+        # Event loop of the requests. The synchronous methods submit coroutines to it
+        self.loop_thread = None
+        if loop is None:
+            self.loop_thread = LoopThread()
+            self.loop_thread.start()
+            loop = self.loop_thread.loop
+        self.loop = loop
+        # Metrics of the requests, the refreshes and the UI
+        self.metrics = MetricsRegistry()
+        # Tracer of the stages of a refresh, disabled until started(e.g. from the help menu)
+        self.tracer = Tracer()
+        # Events of the changes of the weather of current city
+        self.events = EventBus()
+        # Initialize GetWeather, it checks the language
+        self.get_weather = AsyncGetWeather(language, base_url=base_url, metrics=self.metrics, tracer=self.tracer)
         self.language = language
-        self.set_language(language)
         # load city list
         self.cities, self.current_city = self.load_cities()
         # load all cities
         self.all_cities = self.load_all_cities()
-        # initialize weather information
-        self.weather = self.EMPTY_WEATHER_DICT
+        # prefix index of all cities for the predictions of the search box, refer to predict_city
+        self.city_index = CityIndex(self.all_cities)
+        # persistent store of the last good responses
+        self.store = ResponseStore(self.STORE_FILE)
+        # location cache {city: {'id', 'lat', 'lon'}}, seeded with the precomputed locations and backed by the store
+        self.locations = self.load_locations()
+        # initialize weather information with the last good one, so it can be displayed immediately
+        # weather_time: the time the weather was got(unix time), None if there's no weather
+        # weather_from_store: whether the weather is loaded from the store(not up to date)
+        # weather_key: (city, language) of the weather
+        # failed_sections: sections without a good response in the last update, they show the last good value
+        # model: the parsed weather, the series are arrays ready to plot(WeatherModel)
+        self.weather = dict(self.EMPTY_WEATHER_DICT)
+        self.model = WeatherModel()
+        # signature of each section of the weather, refer to signature
+        self.signatures = {}
+        self.weather_time = None
+        self.weather_key = None
+        self.weather_from_store = False
+        self.failed_sections = set()
+        # latest weather of each city {(city, language): snapshot}, kept warm by the background refresher
+        self.snapshots = {}
+        self.load_stored_weather()
+        # circuit breaker of each endpoint
+        self.breakers = {section: CircuitBreaker() for section in self.EMPTY_WEATHER_DICT}
+        # refreshes of the cities {(city, language): task}, a revalidation and the background refresher share them
+        self.refresh_flights = AsyncSingleFlight()
+        # prefetch budget, in cities: one every 10 seconds on average, bursts of 3, at most 50 a day,
+        # so typing in the search box never uses up the API quota
+        self.prefetch_limiter = RateLimiter(rate=0.1, burst=3, daily_budget=50)
         # update weather information
         if not do_not_update:
             self.update_weather()
 
-    def set_language(self, language: str):
+    def set_language(self, language: str, on_fresh=None):
         """
         Set language
+        The weather in the new language is read at once if it was fetched before, and revalidated in background
+            :param on_fresh: function(city_name), called in the event loop when the weather is revalidated
         """
         try:
+            # set language of get_weather, it checks the language
+            self.get_weather.set_hf_language(language)
             # set new language
             self.language = language
-            # set language of get_weather
-            self.get_weather.set_hf_language(language)
-            # update weather, since language changed
-            self.update_weather()
+            # the weather changed since language changed
+            if self.current_city is None:
+                self.apply_snapshot(None)
+            else:
+                self.apply_snapshot(self.read_weather(self.current_city, on_fresh))
 
             return "success"
         except ValueError as e:
@@ -89,14 +193,19 @@ class WeatherAssistant(object):
     def load_all_cities(self) -> dict:
         """
         Load all cities from csv file
-        all_cities: a dict {en_name: {'en': en_dict, 'zh': cn_dict}}
+        all_cities: a dict {en_name: {'en': en_dict, 'zh': cn_dict, 'type', 'rank'}}
         - en_name: English name of the city
         - cn_dict: Chinese infomation of the city or state
             - Name: Chinese name of the city or state
             - StateName: Chinese name of the state(if state, this does not exist)
             - CountryName: Chinese name of the country
+            - SearchKey: Name normalized for the predictions, refer to predict_city.normalize_name
+            - DisplayName: "Name, StateName" of a city, Name of a state, displayed in the prediction list
         - en_dict: English infomation of the city or state
             - Refer to cn_dict
+        - type: 'city' or 'state'
+        - rank: position in the order of the predictions, Chinese cities first, then by English name
+        The search columns are computed once here, so a keystroke in the search box does no string work on the cities
         """
         try:
             # all_cities: a dict {en_name: {'en': en_dict, 'zh': cn_dict}}
@@ -113,14 +222,19 @@ class WeatherAssistant(object):
                 for line in f:
                     line = line.strip()
                     line = line.split(',')
+                    # the search columns are computed here, the state of some cities is "None"
                     temp = {'zh': {
                         'Name': line[0],
                         'StateName': line[2],
-                        'CountryName': line[4]
+                        'CountryName': line[4],
+                        'SearchKey': normalize_name(line[0], 'Chinese'),
+                        'DisplayName': line[0] if line[2] == "None" else line[0] + ", " + line[2]
                     }, 'en': {
                         'Name': line[1],
                         'StateName': line[3],
-                        'CountryName': line[5]
+                        'CountryName': line[5],
+                        'SearchKey': normalize_name(line[1], 'English'),
+                        'DisplayName': line[1] if line[3] == "None" else line[1] + ", " + line[3]
                     }, 'type': 'city'}
                     # if state is not tracked, add it to all_cities
                     if temp['zh']['StateName'] and temp['zh']['StateName'] not in state:
@@ -128,21 +242,47 @@ class WeatherAssistant(object):
                         temp_province = {
                             'zh': {
                                 'Name': temp['zh']['StateName'],
-                                'CountryName': temp['zh']['CountryName']
+                                'CountryName': temp['zh']['CountryName'],
+                                'SearchKey': normalize_name(line[2], 'Chinese'),
+                                'DisplayName': line[2]
                             },
                             'en': {
                                 'Name': temp['en']['StateName'],
-                                'CountryName': temp['en']['CountryName']
+                                'CountryName': temp['en']['CountryName'],
+                                'SearchKey': normalize_name(line[3], 'English'),
+                                'DisplayName': line[3]
                         }, 'type': 'state'}
                         cities[temp['en']['StateName']] = temp_province
                     
                     cities[temp['en']['Name']] = temp
 
+            # rank of the predictions: Chinese cities first, then by English name(ties keep the file order)
+            ranked = sorted(cities.values(), key=lambda city: (city['en']['CountryName'] != 'China', city['en']['Name']))
+            for rank, city in enumerate(ranked):
+                city['rank'] = rank
+
             return cities
         except Exception as e:
             print(e)
             return {}
 
+    def load_locations(self) -> dict:
+        """
+        Load precomputed locations of all cities from the location file
+        locations: a dict {en_name: {'id', 'lat', 'lon'}}, empty if the file does not exist
+        """
+        try:
+            locations = {}
+            with open(WeatherAssistant.LOCATION_FILE, 'r', encoding='utf-8') as f:
+                # skip the header: EnglishName,id,lat,lon
+                next(f)
+                for line in f:
+                    line = line.strip().split(',')
+                    locations[line[0]] = {'id': line[1], 'lat': line[2], 'lon': line[3]}
+            return locations
+        except:
+            return {}
+
     def save_cities(self):
         """
         Save cities to city file
@@ -155,9 +295,11 @@ class WeatherAssistant(object):
         except:
             pass
     
-    def add_city(self, city_name: str):
+    def add_city(self, city_name: str, on_fresh=None):
         """
-        Add a city to city list
+        Add a city to city list and shift to it
+            :param on_fresh: function(city_name), called in the event loop when the weather is revalidated,
+                refer to shift_city
         """
         try:
             # check if city_name is valid
@@ -169,7 +311,7 @@ class WeatherAssistant(object):
             # add it to city list
             self.cities.append(city_name)
             # shift to the new city
-            res = self.shift_city(city_name)
+            res = self.shift_city(city_name, on_fresh)
             # if shift failed, remove the city from city list
             if res != "success":
                 self.cities.pop()
@@ -181,9 +323,11 @@ class WeatherAssistant(object):
         except:
             return "unknown_error"
 
-    def remove_city(self, city_name: str):
+    def remove_city(self, city_name: str, on_fresh=None):
         """
-        Remove a city from city list
+        Remove a city from city list and shift to the next one
+            :param on_fresh: function(city_name), called in the event loop when the weather is revalidated,
+                refer to shift_city
         """
         try:
             # check if city_name is None
@@ -200,7 +344,7 @@ class WeatherAssistant(object):
                     self.current_city = None
                     self.update_weather()
                 else:
-                    res = self.shift_city(self.cities[idx % len(self.cities)])
+                    res = self.shift_city(self.cities[idx % len(self.cities)], on_fresh)
                     if res != "success":
                         self.cities.append(city_name)
                         return res
@@ -213,9 +357,12 @@ class WeatherAssistant(object):
         except Exception as e:
             return "unknown_error"
 
-    def shift_city(self, city_name: str):
+    def shift_city(self, city_name: str, on_fresh=None):
         """
         Shift current city
+        The weather is read at once from the snapshots kept warm by the background refresher, or from the store.
+        If it's stale or missing, it's revalidated in background, refer to read_weather
+            :param on_fresh: function(city_name), called in the event loop when the weather is revalidated
         """
         try:
             # check if city_name is in city list
@@ -224,55 +371,522 @@ class WeatherAssistant(object):
             # update current city, file and weather
             self.current_city = city_name
             self.save_cities()
-            self.update_weather()
+            self.apply_snapshot(self.read_weather(city_name, on_fresh))
 
             return "success"
         except:
             return "unknown_error"
 
-    def update_weather(self):
+    def read_snapshot(self, city_name: str) -> dict:
+        """
+        Read the latest weather of a city without requesting, from the snapshots or the store
+            :param city_name: English name of the city
+            :return: snapshot {'weather', 'model', 'signatures', 'time', 'failed', 'from_store', 'partial'},
+                refer to refresh_city_async. None if the city was never fetched in the current language
+        """
+        key = (city_name, self.language)
+        snapshot = self.snapshots.get(key)
+        if snapshot is not None:
+            return snapshot
+        weather, saved_at = self.store.load_weather(city_name, self.language, list(self.EMPTY_WEATHER_DICT))
+        if saved_at is None:
+            return None
+        snapshot = self.make_snapshot(weather, saved_at, set(), from_store=True)
+        self.snapshots[key] = snapshot
+        return snapshot
+
+    def make_snapshot(self, weather: dict, weather_time: float, failed: set, from_store: bool = False,
+                      partial: bool = False, previous: dict = None, sections: list = None) -> dict:
+        """
+        Parse a weather dict into a snapshot, refer to refresh_city_async
+        The responses are parsed once here, the raw series are dropped from the weather dict
+        A response that can not be parsed is counted in the 'parse_errors' metric
+            :param previous: the previous snapshot of the city, its parsed sections that did not change are reused
+            :param sections: sections of the weather dict that were fetched, None means all
+        """
+        if previous is None:
+            signatures = {section: WeatherAssistant.signature(data) for section, data in weather.items()}
+            changed = None
+        else:
+            # the sections not fetched are compacted already, their signatures are kept
+            signatures = dict(previous['signatures'])
+            for section in (weather if sections is None else sections):
+                signatures[section] = WeatherAssistant.signature(weather[section])
+            changed = [section for section in signatures if signatures[section] != previous['signatures'].get(section)]
+        model = WeatherModel.parse(weather, None if previous is None else previous['model'], changed)
+        for section in model.errors:
+            self.metrics.inc('parse_errors', section=section)
+        return {'weather': WeatherModel.compact(weather), 'model': model, 'signatures': signatures,
+                'time': weather_time, 'failed': failed, 'from_store': from_store, 'partial': partial}
+
+    def read_weather(self, city_name: str, on_fresh=None) -> dict:
+        """
+        Stale-while-revalidate read: read the weather of a city at once, without waiting for the network
+        - Fresh(younger than FRESH_AGE): the snapshot is returned
+        - Stale: the snapshot is returned if it's younger than FRESH_AGE + MAX_STALE, and the city is revalidated
+          in background. on_fresh is called when the new weather lands
+        - Missing or partial(prefetched): the city is revalidated, a partial snapshot is returned meanwhile
+        - Loaded from the store(e.g. at startup): the city is revalidated even if it's fresh, otherwise it's
+          displayed as offline until the next scheduled refresh
+            :param city_name: English name of the city
+            :param on_fresh: function(city_name), called in the event loop after the revalidation
+            :return: snapshot, refer to refresh_city_async. None if there's no weather to display yet
+        """
+        snapshot = self.read_snapshot(city_name)
+        age = None if snapshot is None else time.time() - snapshot['time']
+        if snapshot is None or snapshot['partial'] or snapshot['from_store'] or age >= self.FRESH_AGE:
+            self.revalidate(city_name, on_fresh)
+        if age is not None and age >= self.FRESH_AGE + self.MAX_STALE:
+            return None
+        return snapshot
+
+    def revalidate(self, city_name: str, on_fresh=None):
+        """
+        Refresh a city in background, refer to revalidate_async
+            :return: concurrent.futures.Future of the revalidation
+        """
+        return asyncio.run_coroutine_threadsafe(self.revalidate_async(city_name, on_fresh), self.loop)
+
+    async def revalidate_async(self, city_name: str, on_fresh=None):
+        """
+        Refresh a city, the new snapshot is built in the event loop but not made the weather of current city here:
+        the UI may be reading it. on_fresh swaps it in(load_stored_weather) under the lock of the UI.
+        Without on_fresh, current city is swapped in at once
+        Concurrent revalidations of a city share one refresh
+            :param city_name: English name of the city
+            :param on_fresh: function(city_name), called after the refresh
+        """
+
+        try:
+            await self.refresh_flights.do((city_name, self.language), lambda: self.refresh_city_async(city_name))
+        except Exception as e:
+            # offline, current city keeps displaying its last good weather
+            if city_name != self.current_city:
+                raise
+        if on_fresh is not None:
+            on_fresh(city_name)
+        elif city_name == self.current_city:
+            self.load_stored_weather()
+
+    def snapshot_age(self, city_name: str) -> float:
+        """
+        Get the age of the latest weather of a city in seconds, None if the city was never fetched
+        """
+        snapshot = self.read_snapshot(city_name)
+        if snapshot is None:
+            return None
+        return time.time() - snapshot['time']
+
+    def apply_snapshot(self, snapshot: dict):
+        """
+        Make a snapshot the weather of current city
+        A 'section_changed' event is emitted for each section whose signature changed.
+        Every section changes if current city or language changed
+        """
+        weather_key = None if self.current_city is None else (self.current_city, self.language)
+        previous_key, previous_signatures, previous_from_store = self.weather_key, self.signatures, \
+            self.weather_from_store
+        if snapshot is None:
+            self.weather, self.weather_time = dict(self.EMPTY_WEATHER_DICT), None
+            self.model, self.signatures = WeatherModel(), {}
+            self.weather_from_store, self.failed_sections = False, set()
+        else:
+            self.weather, self.weather_time = snapshot['weather'], snapshot['time']
+            self.model, self.signatures = snapshot['model'], snapshot['signatures']
+            self.weather_from_store, self.failed_sections = snapshot['from_store'], snapshot['failed']
+        self.weather_key = weather_key
+
+        if weather_key != previous_key:
+            changed = list(self.EMPTY_WEATHER_DICT)
+        else:
+            changed = [section for section in self.EMPTY_WEATHER_DICT
+                       if self.signatures.get(section) != previous_signatures.get(section)]
+            # the last update time of current weather says whether it's loaded from the store
+            if self.weather_from_store != previous_from_store and 'now' not in changed:
+                changed.append('now')
+        for section in changed:
+            self.events.emit('section_changed', section=section, city=self.current_city)
+
+    def load_stored_weather(self):
+        """
+        Load the last good weather of current city from the snapshots or the store
+        """
+        if self.current_city is None:
+            self.apply_snapshot(None)
+        else:
+            self.apply_snapshot(self.read_snapshot(self.current_city))
+
+    def weather_age(self) -> float:
+        """
+        Get the age of the weather infomation in seconds, None if there's no weather
+        """
+        if self.weather_time is None:
+            return None
+        return time.time() - self.weather_time
+
+    def run(self, coro):
+        """
+        Run a coroutine in the event loop of the assistant and wait for the result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def update_weather(self, sections: list = None):
+        """
+        Update current and forecast weather
+        A thin wrapper of update_weather_async
+        """
+        return self.run(self.update_weather_async(sections))
+
+    async def update_weather_async(self, sections: list = None):
         """
         Update current and forecast weather
+        Sections without a good response keep their last good value, they are listed in failed_sections
+            :param sections: keys of the weather dict to update, None means all.
+                Only updating some sections(e.g. retrying failed_sections) is possible if the weather is of current city
         """
         try:
-            # reset weather dict
-            self.weather = self.EMPTY_WEATHER_DICT
+            weather_key, snapshot = await self.fetch_current_weather_async(sections)
+            # current city or language may have changed while fetching
+            if weather_key == (self.current_city, self.language):
+                self.apply_snapshot(snapshot)
 
-            # check if current city is None
-            if self.current_city is None:
-                return
+        except Exception as e:
+            # offline, display the last good weather
+            self.load_stored_weather()
+
+    def fetch_current_weather(self, sections: list = None) -> tuple:
+        """
+        Fetch the weather of current city without making it current weather, so the caller can apply it
+        under its own lock, refer to Interface.update_weather_thread
+        A thin wrapper of fetch_current_weather_async
+        """
+        return self.run(self.fetch_current_weather_async(sections))
+
+    async def fetch_current_weather_async(self, sections: list = None) -> tuple:
+        """
+        Coroutine version of fetch_current_weather
+            :param sections: keys of the weather dict to update, None means all, refer to update_weather_async
+            :return: ((city, language), snapshot), the snapshot is None if there's no current city
+        """
+        city_name, language = self.current_city, self.language
+        if city_name is None:
+            return (None, language), None
+        # only update some sections if the weather belongs to current city and language
+        if self.weather_key != (city_name, language):
+            sections = None
+        return (city_name, language), await self.refresh_city_async(city_name, sections)
 
-            # get city id, latitude and longitude
-            city = self.get_weather.get_hf_location(self.current_city)
+    async def refresh_city_async(self, city_name: str, sections: list = None) -> dict:
+        """
+        Fetch weather of a city, save the good responses and keep the result as the snapshot of the city
+        Used for current city and by the background refresher for the others
+            :param city_name: English name of the city
+            :param sections: keys of the weather dict to update, None means all.
+                The other sections are kept from the snapshot of the city
+            :return: snapshot {'weather', 'model', 'signatures', 'time', 'failed', 'from_store', 'partial'}
+                - weather: weather dict, failed sections keep their last good value. The series(daily, hourly,
+                  minutely) are dropped, they are in the model
+                - model: the parsed weather(WeatherModel)
+                - signatures: signature of each section {section: signature}, refer to signature
+                - time: the time the weather was got(unix time), None if there's no weather
+                - failed: sections without a good response in the last update(set)
+                - from_store: whether the weather is loaded from the store(not up to date)
+                - partial: whether only some sections were prefetched, refer to prefetch_city_async
+        """
+
+        start = time.perf_counter()
+        # the language may change during the fetch, the responses belong to the language it started with
+        language = self.language
+        key = (city_name, language)
+        snapshot = self.read_snapshot(city_name)
+        if sections is None or snapshot is None or snapshot['partial']:
+            sections = list(self.EMPTY_WEATHER_DICT)
+            weather = dict(self.EMPTY_WEATHER_DICT)
+        else:
+            weather = dict(snapshot['weather'])
+
+        fetched = await self.fetch_weather_async(city_name, sections)
+        # save the good responses, they are displayed on next startup or when offline
+        with self.metrics.timer('store_save'), self.tracer.span('store_save', city=city_name):
+            self.store.save_weather(city_name, language, fetched)
+        weather.update(fetched)
+
+        # keep the last good value of the failed sections
+        failed = [section for section in sections if not self.is_good(fetched[section])]
+        if failed:
+            stored, _ = self.store.load_weather(city_name, language, failed)
+            for section in failed:
+                if stored[section] is not None:
+                    weather[section] = stored[section]
+        self.metrics.observe('refresh_cycle', time.perf_counter() - start,
+                             sections='all' if len(sections) == len(self.EMPTY_WEATHER_DICT) else 'some')
+
+        if len(failed) < len(sections):
+            weather_time, from_store = time.time(), False
+        elif snapshot is not None and snapshot['partial']:
+            # keep the prefetched sections
+            return snapshot
+        elif snapshot is not None:
+            weather_time, from_store = snapshot['time'], snapshot['from_store']
+        else:
+            weather_time, from_store = None, False
+        with self.metrics.timer('parse'), self.tracer.span('parse', city=city_name):
+            # the sections that did not change are not parsed again
+            snapshot = self.make_snapshot(weather, weather_time, set(failed), from_store, previous=snapshot,
+                                          sections=sections)
+        # a city that has never been fetched has no snapshot
+        if weather_time is not None:
+            self.snapshots[key] = snapshot
+        return snapshot
+
+    def prefetch(self, city_names: list):
+        """
+        Prefetch the weather of some cities in background, e.g. the predictions of the search box
+            :param city_names: English names of the cities, in order of priority
+            :return: concurrent.futures.Future of the prefetch, cancel it if the cities are not wanted anymore
+        """
+        return asyncio.run_coroutine_threadsafe(self.prefetch_async(city_names), self.loop)
+
+    async def prefetch_async(self, city_names: list):
+        """
+        Coroutine version of prefetch
+        """
+        await asyncio.gather(*[self.prefetch_city_async(city_name) for city_name in city_names],
+                             return_exceptions=True)
+
+    async def prefetch_city_async(self, city_name: str):
+        """
+        Prefetch the location and PREFETCH_SECTIONS of a city, so adding it does not wait for the network
+        The result is kept as a partial snapshot, the background refresher completes it first
+        Nothing is requested if the city already has a snapshot or the prefetch budget is used up
+            :param city_name: English name of the city
+        """
+
+        if self.read_snapshot(city_name) is not None:
+            return
+        code, _ = self.prefetch_limiter.reserve(wait=False)
+        if code is not None:
+            return
+        key = (city_name, self.language)
+        fetched = await self.fetch_weather_async(city_name, self.PREFETCH_SECTIONS)
+        good = [section for section in self.PREFETCH_SECTIONS if self.is_good(fetched[section])]
+        # a full fetch may have finished meanwhile
+        if not good or key in self.snapshots:
+            return
+        weather = dict(self.EMPTY_WEATHER_DICT)
+        weather.update(fetched)
+        failed = set(self.PREFETCH_SECTIONS) - set(good)
+        self.snapshots[key] = self.make_snapshot(weather, time.time(), failed, partial=True)
+
+    def section_update_time(self, section: str) -> float:
+        """
+        Get the time the provider updated a section of current weather(updateTime of the response)
+            :param section: key of the weather dict
+            :return: unix time, None if the section has no good response
+        """
+        data = self.weather.get(section)
+        if not self.is_good(data) or 'updateTime' not in data:
+            return None
+        # datetime string is ISO 8601 format, e.g. 2021-02-16T16:00+08:00
+        return datetime.datetime.strptime(data['updateTime'], "%Y-%m-%dT%H:%M%z").timestamp()
+
+    @staticmethod
+    def is_good(data: dict) -> bool:
+        """
+        Whether a response is good(code 200)
+        """
+        return data is not None and data.get('code') == '200'
+
+    @staticmethod
+    def signature(data: dict):
+        """
+        Signature of a response, two responses with the same signature display the same
+        It's (code, updateTime) if the response has updateTime, else the crc32 of its content
+            :return: the signature, None if there's no response
+        """
+        if data is None:
+            return None
+        if 'updateTime' in data:
+            return (data.get('code'), data['updateTime'])
+        return zlib.crc32(json.dumps(data, sort_keys=True).encode('utf-8'))
+
+    async def fetch_weather_async(self, city_name: str, sections: list = None) -> dict:
+        """
+        Fetch current and forecast weather of a city, the state of the assistant is not changed
+        Many cities can be fetched concurrently in the same event loop
+        Each endpoint has a circuit breaker. If an endpoint keeps failing, it's skipped(None) for a while
+            :param city_name: English name of the city
+            :param sections: keys of the weather dict to fetch, None means all
+            :return: weather dict with the keys in sections, refer to EMPTY_WEATHER_DICT.
+                A section is None if its request raised an exception or its circuit is open
+        """
+
+        sections = list(self.EMPTY_WEATHER_DICT) if sections is None else list(sections)
+        weather = dict.fromkeys(sections)
+
+        # get city id, latitude and longitude, usually from the location cache
+        city = await self.resolve_location_async(city_name)
+        if city is None:
+            return weather
+        idx = city['id']
+        lat = city['lat']
+        lon = city['lon']
+
+        # Fan out the requests in the event loop, no thread is needed
+        api_functions = {
+            'now': lambda: self.get_weather.get_hf_current(idx),
+            '7d': lambda: self.get_weather.get_hf_7days(idx),
+            '24h': lambda: self.get_weather.get_hf_24hours(idx),
+            'rain': lambda: self.get_weather.get_hf_rain(lat, lon),
+            'warning': lambda: self.get_weather.get_hf_warning(idx),
+            'indices': lambda: self.get_weather.get_hf_indices(idx),
+            'air': lambda: self.get_weather.get_hf_air(idx),
+            'air_forecast': lambda: self.get_weather.get_hf_air_forecast(idx)
+        }
+        # skip the endpoints whose circuit is open
+        allowed = [section for section in sections if self.breakers[section].allow()]
+        for section in set(sections) - set(allowed):
+            self.metrics.inc('circuit_open', endpoint=section)
+        if self.tracer.enabled:
+            # each call is a span on the row of its task
+            api_functions = {section: self.traced(section, function) for section, function in api_functions.items()}
+        try:
+            with self.metrics.timer('fan_out'), self.tracer.span('fan_out', city=city_name):
+                results = await asyncio.gather(*[asyncio.wait_for(api_functions[section](), self.REQUEST_TIMEOUT)
+                                                 for section in allowed], return_exceptions=True)
+        except BaseException:
+            # cancelled(e.g. a prefetch of an old prediction), the endpoints have no result.
+            # Give back the trials of the half-open circuits, or they would never allow a call again
+            for section in allowed:
+                self.breakers[section].release()
+            raise
+
+        # Update weather dict and the circuit breakers
+        # Only exceptions and timeouts are failures of the endpoint, other codes are answers of the API
+        for section, result in zip(allowed, results):
+            if isinstance(result, BaseException):
+                self.metrics.inc('exceptions', endpoint=section, error=type(result).__name__)
+                self.breakers[section].record_failure()
+            elif result.get('code') == self.get_weather.CODE_TIMEOUT:
+                self.breakers[section].record_failure()
+                weather[section] = result
+            else:
+                self.breakers[section].record_success()
+                weather[section] = result
+
+        return weather
+
+    def traced(self, section: str, function):
+        """
+        Wrap an API function of the fan-out, so its call is recorded as a span
+        """
+        async def traced_function():
+            with self.tracer.span('fetch ' + section):
+                return await function()
+        return traced_function
+
+    async def resolve_location_async(self, city_name: str) -> dict:
+        """
+        Get id, latitude and longitude of a city
+        Location of a city never changes, so the lookup is done only once and stored
+            :param city_name: English name of the city
+            :return: {'id', 'lat', 'lon'}, None if the city is not found
+        """
+
+        # memory cache
+        location = self.locations.get(city_name)
+        if location is not None:
+            return location
+        # persistent cache
+        start = time.perf_counter()
+        source = 'store'
+        location = self.store.load_location(city_name)
+        if location is None:
+            # request the location
+            source = 'api'
+            with self.tracer.span('get_hf_location', city=city_name):
+                city = await asyncio.wait_for(self.get_weather.get_hf_location(city_name), self.REQUEST_TIMEOUT)
             if city is None:
-                return self.EMPTY_WEATHER_DICT
-            idx = city['id']
-            lat = city['lat']
-            lon = city['lon']
-
-            # Use multi-threading to speed up
-            api_functions = [
-                lambda: self.get_weather.get_hf_current(idx),
-                lambda: self.get_weather.get_hf_7days(idx),
-                lambda: self.get_weather.get_hf_24hours(idx),
-                lambda: self.get_weather.get_hf_rain(lat, lon),
-                lambda: self.get_weather.get_hf_warning(idx),
-                lambda: self.get_weather.get_hf_indices(idx),
-                lambda: self.get_weather.get_hf_air(idx),
-                lambda: self.get_weather.get_hf_air_forecast(idx)
-            ]
-
-            # Execute all api functions
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                results = list(executor.map(lambda func: func(), api_functions))
-
-            # Update weather dict
-            keys = ['now', '7d', '24h', 'rain', 'warning', 'indices', 'air', 'air_forecast']
-            for i in range(len(results)):
-                self.weather[keys[i]] = results[i]
+                return None
+            location = {'id': city['id'], 'lat': city['lat'], 'lon': city['lon']}
+            self.store.save_location(city_name, location)
+        self.metrics.observe('location_lookup', time.perf_counter() - start, source=source)
+        self.locations[city_name] = location
+        return location
 
-        except Exception as e:
-            self.weather = self.EMPTY_WEATHER_DICT
+    def diagnostics(self) -> dict:
+        """
+        Summary of the metrics, displayed by the diagnostics page
+            :return: {'refresh', 'location', 'fan_out', 'request', 'decode', 'render',
+                'requests', 'errors', 'cache_hit', 'traffic'}
+                - refresh, location, fan_out, request, decode, render: median time in ms, None if never measured
+                  (location is the geo lookup through the API, render is one update of the whole UI)
+                - requests, errors: number of responses, and of those whose code is not 200 or that can not be parsed
+                - cache_hit: cache hit rate in %, None if the cache was never used
+                - traffic: received bytes in KB
+        """
+
+        responses = self.metrics.counter('responses')
+        hits = self.metrics.counter('cache', result='hit')
+        lookups = hits + self.metrics.counter('cache', result='miss')
+        return {
+            'refresh': self.metrics.histogram('refresh_cycle')['p50'],
+            'location': self.metrics.histogram('location_lookup', source='api')['p50'],
+            'fan_out': self.metrics.histogram('fan_out')['p50'],
+            'request': self.metrics.histogram('request_latency')['p50'],
+            'decode': self.metrics.histogram('json_decode')['p50'],
+            'render': self.metrics.histogram('ui_render', part='all')['p50'],
+            'requests': responses,
+            'errors': responses - self.metrics.counter('responses', code='200') + self.metrics.counter('exceptions')
+                      + self.metrics.counter('parse_errors'),
+            'cache_hit': 100 * hits / lookups if lookups else None,
+            'traffic': self.metrics.counter('bytes_received') / 1024,
+        }
+
+    def dump_metrics(self, path: str = None) -> str:
+        """
+        Dump all the metrics to a json file, with the state of the cache, the rate limiter and the circuit breakers
+            :param path: the file, default is METRICS_FILE
+            :return: the file
+        """
+
+        path = path or self.METRICS_FILE
+        self.metrics.dump(path, {
+            'cache': self.get_weather.cache.stats(),
+            'rate_limiter': self.get_weather.rate_limiter.state(),
+            'breakers': {section: breaker.get_state() for section, breaker in self.breakers.items()},
+            'hedged': self.get_weather.hedged,
+            'single_flight_shared': self.get_weather.flights.shared,
+        })
+        return path
+
+    def close(self):
+        """
+        Close the connections and stop the loop thread(if the assistant owns it)
+        The pending tasks of its loop(revalidations, prefetches, the background refresher) are cancelled first,
+        so nothing uses the connections after they are closed
+        """
+        if self.loop_thread is not None:
+            self.run(self.cancel_tasks())
+        self.run(self.get_weather.close())
+        if self.loop_thread is not None:
+            self.loop_thread.stop()
+
+    async def cancel_tasks(self):
+        """
+        Cancel the other tasks of the event loop and wait for them to finish
+        Only for a loop owned by the assistant, all of its tasks belong to the assistant
+        """
+        tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def close_async(self):
+        """
+        Coroutine version of close, use it if the event loop was given to the assistant
+        """
+        await self.get_weather.close()
 
 
 # Test
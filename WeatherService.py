@@ -0,0 +1,261 @@
+# WeatherService.py
+# Description: local JSON HTTP service of the weather, based on aiohttp.web
+#     Many clients(e.g. the lobby displays of a building) read from one process, which shares the response cache,
+#     the single-flight fetching and the rate limiter, instead of each client polling QWeather
+# Usage(from the root of the project):
+#     python WeatherService.py --port 8080
+#     GET /weather/{city}                  current weather, air, warnings and indices
+#     GET /forecast/{city}?range=7d        forecast series, range is 7d, 24h or rain
+#     GET /predict?q=bei&n=5               predictions of the search box
+#     GET /stats                           diagnostics of the service
+# By Monster Kid
+
+import json
+import time
+import asyncio
+import argparse
+from aiohttp import web
+from WeatherAssistant import WeatherAssistant
+from utils.predict_city import predict_city
+from utils.ResponseCache import ResponseCache
+from utils.SingleFlight import AsyncSingleFlight
+from utils.WeatherModel import to_dict
+
+class WeatherService(object):
+    """
+    WeatherService: serve the snapshots of a WeatherAssistant as JSON
+    - A city is refreshed when its snapshot is older than `max_age`, concurrent requests of a city share one refresh
+    - The JSON bodies are serialized once per snapshot and kept in a cache, so a cache hit is a dict lookup
+    - Only the cities of all_city.csv are served, by English or Chinese name, so clients can not spend the quota
+      on arbitrary names
+    Methods:
+        - make_app: make the aiohttp application
+        - get_snapshot: get a fresh snapshot of a city
+        - handle_weather, handle_forecast, handle_predict, handle_stats: request handlers
+    """
+
+    # forecast ranges: {range: attribute of WeatherModel}
+    RANGES = {'7d': 'daily', '24h': 'hourly', 'rain': 'minutely'}
+    # sections of /weather: {section: key of the payload in the response}
+    CURRENT_SECTIONS = {'now': 'now', 'air': 'now', 'warning': 'warning', 'indices': 'daily'}
+    # max number of predictions of /predict
+    MAX_PREDICTIONS = 50
+
+    def __init__(self, language: str = 'en', base_url: str = None, max_age: float = 600, body_cache_size: int = 4096,
+                 prediction_cache_size: int = 1024):
+        """
+        Init WeatherService, the assistant is created when the application starts, in its event loop
+        Parameters:
+            :param language: language of the weather, en or zh(str)
+            :param base_url: scheme and host of the HeFeng APIs, refer to GetWeather(str)
+            :param max_age: a city is refreshed when its snapshot is older than this, in seconds(float)
+            :param body_cache_size: max number of serialized bodies of the cities(int)
+            :param prediction_cache_size: max number of serialized predictions(int)
+        """
+
+        self.language = language
+        self.base_url = base_url
+        self.max_age = max_age
+        self.weather_assistant = None
+        # serialized bodies {(route, city, argument): (snapshot, body)}, valid while the snapshot is current
+        self.bodies = ResponseCache({'weather': max_age, 'forecast': max_age}, body_cache_size)
+        # serialized predictions {('predict', text, n): body}, kept apart so typing can't evict the cities
+        self.predictions = ResponseCache({'predict': 86400}, prediction_cache_size)
+        # one refresh of a city at once
+        self.flights = AsyncSingleFlight()
+        # {name: English name} of the cities, by English and Chinese name
+        self.city_names = {}
+
+    def make_app(self) -> web.Application:
+        """
+        Make the aiohttp application
+        """
+        app = web.Application()
+        app.router.add_get('/weather/{city}', self.handle_weather)
+        app.router.add_get('/forecast/{city}', self.handle_forecast)
+        app.router.add_get('/predict', self.handle_predict)
+        app.router.add_get('/stats', self.handle_stats)
+        app.on_startup.append(self.startup)
+        app.on_cleanup.append(self.cleanup)
+        return app
+
+    async def startup(self, app):
+        """
+        Create the assistant in the event loop of the application
+        """
+        self.weather_assistant = WeatherAssistant(self.language, do_not_update=True,
+                                                  loop=asyncio.get_running_loop(),
+                                                  base_url=self.base_url)
+        for name, city in self.weather_assistant.all_cities.items():
+            self.city_names[name] = name
+            self.city_names.setdefault(city['zh']['Name'], name)
+
+    async def cleanup(self, app):
+        """
+        Close the connections of the assistant
+        """
+        await self.weather_assistant.close_async()
+
+    @staticmethod
+    def json_response(body: bytes, status: int = 200) -> web.Response:
+        """
+        Make a response of a serialized JSON body
+        """
+        return web.Response(body=body, status=status, content_type='application/json')
+
+    @staticmethod
+    def dumps(data) -> bytes:
+        """
+        Serialize data to a JSON body
+        """
+        return json.dumps(data, ensure_ascii=False).encode('utf-8')
+
+    def error(self, status: int, error: str, **fields) -> web.Response:
+        """
+        Make an error response, body: {'error', **fields}
+        """
+        return self.json_response(self.dumps({'error': error, **fields}), status)
+
+    async def get_snapshot(self, city_name: str) -> dict:
+        """
+        Get a fresh snapshot of a city, refresh it if it's missing, partial or older than max_age
+        If the refresh fails, the last snapshot is returned
+            :param city_name: English name of the city
+            :return: snapshot, refer to WeatherAssistant.refresh_city_async. None if the city has no weather
+        """
+
+        snapshot = self.weather_assistant.read_snapshot(city_name)
+        if snapshot is not None and not snapshot['partial'] and time.time() - snapshot['time'] < self.max_age:
+            return snapshot
+        key = (city_name, self.weather_assistant.language)
+        try:
+            refreshed = await self.flights.do(key, lambda: self.weather_assistant.refresh_city_async(city_name))
+        except Exception as e:
+            # offline, serve the last weather
+            return snapshot
+        return refreshed if refreshed['time'] is not None else snapshot
+
+    async def cached_body(self, route: str, request: web.Request, argument, make_body) -> web.Response:
+        """
+        Serve the body of a city from the cache of serialized bodies, serialize it if the snapshot changed
+            :param route: name of the route
+            :param argument: argument of the route, part of the key of the body
+            :param make_body: function(city_name, snapshot) -> dict, the data of the body
+        """
+
+        city_name = self.city_names.get(request.match_info['city'])
+        if city_name is None:
+            return self.error(404, 'city_not_found')
+        metrics = self.weather_assistant.metrics
+        key = (route, city_name, argument)
+        cached = self.bodies.get(key)
+        current = self.weather_assistant.snapshots.get((city_name, self.weather_assistant.language))
+        if cached is not None and cached[0] is current and time.time() - current['time'] < self.max_age:
+            metrics.inc('service_requests', route=route, body='cached')
+            return self.json_response(cached[1])
+
+        snapshot = await self.get_snapshot(city_name)
+        if snapshot is None:
+            metrics.inc('service_requests', route=route, body='unavailable')
+            return self.error(503, 'no_weather', city=city_name)
+        body = self.dumps(make_body(city_name, snapshot))
+        self.bodies.put(key, (snapshot, body))
+        metrics.inc('service_requests', route=route, body='serialized')
+        return self.json_response(body)
+
+    async def handle_weather(self, request: web.Request) -> web.Response:
+        """
+        GET /weather/{city}: current weather, air, warnings and indices
+        Body: {'city', 'time', 'from_store', 'failed', 'now', 'air', 'warning', 'indices', 'today'},
+            a section is null if it has no good response
+        """
+
+        def make_body(city_name, snapshot):
+            body = {'city': city_name, 'time': snapshot['time'], 'from_store': snapshot['from_store'],
+                    'failed': sorted(snapshot['failed'])}
+            for section, key in self.CURRENT_SECTIONS.items():
+                data = snapshot['weather'][section]
+                body[section] = data.get(key) if WeatherAssistant.is_good(data) else None
+            daily = snapshot['model'].daily
+            body['today'] = None if daily is None else daily.today
+            return body
+
+        return await self.cached_body('weather', request, None, make_body)
+
+    async def handle_forecast(self, request: web.Request) -> web.Response:
+        """
+        GET /forecast/{city}?range=7d: forecast series, range is 7d(default), 24h or rain
+        Body: {'city', 'time', 'range', 'updateTime', 'series'}, series is {column: list} or null
+        """
+
+        forecast_range = request.query.get('range', '7d')
+        if forecast_range not in self.RANGES:
+            return self.error(400, 'unknown_range', ranges=list(self.RANGES))
+
+        def make_body(city_name, snapshot):
+            series = getattr(snapshot['model'], self.RANGES[forecast_range])
+            data = snapshot['weather'][forecast_range] or {}
+            return {'city': city_name, 'time': snapshot['time'], 'range': forecast_range,
+                    'updateTime': data.get('updateTime'), 'series': None if series is None else to_dict(series)}
+
+        return await self.cached_body('forecast', request, forecast_range, make_body)
+
+    async def handle_predict(self, request: web.Request) -> web.Response:
+        """
+        GET /predict?q=bei&n=5: predictions of the search box, Chinese if q is not ASCII
+        n is clamped to 1..MAX_PREDICTIONS, 400 if it's not an integer
+        Body: [{'name', 'name_zh', 'state', 'country', 'type'}]
+        """
+
+        text = request.query.get('q', '')
+        try:
+            n_entries = int(request.query.get('n', 5))
+        except (TypeError, ValueError):
+            return self.error(400, 'bad_n')
+        # 1 to MAX_PREDICTIONS entries, a negative n would slice from the end
+        n_entries = max(1, min(n_entries, self.MAX_PREDICTIONS))
+        key = ('predict', text, n_entries)
+        body = self.predictions.get(key)
+        if body is None:
+            language = 'English' if text.isascii() else 'Chinese'
+            predictions = predict_city(text, self.weather_assistant.all_cities, n_entries, language,
+                                       index=self.weather_assistant.city_index)
+            body = self.dumps([{'name': city['en']['Name'], 'name_zh': city['zh']['Name'],
+                                'state': city['en'].get('StateName'), 'country': city['en']['CountryName'],
+                                'type': city['type']} for city in predictions])
+            self.predictions.put(key, body)
+        return self.json_response(body)
+
+    async def handle_stats(self, request: web.Request) -> web.Response:
+        """
+        GET /stats: diagnostics of the assistant, the body caches and the rate limiter
+        """
+        weather_assistant = self.weather_assistant
+        return self.json_response(self.dumps({
+            'diagnostics': weather_assistant.diagnostics(),
+            'bodies': self.bodies.stats(),
+            'predictions': self.predictions.stats(),
+            'requests': {'cached': weather_assistant.metrics.counter('service_requests', body='cached'),
+                         'serialized': weather_assistant.metrics.counter('service_requests', body='serialized')},
+            'response_cache': weather_assistant.get_weather.cache.stats(),
+            'rate_limiter': weather_assistant.get_weather.rate_limiter.state(),
+            'refreshes_shared': self.flights.shared,
+        }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local JSON HTTP service of Weather Assistant')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--language', default='en', help='language of the weather, en or zh')
+    parser.add_argument('--max-age', type=float, default=600, help='seconds before a city is refreshed')
+    parser.add_argument('--base-url', default=None, help='scheme and host of the API, e.g. a MockQWeather server')
+    args = parser.parse_args()
+
+    service = WeatherService(args.language, args.base_url, args.max_age)
+    # no access log, it costs more than a cache hit
+    web.run_app(service.make_app(), host=args.host, port=args.port, access_log=None)
+
+
+if __name__ == '__main__':
+    main()
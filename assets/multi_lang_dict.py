@@ -62,6 +62,16 @@ language_dict = {
         'rain_title': 'Rain',
         'last_update': 'Last update: ',
         'updating': 'Updating...',
+        'stored_weather': ' (offline, {} min ago)',
+        'diagnostics_title': 'Diagnostics',
+        'diagnostics_subtitle': ['Refresh', 'Geo Lookup', 'Fan-out', 'Request', 'JSON Decode',
+                                 'Render', 'Requests', 'Errors', 'Cache Hits', 'Received'],
+        'diagnostics_units': ['ms', 'ms', 'ms', 'ms', 'ms', 'ms', '', '', '%', 'KB'],
+        'dump_metrics_command': 'Dump Diagnostics',
+        'metrics_dumped': 'Diagnostics saved to {}',
+        'start_trace_command': 'Start Tracing',
+        'stop_trace_command': 'Stop Tracing and Save',
+        'trace_saved': '{} spans saved to {}\nOpen it in chrome://tracing or ui.perfetto.dev',
     },
     'Chinese': {
         'title': '天气助手',
@@ -121,6 +131,16 @@ language_dict = {
         'rain_title': '降雨情况',
         'last_update': '上次更新时间：',
         'updating': '更新中...',
+        'stored_weather': '（离线，{}分钟前）',
+        'diagnostics_title': '诊断信息',
+        'diagnostics_subtitle': ['刷新', '城市查询', '并发请求', '单个请求', 'JSON解析',
+                                 '界面绘制', '请求数', '错误数', '缓存命中', '接收流量'],
+        'diagnostics_units': ['毫秒', '毫秒', '毫秒', '毫秒', '毫秒', '毫秒', '', '', '%', 'KB'],
+        'dump_metrics_command': '导出诊断信息',
+        'metrics_dumped': '诊断信息已保存到{}',
+        'start_trace_command': '开始跟踪',
+        'stop_trace_command': '停止跟踪并保存',
+        'trace_saved': '已保存{}个跟踪片段到{}\n可在chrome://tracing或ui.perfetto.dev中打开',
     }
 }    
 
@@ -0,0 +1,273 @@
+# run_benchmarks.py
+# Description: benchmarks of the hot paths, with a saved baseline and a regression report
+#     - predict_city: every keystroke of some typed city names, over all_city.csv
+#     - load_all_cities: parsing all_city.csv at startup
+#     - build_city_index: building the prefix index of predict_city at startup
+#     - update_weather: a full refresh cycle of current city against a local MockQWeather server
+#     - chart_7d, chart_24h: Chart7DaysPage.update and Chart24HoursPage.update rendered with Agg
+# Usage(from the root of the project):
+#     python -m benchmarks.run_benchmarks                  compare with benchmarks/baseline.json
+#     python -m benchmarks.run_benchmarks --save-baseline  save the results as the new baseline
+# By Monster Kid
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+
+# matplotlib must use Agg before anything imports pyplot, charts are rendered without a display
+import matplotlib
+matplotlib.use('Agg')
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+# SimHei is missing on most machines without Chinese fonts, the fallback warning is printed at every draw
+logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+from WeatherAssistant import WeatherAssistant
+from utils.predict_city import predict_city, CityIndex
+from utils.MockQWeather import MockQWeather
+from utils.RateLimiter import RateLimiter
+from utils.SerialPages import Chart7DaysPage, Chart24HoursPage
+
+# The file of the saved baseline
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# A benchmark is a regression if its median is slower than the baseline by this ratio
+THRESHOLD = 0.25
+# Names typed in the search box, every prefix is a keystroke
+TYPED_NAMES = {
+    'English': ['Beijing', 'London', 'New York', 'Shijiazhuang', 'San Francisco'],
+    'Chinese': ['北京', '石家庄', '上海', '阜新'],
+}
+# City of the update_weather benchmark
+BENCHMARK_CITY = 'Beijing'
+
+
+def measure(function, repeat: int, warmup: int = 1) -> dict:
+    """
+    Run a function many times and measure it
+    Parameters:
+        :param function: function without arguments
+        :param repeat: number of measured runs(int)
+        :param warmup: number of runs before measuring(int)
+    Return:
+        :return: {'runs', 'min', 'median', 'mean', 'p95', 'max'} in milliseconds(dict)
+    """
+
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'runs': repeat,
+        'min': samples[0],
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples),
+        'p95': samples[min(len(samples) - 1, int(0.95 * len(samples)))],
+        'max': samples[-1],
+    }
+
+
+## --- Benchmarks --- ##
+
+def bench_predict_city(all_cities: dict, city_index: CityIndex, repeat: int) -> dict:
+    """
+    predict_city for every keystroke of TYPED_NAMES with the prefix index, like the search box.
+    The time is of one keystroke
+    """
+
+    keystrokes = [(name[:i], language) for language, names in TYPED_NAMES.items()
+                  for name in names for i in range(1, len(name) + 1)]
+    index = {'i': 0}
+
+    def keystroke():
+        text, language = keystrokes[index['i'] % len(keystrokes)]
+        index['i'] += 1
+        predict_city(text, all_cities, language=language, index=city_index)
+
+    return measure(keystroke, repeat * len(keystrokes), warmup=len(keystrokes))
+
+
+def bench_load_all_cities(weather_assistant: WeatherAssistant, repeat: int) -> dict:
+    """
+    WeatherAssistant.load_all_cities, parsing all_city.csv at startup
+    """
+    return measure(weather_assistant.load_all_cities, repeat)
+
+
+def bench_build_city_index(all_cities: dict, repeat: int) -> dict:
+    """
+    Building the prefix index of all cities at startup
+    """
+    return measure(lambda: CityIndex(all_cities), repeat)
+
+
+def bench_update_weather(weather_assistant: WeatherAssistant, repeat: int) -> dict:
+    """
+    A full update_weather cycle against the mock server: the 8 requests of the fan-out, parsing and storing
+    The cache and the snapshots are cleared before each cycle, so every request is sent.
+    The location is resolved once in the warmup, like in the app
+    """
+
+    def cycle():
+        weather_assistant.get_weather.cache.invalidate()
+        weather_assistant.snapshots.clear()
+        weather_assistant.update_weather()
+
+    return measure(cycle, repeat)
+
+
+class AggChart7DaysPage(Chart7DaysPage):
+    """
+    Chart7DaysPage rendered with Agg instead of a Tk canvas
+    """
+
+    def __init__(self, language: str = 'English'):
+        # no Tk widget is created
+        self.language = language
+        self.fig = Figure(figsize=(8, 3))
+        self.ax = self.fig.add_subplot(111)
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.title = ''
+
+
+class AggChart24HoursPage(Chart24HoursPage):
+    """
+    Chart24HoursPage rendered with Agg instead of a Tk canvas
+    """
+
+    def __init__(self, language: str = 'English'):
+        # the figure is 4 times as wide as the window, like update_size does
+        self.language = language
+        self.fig = Figure(figsize=(32, 3))
+        self.ax = self.fig.add_subplot(111)
+        self.fig_canvas = FigureCanvasAgg(self.fig)
+        self.title = ''
+
+    def update_size(self, *args):
+        # the size is fixed, only the draw of update_size is kept
+        self.fig_canvas.draw()
+
+
+def bench_charts(model, repeat: int) -> dict:
+    """
+    Chart7DaysPage.update and Chart24HoursPage.update, rendered with Agg
+    """
+    page_7d = AggChart7DaysPage()
+    page_24h = AggChart24HoursPage()
+    return {
+        'chart_7d': measure(lambda: page_7d.update(model.daily), repeat),
+        'chart_24h': measure(lambda: page_24h.update(model.hourly), repeat),
+    }
+
+
+## --- Runner --- ##
+
+def run(repeat: int, latency: float) -> dict:
+    """
+    Run all the benchmarks
+    Parameters:
+        :param repeat: number of measured runs of each benchmark(int)
+        :param latency: latency of the mock server, in seconds(float)
+    Return:
+        :return: {name: measurement}(dict)
+    """
+
+    results = {}
+    server = MockQWeather(port=0, latency=latency, seed=0).start()
+    store_file = os.path.join(tempfile.mkdtemp(), 'weather.db')
+    # do not touch the store of the user
+    WeatherAssistant.STORE_FILE = store_file
+    weather_assistant = WeatherAssistant(do_not_update=True, base_url=server.url)
+    # measure the pipeline, not the throttle of the API quota
+    weather_assistant.get_weather.rate_limiter = RateLimiter(float('inf'), float('inf'), daily_budget=0)
+    try:
+        results['predict_city'] = bench_predict_city(weather_assistant.all_cities, weather_assistant.city_index,
+                                                     repeat)
+        results['load_all_cities'] = bench_load_all_cities(weather_assistant, repeat)
+        results['build_city_index'] = bench_build_city_index(weather_assistant.all_cities, repeat)
+        # the city list of the user is not changed
+        weather_assistant.current_city = BENCHMARK_CITY
+        results['update_weather'] = bench_update_weather(weather_assistant, repeat)
+        results.update(bench_charts(weather_assistant.model, repeat))
+    finally:
+        weather_assistant.close()
+        server.stop()
+    return results
+
+
+def report(results: dict, baseline: dict, threshold: float) -> list:
+    """
+    Print the results and compare the medians with the baseline
+    Return:
+        :return: names of the regressed benchmarks(list)
+    """
+
+    regressions = []
+    print('{:<18}{:>12}{:>12}{:>12}{:>14}'.format('benchmark', 'median(ms)', 'p95(ms)', 'base(ms)', 'change'))
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            base_text, change_text = '-', 'new'
+        else:
+            change = result['median'] / base['median'] - 1
+            base_text = '{:.3f}'.format(base['median'])
+            change_text = '{:+.1%}'.format(change)
+            if change > threshold:
+                change_text += ' SLOWER'
+                regressions.append(name)
+        print('{:<18}{:>12.3f}{:>12.3f}{:>12}{:>14}'.format(name, result['median'], result['p95'], base_text,
+                                                            change_text))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the hot paths of Weather Assistant')
+    parser.add_argument('--repeat', type=int, default=20, help='measured runs of each benchmark')
+    parser.add_argument('--latency', type=float, default=0, help='latency of the mock server, in seconds')
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='baseline file')
+    parser.add_argument('--save-baseline', action='store_true', help='save the results as the baseline')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help='slowdown of the median reported as a regression, 0.25 means 25%%')
+    parser.add_argument('--output', default=None, help='also write the results to this json file')
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.latency)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f).get('results', {})
+    regressions = report(results, baseline, args.threshold)
+
+    document = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+            'latency': args.latency,
+        },
+        'results': results,
+    }
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(document, f, indent=2)
+        print('Baseline saved to', args.baseline)
+    elif regressions:
+        print('Regressions:', ', '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# test_circuit_breaker.py
+# Description: tests of CircuitBreaker, the closed, open and half-open states
+# By Monster Kid
+
+import pytest
+
+import utils.CircuitBreaker
+from utils.CircuitBreaker import CircuitBreaker
+
+
+class FakeTime(object):
+    """
+    A clock that only moves when the test advances it
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(utils.CircuitBreaker, 'time', clock)
+    return clock
+
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.failure_threshold):
+        assert breaker.allow()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    # a success resets the count
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.get_state() == 'closed'
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.get_state() == 'open'
+    assert not breaker.allow()
+
+
+def test_half_open_one_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    clock.now += 59
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.get_state() == 'half_open'
+    # only one trial call at once
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.get_state() == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_trial_opens_again(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    clock.now += 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.get_state() == 'open'
+    assert not breaker.allow()
+    clock.now += 60
+    assert breaker.allow()
+
+
+def test_released_trial(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    open_breaker(breaker)
+    clock.now += 60
+    assert breaker.allow()
+    # a cancelled trial gives its slot back, the circuit stays half-open
+    breaker.release()
+    assert breaker.get_state() == 'half_open'
+    assert breaker.allow()
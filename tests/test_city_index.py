@@ -0,0 +1,92 @@
+# test_city_index.py
+# Description: tests of CityIndex, the prefix index of the predictions of the search box
+# By Monster Kid
+
+import pytest
+
+from utils.predict_city import CityIndex, normalize_name, predict_city
+
+# (English name, Chinese name, English country name)
+CITIES = [
+    ('Beijing', '北京', 'China'),
+    ('Beihai', '北海', 'China'),
+    ('Shanghai', '上海', 'China'),
+    ('Shangrao', '上饶', 'China'),
+    ('Berlin', '柏林', 'Germany'),
+    ('Bern', '伯尔尼', 'Switzerland'),
+    ('New York', '纽约', 'United States'),
+    ('New Delhi', '新德里', 'India'),
+    ('Newcastle', '纽卡斯尔', 'United Kingdom'),
+    ('São Paulo', '圣保罗', 'Brazil'),
+]
+
+
+@pytest.fixture(scope='module')
+def cities() -> dict:
+    """
+    A city dict with the columns of WeatherAssistant.load_all_cities
+    """
+    cities = {}
+    for name_en, name_zh, country_en in CITIES:
+        cities[name_en] = {
+            'zh': {'Name': name_zh, 'SearchKey': normalize_name(name_zh, 'Chinese')},
+            'en': {'Name': name_en, 'CountryName': country_en, 'SearchKey': normalize_name(name_en, 'English')},
+            'type': 'city',
+        }
+    ranked = sorted(cities.values(), key=lambda city: (city['en']['CountryName'] != 'China', city['en']['Name']))
+    for rank, city in enumerate(ranked):
+        city['rank'] = rank
+    return cities
+
+
+@pytest.fixture(scope='module')
+def index(cities) -> CityIndex:
+    return CityIndex(cities)
+
+
+def names(predictions: list) -> list:
+    return [city['en']['Name'] for city in predictions]
+
+
+def test_normalize_name():
+    assert normalize_name('New York', 'English') == 'new york'
+    assert normalize_name('São Paulo', 'English') == 'so paulo'
+    assert normalize_name('new-y 1', 'English') == 'newy '
+    assert normalize_name('北京', 'Chinese') == '北京'
+
+
+def test_rank_order(index):
+    # Chinese cities first, then by English name
+    assert names(index.search('be', 10)) == ['Beihai', 'Beijing', 'Berlin', 'Bern']
+    assert names(index.search('Be', 2)) == ['Beihai', 'Beijing']
+    assert names(index.search('new', 10)) == ['New Delhi', 'New York', 'Newcastle']
+    assert names(index.search('new ', 10)) == ['New Delhi', 'New York']
+
+
+def test_chinese(index):
+    assert names(index.search('北', 5, 'Chinese')) == ['Beihai', 'Beijing']
+    assert names(index.search('纽', 5, 'Chinese')) == ['New York', 'Newcastle']
+
+
+def test_no_match(index):
+    assert index.search('', 5) == []
+    assert index.search('123', 5) == []
+    assert index.search('xyz', 5) == []
+    assert index.search('beijingx', 5) == []
+
+
+def test_search_does_not_expose_the_buckets(index):
+    predictions = index.search('be', 10)
+    predictions.clear()
+    assert len(index.search('be', 10)) == 4
+
+
+def test_same_as_scan(cities, index):
+    # every prefix of every name, the index and the scan of the city dict give the same predictions
+    for language, alias in (('English', 'en'), ('Chinese', 'zh')):
+        for city in cities.values():
+            name = city[alias]['Name']
+            for end in range(1, len(name) + 1):
+                for n_entries in (1, 3, 10):
+                    expected = predict_city(name[:end], cities, n_entries, language)
+                    assert predict_city(name[:end], cities, n_entries, language, index=index) == expected
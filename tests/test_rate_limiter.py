@@ -0,0 +1,93 @@
+# test_rate_limiter.py
+# Description: tests of RateLimiter, the token bucket, the daily budget and the backoff
+# By Monster Kid
+
+import pytest
+
+import utils.RateLimiter
+from utils.RateLimiter import RateLimiter
+
+
+class FakeTime(object):
+    """
+    A clock that only moves when the test advances it
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(utils.RateLimiter, 'time', clock)
+    return clock
+
+
+def test_burst_then_delay(clock):
+    limiter = RateLimiter(rate=2, burst=3, daily_budget=0)
+    # a burst is sent at once
+    assert [limiter.reserve() for _ in range(3)] == [(None, 0)] * 3
+    # then the requests are spaced by 1 / rate
+    assert limiter.reserve() == (None, pytest.approx(0.5))
+    assert limiter.reserve() == (None, pytest.approx(1.0))
+
+
+def test_refill(clock):
+    limiter = RateLimiter(rate=2, burst=3, daily_budget=0)
+    for _ in range(3):
+        limiter.reserve()
+    clock.now += 1
+    assert limiter.state()['tokens'] == pytest.approx(2)
+    # the bucket never holds more than burst
+    clock.now += 100
+    assert limiter.state()['tokens'] == pytest.approx(3)
+
+
+def test_no_wait(clock):
+    limiter = RateLimiter(rate=1, burst=1, daily_budget=0)
+    assert limiter.reserve(wait=False) == (None, 0)
+    assert limiter.reserve(wait=False) == ('429', 0)
+    assert limiter.state()['blocked'] == 1
+
+
+def test_daily_budget(clock):
+    limiter = RateLimiter(rate=100, burst=100, daily_budget=2)
+    assert limiter.reserve()[0] is None
+    assert limiter.reserve()[0] is None
+    assert limiter.reserve() == ('402', 0)
+    # wait until tomorrow
+    assert limiter.next_delay(60) >= min(60, limiter.seconds_to_tomorrow())
+
+
+def test_402_uses_up_the_budget(clock):
+    limiter = RateLimiter(rate=100, burst=100, daily_budget=1000)
+    limiter.report('402')
+    assert limiter.reserve() == ('402', 0)
+
+
+def test_backoff(clock):
+    limiter = RateLimiter(rate=100, burst=100, daily_budget=0, backoff_base=2, backoff_max=600)
+    limiter.report('429')
+    # the backoff of the first 429 is in [backoff_base / 2, backoff_base]
+    assert 1 <= limiter.state()['backoff'] <= 2
+    assert limiter.reserve() == ('429', 0)
+    clock.now += 2
+    assert limiter.reserve()[0] is None
+    # it doubles for each consecutive 429
+    limiter.report('429')
+    assert 2 <= limiter.state()['backoff'] <= 4
+    # the scheduled refreshes slow down, until a 200
+    assert limiter.next_delay(60) == 240
+    limiter.report('200')
+    assert limiter.next_delay(60) == 60
+
+
+def test_backoff_max(clock):
+    limiter = RateLimiter(rate=100, burst=100, daily_budget=0, backoff_base=2, backoff_max=10)
+    for _ in range(10):
+        limiter.report('429')
+    assert limiter.state()['backoff'] <= 10
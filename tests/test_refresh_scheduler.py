@@ -0,0 +1,96 @@
+# test_refresh_scheduler.py
+# Description: tests of RefreshScheduler, the cadence of each section and the alignment to updateTime
+# By Monster Kid
+
+import threading
+
+import pytest
+
+import utils.RefreshScheduler
+from utils.RefreshScheduler import RefreshScheduler
+
+
+class FakeTime(object):
+    """
+    A clock that only moves when the test advances it, monotonic time starts at 0
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.unix = 1600000000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.unix + self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeTime()
+    monkeypatch.setattr(utils.RefreshScheduler, 'time', clock)
+    return clock
+
+
+def test_interval_without_update_time(clock):
+    scheduler = RefreshScheduler(lambda sections: None)
+    assert scheduler.compute_next_due('rain', 0) == 300
+    assert scheduler.compute_next_due('7d', 0) == 4 * 60 * 60
+
+
+def test_aligned_to_update_time(clock):
+    update_times = {'now': clock.time() - 60}
+    scheduler = RefreshScheduler(lambda sections: None, update_times.get, intervals={'now': 60})
+    # updated 1 minute ago, the provider publishes every 10 minutes: wait 9 minutes and the slack
+    assert scheduler.compute_next_due('now', 0) == pytest.approx(9 * 60 + RefreshScheduler.SLACK)
+    # data older than the provider period are due after the interval
+    update_times['now'] = clock.time() - 3600
+    assert scheduler.compute_next_due('now', 0) == 60
+    # warnings can change at any time
+    update_times['warning'] = clock.time()
+    assert scheduler.compute_next_due('warning', 0) == 300
+
+
+def test_delay_function(clock):
+    scheduler = RefreshScheduler(lambda sections: None, delay_function=lambda interval: interval * 2)
+    assert scheduler.compute_next_due('rain', 0) == 600
+
+
+def test_reschedule_some_sections(clock):
+    scheduler = RefreshScheduler(lambda sections: None)
+    before = dict(scheduler.next_due)
+    clock.now = 100
+    scheduler.reschedule(['now'])
+    assert scheduler.next_due['now'] == 100 + 300
+    assert {section: due for section, due in scheduler.next_due.items() if section != 'now'} == \
+        {section: due for section, due in before.items() if section != 'now'}
+    scheduler.reschedule()
+    assert scheduler.next_due['7d'] == 100 + 4 * 60 * 60
+
+
+def test_set_interval(clock):
+    scheduler = RefreshScheduler(lambda sections: None)
+    scheduler.set_interval('now', 1800)
+    assert scheduler.intervals['now'] == 1800
+    assert scheduler.next_due['now'] == 1800
+
+
+def test_due_sections_refreshed_together():
+    calls = []
+    refreshed = threading.Event()
+
+    def function(sections):
+        calls.append(sorted(sections))
+        refreshed.set()
+
+    intervals = {section: 3600 for section in RefreshScheduler.DEFAULT_INTERVALS}
+    intervals.update({'now': 0.05, 'rain': 0.05})
+    scheduler = RefreshScheduler(function, intervals=intervals)
+    scheduler.start()
+    try:
+        assert refreshed.wait(5)
+    finally:
+        scheduler.stop()
+        scheduler.join(5)
+    assert calls[0] == ['now', 'rain']
@@ -0,0 +1,84 @@
+# test_response_cache.py
+# Description: tests of ResponseCache, the TTL and the LRU eviction
+# By Monster Kid
+
+import utils.ResponseCache
+from utils.ResponseCache import ResponseCache
+
+
+class FakeTime(object):
+    """
+    A clock that only moves when the test advances it
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+def make_cache(monkeypatch, **kwargs):
+    clock = FakeTime()
+    monkeypatch.setattr(utils.ResponseCache, 'time', clock)
+    return ResponseCache({'now': 60, '7d': 3600}, **kwargs), clock
+
+
+def test_get_put(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    assert cache.get(('now', 'Beijing', 'en')) is None
+    cache.put(('now', 'Beijing', 'en'), {'code': '200'})
+    assert cache.get(('now', 'Beijing', 'en')) == {'code': '200'}
+    assert cache.get(('now', 'Beijing', 'zh')) is None
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['size']) == (1, 2, 1)
+
+
+def test_ttl_per_endpoint(monkeypatch):
+    cache, clock = make_cache(monkeypatch)
+    cache.put(('now', 'Beijing', 'en'), 'now')
+    cache.put(('7d', 'Beijing', 'en'), '7d')
+    clock.now += 60
+    # expired entries are missing, and removed
+    assert cache.get(('now', 'Beijing', 'en')) is None
+    assert cache.get(('7d', 'Beijing', 'en')) == '7d'
+    assert cache.stats()['size'] == 1
+    # an explicit TTL overrides the TTL of the endpoint
+    cache.put(('now', 'Beijing', 'en'), 'now', ttl=120)
+    clock.now += 100
+    assert cache.get(('now', 'Beijing', 'en')) == 'now'
+
+
+def test_not_cached(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    # endpoints without a TTL are not cached by default
+    cache.put(('warning', 'Beijing', 'en'), 'warning')
+    cache.put(('now', 'Beijing', 'en'), 'now', ttl=0)
+    assert cache.stats()['size'] == 0
+    cache, _ = make_cache(monkeypatch, max_size=0)
+    cache.put(('now', 'Beijing', 'en'), 'now')
+    assert cache.get(('now', 'Beijing', 'en')) is None
+
+
+def test_lru_eviction(monkeypatch):
+    cache, _ = make_cache(monkeypatch, max_size=2)
+    cache.put(('now', 'a', 'en'), 'a')
+    cache.put(('now', 'b', 'en'), 'b')
+    # a is used, so b is the least recently used
+    assert cache.get(('now', 'a', 'en')) == 'a'
+    cache.put(('now', 'c', 'en'), 'c')
+    assert cache.get(('now', 'b', 'en')) is None
+    assert cache.get(('now', 'a', 'en')) == 'a'
+    assert cache.get(('now', 'c', 'en')) == 'c'
+    assert cache.stats()['evictions'] == 1
+
+
+def test_invalidate(monkeypatch):
+    cache, _ = make_cache(monkeypatch)
+    cache.put(('now', 'a', 'en'), 'now')
+    cache.put(('7d', 'a', 'en'), '7d')
+    cache.invalidate('now')
+    assert cache.get(('now', 'a', 'en')) is None
+    assert cache.get(('7d', 'a', 'en')) == '7d'
+    cache.invalidate()
+    assert cache.stats()['size'] == 0
@@ -0,0 +1,91 @@
+# test_response_store.py
+# Description: tests of ResponseStore, the SQLite store of the last good responses
+# By Monster Kid
+
+import multiprocessing
+
+import pytest
+
+from utils.ResponseStore import ResponseStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResponseStore(str(tmp_path / 'weather.db'))
+    yield store
+    store.close()
+
+
+def test_save_load(store):
+    assert store.load('Beijing', 'en', 'now') == (None, None)
+    store.save('Beijing', 'en', 'now', {'code': '200', 'now': {'text': '晴'}}, saved_at=100)
+    assert store.load('Beijing', 'en', 'now') == ({'code': '200', 'now': {'text': '晴'}}, 100)
+    # the language is part of the key, a save replaces the previous response
+    assert store.load('Beijing', 'zh', 'now') == (None, None)
+    store.save('Beijing', 'en', 'now', {'code': '200'}, saved_at=200)
+    assert store.load('Beijing', 'en', 'now') == ({'code': '200'}, 200)
+
+
+def test_save_weather_only_good(store):
+    store.save_weather('Beijing', 'en', {'now': {'code': '200'}, '7d': {'code': '429'}, 'rain': None})
+    weather, saved_at = store.load_weather('Beijing', 'en', ['now', '7d', 'rain'])
+    assert weather == {'now': {'code': '200'}, '7d': None, 'rain': None}
+    assert saved_at is not None
+
+
+def test_load_weather_oldest_time(store):
+    store.save('Beijing', 'en', 'now', {'code': '200'}, saved_at=300)
+    store.save('Beijing', 'en', '7d', {'code': '200'}, saved_at=100)
+    store.save('Beijing', 'en', 'air', {'code': '200'}, saved_at=50)
+    # only the requested endpoints count
+    weather, saved_at = store.load_weather('Beijing', 'en', ['now', '7d'])
+    assert set(weather) == {'now', '7d'}
+    assert saved_at == 100
+    assert store.load_weather('Shanghai', 'en', ['now']) == ({'now': None}, None)
+
+
+def test_location(store):
+    assert store.load_location('Beijing') is None
+    store.save_location('Beijing', {'id': '101010100', 'lat': '39.90', 'lon': '116.40'})
+    assert store.load_location('Beijing') == {'id': '101010100', 'lat': '39.90', 'lon': '116.40'}
+
+
+def test_persistent(tmp_path):
+    path = str(tmp_path / 'weather.db')
+    store = ResponseStore(path)
+    store.save('Beijing', 'en', 'now', {'code': '200'}, saved_at=100)
+    store.close()
+    store = ResponseStore(path)
+    assert store.load('Beijing', 'en', 'now') == ({'code': '200'}, 100)
+    store.close()
+
+
+def save_responses(path: str, shard: int):
+    """
+    Process: save responses, like a shard of BatchWeather
+    """
+    store = ResponseStore(path)
+    for i in range(100):
+        store.save('city{}'.format(i), 'en', 'now{}'.format(shard), {'code': '200'})
+        store.save_location('city{}-{}'.format(shard, i), {'id': str(i), 'lat': '0', 'lon': '0'})
+    store.close()
+
+
+def test_processes_share_the_store(tmp_path):
+    path = str(tmp_path / 'weather.db')
+    processes = [multiprocessing.Process(target=save_responses, args=(path, shard)) for shard in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(30)
+    # no writer failed with "database is locked"
+    assert [process.exitcode for process in processes] == [0] * 4
+    store = ResponseStore(path)
+    assert store.load('city99', 'en', 'now3')[0] == {'code': '200'}
+    assert store.load_location('city2-0') == {'id': '0', 'lat': '0', 'lon': '0'}
+    store.close()
+
+
+def test_wal_mode(store):
+    # readers don't block the writer of another process
+    assert store.connection.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
@@ -0,0 +1,58 @@
+# test_shared_rate_limiter.py
+# Description: tests of SharedRateLimiter, one rate limiter for many processes
+# By Monster Kid
+
+import multiprocessing
+
+from utils.RateLimiter import SharedRateLimiter
+
+
+def reserve_requests(limiter: SharedRateLimiter, count: int, codes):
+    """
+    Process: reserve some requests, and send back the codes
+    """
+    for _ in range(count):
+        codes.put(limiter.reserve(wait=False)[0])
+
+
+def report_429(limiter: SharedRateLimiter):
+    """
+    Process: report a 429
+    """
+    limiter.report('429')
+
+
+def run_processes(target, args_list):
+    processes = [multiprocessing.Process(target=target, args=args) for args in args_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(10)
+    assert [process.exitcode for process in processes] == [0] * len(processes)
+
+
+def test_daily_budget_shared_by_processes():
+    limiter = SharedRateLimiter(rate=1000, burst=1000, daily_budget=10)
+    codes = multiprocessing.Queue()
+    run_processes(reserve_requests, [(limiter, 5, codes) for _ in range(4)])
+    results = [codes.get(timeout=5) for _ in range(20)]
+    # the 4 processes together send 10 requests, not 10 each
+    assert results.count(None) == 10
+    assert results.count('402') == 10
+    assert limiter.state()['daily_used'] == 10
+
+
+def test_tokens_shared_by_processes():
+    limiter = SharedRateLimiter(rate=0.001, burst=6, daily_budget=0)
+    codes = multiprocessing.Queue()
+    run_processes(reserve_requests, [(limiter, 3, codes) for _ in range(3)])
+    results = [codes.get(timeout=5) for _ in range(9)]
+    assert results.count(None) == 6
+    assert limiter.state()['blocked'] == 3
+
+
+def test_backoff_seen_by_all_processes():
+    limiter = SharedRateLimiter(rate=1000, burst=1000, daily_budget=0, backoff_base=60)
+    run_processes(report_429, [(limiter,)])
+    assert limiter.state()['failures'] == 1
+    assert limiter.reserve() == ('429', 0)
@@ -0,0 +1,107 @@
+# test_single_flight.py
+# Description: tests of SingleFlight and AsyncSingleFlight, the request coalescing
+# By Monster Kid
+
+import time
+import asyncio
+import threading
+
+import pytest
+
+from utils.SingleFlight import SingleFlight, AsyncSingleFlight
+
+
+def test_threads_share_one_call():
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'weather'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flights.do('Beijing', function)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(flights.do('Beijing', function)))
+                 for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    # the followers are waiting for the leader
+    deadline = time.monotonic() + 5
+    while flights.shared < 3 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+    assert results == ['weather'] * 4
+    assert len(calls) == 1
+    assert flights.calls == {}
+
+
+def test_threads_exception_and_next_call():
+    flights = SingleFlight()
+
+    def fail():
+        raise ValueError('offline')
+
+    with pytest.raises(ValueError):
+        flights.do('Beijing', fail)
+    # a finished call is not shared with the next callers
+    assert flights.do('Beijing', lambda: 'weather') == 'weather'
+    assert flights.shared == 0
+
+
+def test_async_share_one_call():
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return 'weather'
+
+    async def main():
+        flights = AsyncSingleFlight()
+        results = await asyncio.gather(*[flights.do('Beijing', fetch) for _ in range(4)],
+                                       flights.do('Shanghai', fetch))
+        return flights, results
+
+    flights, results = asyncio.run(main())
+    assert results == ['weather'] * 5
+    assert len(calls) == 2
+    assert flights.shared == 3
+    assert flights.calls == {}
+
+
+def test_async_cancelled_caller_does_not_cancel_the_call():
+    async def fetch():
+        await asyncio.sleep(0.05)
+        return 'weather'
+
+    async def main():
+        flights = AsyncSingleFlight()
+        first = asyncio.ensure_future(flights.do('Beijing', fetch))
+        second = asyncio.ensure_future(flights.do('Beijing', fetch))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == 'weather'
+
+
+def test_async_exception_to_all_callers():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('offline')
+
+    async def main():
+        flights = AsyncSingleFlight()
+        return await asyncio.gather(flights.do('Beijing', fail), flights.do('Beijing', fail),
+                                    return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(result) for result in results] == [ValueError, ValueError]
@@ -0,0 +1,79 @@
+# test_weather_model.py
+# Description: tests of WeatherModel, parsing the responses made by MockQWeather
+# By Monster Kid
+
+import numpy as np
+import pytest
+
+from utils.MockQWeather import MockQWeather
+from utils.WeatherModel import WeatherModel, to_dict
+
+
+@pytest.fixture(scope='module')
+def weather():
+    # the responses are made without starting the server
+    mock = MockQWeather(port=0, seed=0)
+    return {endpoint: mock.make_response(endpoint, 'Beijing', 'en')
+            for endpoint in ('now', '7d', '24h', 'rain', 'warning', 'air', 'indices', 'air_forecast')}
+
+
+def test_parse(weather):
+    model = WeatherModel.parse(weather)
+    assert model.errors == []
+    assert model.now.temp == int(weather['now']['now']['temp'])
+    assert model.now.update_time == weather['now']['updateTime'][:10] + ' ' + weather['now']['updateTime'][11:16]
+    assert len(model.daily) == 7
+    assert model.daily.temp_max.dtype == np.int16
+    assert model.daily.temp_max.tolist() == [int(day['tempMax']) for day in weather['7d']['daily']]
+    assert model.daily.today['fxDate'] == weather['7d']['daily'][0]['fxDate']
+    assert len(model.hourly) == 24
+    assert model.hourly.time[0] == weather['24h']['hourly'][0]['fxTime'][11:16]
+    assert len(model.minutely) == 24
+    assert model.minutely.summary == weather['rain']['summary']
+
+
+def test_missing_and_failed_sections(weather):
+    weather = dict(weather, now=None, rain={'code': '429'})
+    model = WeatherModel.parse(weather)
+    assert model.now is None
+    assert model.minutely is None
+    # a missing or failed response is not a parse error
+    assert model.errors == []
+
+
+def test_malformed_section(weather, caplog):
+    weather = dict(weather, now={'code': '200', 'now': {'temp': 'warm'}, 'updateTime': ''},
+                   **{'7d': {'code': '200', 'daily': []}})
+    model = WeatherModel.parse(weather)
+    assert model.now is None
+    assert model.daily is None
+    assert model.hourly is not None
+    assert model.errors == ['now', '7d']
+    assert 'cannot parse the now response' in caplog.text
+
+
+def test_reuse_previous_sections(weather):
+    previous = WeatherModel.parse(weather)
+    model = WeatherModel.parse(dict(weather, now=None), previous, sections=['now'])
+    assert model.now is None
+    # the sections that did not change are the same objects
+    assert model.daily is previous.daily
+    assert model.hourly is previous.hourly
+
+
+def test_compact(weather):
+    compact = WeatherModel.compact(weather)
+    assert 'daily' not in compact['7d']
+    assert 'hourly' not in compact['24h']
+    assert 'minutely' not in compact['rain']
+    assert compact['7d']['updateTime'] == weather['7d']['updateTime']
+    # the responses are copied, not changed
+    assert 'daily' in weather['7d']
+    assert compact['now'] is weather['now']
+
+
+def test_to_dict(weather):
+    data = to_dict(WeatherModel.parse(weather).hourly)
+    assert isinstance(data['temp'], list)
+    assert isinstance(data['time'], list)
+    assert len(data['temp']) == 24
@@ -0,0 +1,198 @@
+# BackgroundRefresher.py
+# Description: a background refresher, which keeps the weather of every saved city warm,
+#     so shifting city is a read of the snapshots instead of a request
+# By Monster Kid
+
+import time
+import heapq
+import asyncio
+
+class BackgroundRefresher(object):
+    """
+    A task in the event loop of a WeatherAssistant that refreshes the weather of all the cities in the city list
+    - Priority queue: current city first, then the stalest city(never fetched or prefetched cities are the stalest)
+    - At most `concurrency` cities are refreshed at once
+    - A city is refreshed when its snapshot is older than `max_age` seconds
+    - The ages are read from the snapshots in memory, the stored weather of a city is loaded once in an executor,
+      so a tick never waits for SQLite in the event loop
+    - A city whose refresh failed(offline, not found) is retried after an exponential backoff, not at every tick
+    Methods:
+        - start: start the refresher in the event loop of the assistant
+        - wake: recompute the queue now, e.g. after the city list or current city changed
+        - stop: stop the refresher
+    """
+
+    def __init__(self, weather_assistant, concurrency: int = 2, max_age: float = 600, tick: float = 30,
+                 on_refreshed=None, backoff_base: float = 60, backoff_max: float = 3600):
+        """
+        Init BackgroundRefresher
+        Parameters:
+            :param weather_assistant: the WeatherAssistant whose cities are refreshed
+            :param concurrency: max number of cities refreshed at once(int)
+            :param max_age: a city is refreshed when its weather is older than this, in seconds(float)
+            :param tick: seconds between two checks of the ages(float)
+            :param on_refreshed: function(city_name), called in the event loop after a city is refreshed
+            :param backoff_base: seconds before retrying a city after its first failure, doubled on each failure(float)
+            :param backoff_max: max seconds before retrying a city(float)
+        """
+
+        self.weather_assistant = weather_assistant
+        self.concurrency = concurrency
+        self.max_age = max_age
+        self.tick = tick
+        self.on_refreshed = on_refreshed
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # cities being refreshed
+        self.in_flight = set()
+        # cities that failed {city_name: (monotonic time of the next try, number of failures)}, cleared on success
+        self.retry_at = {}
+        # (city, language) whose stored weather was loaded into the snapshots
+        self.store_checked = set()
+        # the task and the events, created in the event loop
+        self.future = None
+        self.semaphore = None
+        self.wake_event = None
+        self.stopped = False
+
+    def start(self):
+        """
+        Start the refresher in the event loop of the assistant
+        """
+        self.future = asyncio.run_coroutine_threadsafe(self.run(), self.weather_assistant.loop)
+
+    def wake(self):
+        """
+        Recompute the queue now, e.g. after the city list or current city changed
+        Can be called from any thread
+        """
+        self.weather_assistant.loop.call_soon_threadsafe(self.set_wake_event)
+
+    def set_wake_event(self):
+        """
+        Set the wake event, must be called in the event loop
+        """
+        if self.wake_event is not None:
+            self.wake_event.set()
+
+    def stop(self):
+        """
+        Stop the refresher, the task is cancelled, so it does not wait for the next tick
+        """
+        self.stopped = True
+        self.wake()
+        if self.future is not None:
+            self.future.cancel()
+
+    def weather_time(self, city_name: str) -> float:
+        """
+        Time of the weather of a city in the snapshots in memory, 0 if there's none
+        """
+        snapshot = self.weather_assistant.snapshots.get((city_name, self.weather_assistant.language))
+        # a prefetched snapshot only has some sections, complete it as soon as possible
+        return snapshot['time'] if snapshot is not None and not snapshot['partial'] else 0
+
+    def priority(self, city_name: str) -> tuple:
+        """
+        Priority of a city, smaller is sooner: current city first, then the stalest
+        Return:
+            :return: (not current city, time of the weather)(tuple), None if the city is fresh, being refreshed
+                or waiting for its retry
+        """
+
+        if city_name in self.in_flight:
+            return None
+        retry = self.retry_at.get(city_name)
+        if retry is not None and time.monotonic() < retry[0]:
+            return None
+        weather_time = self.weather_time(city_name)
+        if time.time() - weather_time < self.max_age:
+            return None
+        return (city_name != self.weather_assistant.current_city, weather_time)
+
+    async def load_stored_snapshots(self):
+        """
+        Load the stored weather of the cities without a snapshot in memory, in an executor
+        Each city is looked up once per language, the snapshots are kept in memory afterwards
+        """
+
+        weather_assistant = self.weather_assistant
+        loop = asyncio.get_running_loop()
+        for city_name in list(weather_assistant.cities):
+            key = (city_name, weather_assistant.language)
+            if key in weather_assistant.snapshots or key in self.store_checked:
+                continue
+            self.store_checked.add(key)
+            await loop.run_in_executor(None, weather_assistant.read_snapshot, city_name)
+
+    async def build_queue(self) -> list:
+        """
+        Build the priority queue of the cities to refresh
+        Return:
+            :return: heap of (priority, city_name)(list)
+        """
+
+        await self.load_stored_snapshots()
+        queue = []
+        for city_name in list(self.weather_assistant.cities):
+            priority = self.priority(city_name)
+            if priority is not None:
+                queue.append((priority, city_name))
+        heapq.heapify(queue)
+        return queue
+
+    async def refresh(self, city_name: str):
+        """
+        Refresh a city, a semaphore slot must be acquired before
+        """
+
+        try:
+            # shared with the revalidations of read_weather, a city is not refreshed twice at once
+            await self.weather_assistant.revalidate_async(city_name, self.on_refreshed)
+            # current city does not raise when offline, its weather is just not fresher
+            failed = time.time() - self.weather_time(city_name) >= self.max_age
+        except Exception as e:
+            # offline or the city is not found
+            failed = True
+        finally:
+            self.in_flight.discard(city_name)
+            self.semaphore.release()
+        if failed:
+            # retry after backoff_base, doubled on each failure
+            _, failures = self.retry_at.get(city_name, (0, 0))
+            backoff = min(self.backoff_base * 2 ** failures, self.backoff_max)
+            self.retry_at[city_name] = (time.monotonic() + backoff, failures + 1)
+        else:
+            self.retry_at.pop(city_name, None)
+
+    async def run(self):
+        """
+        Run the refresher
+        """
+
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.wake_event = asyncio.Event()
+        while not self.stopped:
+            queue = await self.build_queue()
+            while queue and not self.stopped:
+                await self.semaphore.acquire()
+                # the priorities changed while waiting for a slot(e.g. current city changed)
+                if self.wake_event.is_set():
+                    self.wake_event.clear()
+                    queue = await self.build_queue()
+                    if not queue:
+                        self.semaphore.release()
+                        break
+                _, city_name = heapq.heappop(queue)
+                # it may have been refreshed meanwhile, e.g. by the refresh scheduler
+                if self.priority(city_name) is None:
+                    self.semaphore.release()
+                    continue
+                self.in_flight.add(city_name)
+                asyncio.ensure_future(self.refresh(city_name))
+            # sleep until the next tick, or until woken
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), self.tick)
+            except asyncio.TimeoutError:
+                pass
+            self.wake_event.clear()
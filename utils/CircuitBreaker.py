@@ -0,0 +1,98 @@
+# CircuitBreaker.py
+# Description: a circuit breaker, to stop calling an endpoint that keeps failing
+# By Monster Kid
+
+import time
+import threading
+
+class CircuitBreaker(object):
+    """
+    CircuitBreaker: three states
+    - closed: calls are allowed. After `failure_threshold` consecutive failures, the circuit opens
+    - open: calls are not allowed. After `reset_timeout` seconds, the circuit becomes half-open
+    - half_open: one trial call is allowed. If it succeeds the circuit closes, otherwise it opens again
+    Methods:
+        - allow: whether a call is allowed now
+        - record_success: record a successful call
+        - record_failure: record a failed call
+        - release: give back an allowed call that ended without a result
+        - get_state: get the state of the circuit
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold: int = 3, reset_timeout: float = 60):
+        """
+        Init CircuitBreaker
+        Parameters:
+            :param failure_threshold: consecutive failures to open the circuit(int)
+            :param reset_timeout: seconds before a trial call when the circuit is open(float)
+        """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        # whether the trial call of the half-open state is running
+        self.trial_running = False
+
+    def allow(self) -> bool:
+        """
+        Whether a call is allowed now
+        If True is returned, record_success, record_failure or release must be called after the call
+        """
+
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < self.reset_timeout:
+                    return False
+                self.state = self.HALF_OPEN
+                self.trial_running = False
+            # half open: only one trial call
+            if self.trial_running:
+                return False
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        """
+        Record a successful call, close the circuit
+        """
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trial_running = False
+
+    def record_failure(self):
+        """
+        Record a failed call, open the circuit if needed
+        """
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """
+        Give back an allowed call that ended without a result, e.g. it was cancelled
+        The state is not changed, the next call of the half-open circuit is a trial again
+        """
+        with self.lock:
+            self.trial_running = False
+
+    def get_state(self) -> str:
+        """
+        Get the state of the circuit: 'closed', 'open' or 'half_open'
+        """
+        with self.lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                return self.HALF_OPEN
+            return self.state
@@ -0,0 +1,64 @@
+# EventBus.py
+# Description: a thread-safe publish-subscribe event bus
+#     WeatherAssistant emits an event for each section of the weather that changed, so the UI only redraws those
+# By Monster Kid
+
+import threading
+
+class EventBus(object):
+    """
+    EventBus: functions subscribe to an event name and are called when the event is emitted
+    The subscribers are called in the thread that emits the event, so they must be quick and thread-safe,
+    e.g. mark a part of the UI as changed and let the UI thread redraw it
+    Methods:
+        - subscribe: call a function when an event is emitted
+        - unsubscribe: stop calling a function
+        - emit: call the subscribers of an event
+    """
+
+    def __init__(self):
+        """
+        Init EventBus
+        """
+
+        self.lock = threading.Lock()
+        # {event name: [function]}
+        self.subscribers = {}
+
+    def subscribe(self, event: str, function):
+        """
+        Call a function when an event is emitted
+        Parameters:
+            :param event: name of the event(str)
+            :param function: function(**payload), the payload is given to emit
+        """
+        with self.lock:
+            self.subscribers.setdefault(event, []).append(function)
+
+    def unsubscribe(self, event: str, function):
+        """
+        Stop calling a function when an event is emitted, nothing happens if it's not subscribed
+        """
+        with self.lock:
+            if function in self.subscribers.get(event, []):
+                self.subscribers[event].remove(function)
+
+    def emit(self, event: str, **payload):
+        """
+        Call the subscribers of an event
+        An exception of a subscriber does not stop the others
+        Parameters:
+            :param event: name of the event(str)
+            :param payload: arguments given to the subscribers
+        Return:
+            :return: number of the subscribers called(int)
+        """
+
+        with self.lock:
+            functions = list(self.subscribers.get(event, []))
+        for function in functions:
+            try:
+                function(**payload)
+            except Exception as e:
+                pass
+        return len(functions)
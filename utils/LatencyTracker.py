@@ -0,0 +1,53 @@
+# LatencyTracker.py
+# Description: track recent request latencies of each endpoint and estimate their percentiles
+# By Monster Kid
+
+import threading
+from collections import deque
+
+class LatencyTracker(object):
+    """
+    LatencyTracker: keep the last `window` latencies of each endpoint
+    Methods:
+        - record: record a latency
+        - percentile: get a percentile of the recent latencies
+    """
+
+    def __init__(self, window: int = 100, min_samples: int = 20):
+        """
+        Init LatencyTracker
+        Parameters:
+            :param window: number of latencies kept for each endpoint(int)
+            :param min_samples: percentiles are not estimated with fewer samples(int)
+        """
+
+        self.window = window
+        self.min_samples = min_samples
+        # {endpoint: deque of latencies in seconds}
+        self.samples = {}
+        self.lock = threading.Lock()
+
+    def record(self, endpoint: str, latency: float):
+        """
+        Record a latency of an endpoint, in seconds
+        """
+        with self.lock:
+            if endpoint not in self.samples:
+                self.samples[endpoint] = deque(maxlen=self.window)
+            self.samples[endpoint].append(latency)
+
+    def percentile(self, endpoint: str, q: float = 0.95) -> float:
+        """
+        Get a percentile of the recent latencies of an endpoint
+        Parameters:
+            :param q: the percentile, between 0 and 1(float)
+        Return:
+            :return: the latency in seconds, None if there are not enough samples(float)
+        """
+
+        with self.lock:
+            samples = self.samples.get(endpoint)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
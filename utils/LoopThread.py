@@ -0,0 +1,40 @@
+# LoopThread.py
+# Description: a thread running an asyncio event loop forever,
+#     so that synchronous code can submit coroutines to it
+# By Monster Kid
+
+import asyncio
+import threading
+
+class LoopThread(threading.Thread):
+    """
+    A thread that runs an asyncio event loop forever
+    """
+
+    def __init__(self):
+        super().__init__()
+        # set the thread as daemon
+        self.daemon = True
+        # the event loop (created here, so coroutines can be submitted before the thread starts)
+        self.loop = asyncio.new_event_loop()
+
+    def submit(self, coro):
+        """
+        Submit a coroutine to the event loop
+        Return:
+            :return: a concurrent.futures.Future of the result of the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def stop(self):
+        """
+        Stop the event loop and the thread
+        """
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def run(self):
+        """
+        Run the event loop
+        """
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
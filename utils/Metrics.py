@@ -0,0 +1,195 @@
+# Metrics.py
+# Description: a thread-safe registry of counters and latency histograms
+#     Used to see where the time of a refresh goes: geo lookup, fan-out, parsing or rendering
+# By Monster Kid
+
+import json
+import time
+import bisect
+import threading
+from collections import deque
+
+class MetricsRegistry(object):
+    """
+    MetricsRegistry: counters and histograms, each one identified by a name and labels
+    e.g. inc('responses', endpoint='now', code='200'), observe('request_latency', 0.12, endpoint='now')
+    Methods:
+        - inc: add to a counter
+        - observe: add a sample(in seconds) to a histogram
+        - timer: context manager, observe the time of a block
+        - counter: total of the counters of a name, filtered by labels
+        - histogram: merged histograms of a name, filtered by labels, with percentiles
+        - snapshot: all the metrics as a dict
+        - dump: write the snapshot to a json file
+        - reset: remove all the metrics
+    """
+
+    # Upper bounds of the histogram buckets, in milliseconds. The last bucket has no bound
+    BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+    def __init__(self, window: int = 200):
+        """
+        Init MetricsRegistry
+        Parameters:
+            :param window: number of recent samples kept by each histogram for the percentiles(int)
+        """
+
+        self.window = window
+        self.lock = threading.Lock()
+        # {name: {labels: value}}, labels is a sorted tuple of (label, value)
+        self.counters = {}
+        # {name: {labels: {'count', 'sum', 'buckets', 'recent'}}}
+        self.histograms = {}
+        self.started = time.time()
+
+    @staticmethod
+    def make_labels(labels: dict) -> tuple:
+        """
+        Make the key of the labels
+        """
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    @staticmethod
+    def match(key: tuple, labels: dict) -> bool:
+        """
+        Whether the labels of a series include the given labels
+        """
+        items = dict(key)
+        return all(items.get(name) == str(value) for name, value in labels.items())
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        Add to a counter
+        """
+        key = self.make_labels(labels)
+        with self.lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """
+        Add a sample to a histogram
+        Parameters:
+            :param seconds: the sample, in seconds(float)
+        """
+        key = self.make_labels(labels)
+        ms = seconds * 1000
+        with self.lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = {'count': 0, 'sum': 0, 'buckets': [0] * (len(self.BUCKETS) + 1),
+                             'recent': deque(maxlen=self.window)}
+                series[key] = histogram
+            histogram['count'] += 1
+            histogram['sum'] += ms
+            histogram['buckets'][bisect.bisect_left(self.BUCKETS, ms)] += 1
+            histogram['recent'].append(ms)
+
+    def timer(self, name: str, **labels):
+        """
+        Context manager, observe the time of a block
+        e.g. with metrics.timer('ui_render', part='labels'): ...
+        """
+        return MetricsTimer(self, name, labels)
+
+    def counter(self, name: str, **labels) -> float:
+        """
+        Total of the counters of a name whose labels include the given labels
+        """
+        with self.lock:
+            series = self.counters.get(name, {})
+            return sum(value for key, value in series.items() if self.match(key, labels))
+
+    def histogram(self, name: str, **labels) -> dict:
+        """
+        Merge the histograms of a name whose labels include the given labels
+        Return:
+            :return: {'count', 'sum', 'mean', 'p50', 'p95', 'max', 'buckets'}, times in milliseconds(dict).
+                The percentiles are of the recent samples, None if there's no sample
+        """
+
+        count, total, buckets, recent = 0, 0, [0] * (len(self.BUCKETS) + 1), []
+        with self.lock:
+            for key, histogram in self.histograms.get(name, {}).items():
+                if not self.match(key, labels):
+                    continue
+                count += histogram['count']
+                total += histogram['sum']
+                buckets = [a + b for a, b in zip(buckets, histogram['buckets'])]
+                recent.extend(histogram['recent'])
+        recent.sort()
+
+        def percentile(q):
+            return recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+
+        return {
+            'count': count,
+            'sum': total,
+            'mean': total / count if count else None,
+            'p50': percentile(0.5),
+            'p95': percentile(0.95),
+            'max': recent[-1] if recent else None,
+            'buckets': dict(zip([str(bound) for bound in self.BUCKETS] + ['inf'], buckets)),
+        }
+
+    def snapshot(self) -> dict:
+        """
+        All the metrics as a dict, which can be dumped to json
+        Return:
+            :return: {'uptime', 'counters': {name: [{'labels', 'value'}]},
+                'histograms': {name: [{'labels', 'count', 'sum', 'mean', 'p50', 'p95', 'max', 'buckets'}]}}(dict)
+        """
+
+        with self.lock:
+            counters = {name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                        for name, series in self.counters.items()}
+            keys = {name: list(series) for name, series in self.histograms.items()}
+        histograms = {}
+        for name, series in keys.items():
+            histograms[name] = []
+            for key in series:
+                labels = dict(key)
+                histograms[name].append({'labels': labels, **self.histogram(name, **labels)})
+        return {'uptime': time.time() - self.started, 'counters': counters, 'histograms': histograms}
+
+    def dump(self, path: str, extra: dict = None):
+        """
+        Write the snapshot to a json file
+        Parameters:
+            :param path: the file(str)
+            :param extra: more data written with the snapshot, e.g. the state of the rate limiter(dict)
+        """
+        data = self.snapshot()
+        data.update(extra or {})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False)
+
+    def reset(self):
+        """
+        Remove all the metrics
+        """
+        with self.lock:
+            self.counters = {}
+            self.histograms = {}
+            self.started = time.time()
+
+
+class MetricsTimer(object):
+    """
+    Context manager returned by MetricsRegistry.timer
+    """
+
+    def __init__(self, metrics: MetricsRegistry, name: str, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
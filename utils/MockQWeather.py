@@ -0,0 +1,439 @@
+# MockQWeather.py
+# Description: a local stand-in of the QWeather(HeFeng) API, serving recorded or synthetic responses
+#     with configurable latency, jitter, errors and rate limits. Used to benchmark and load test the refreshes
+#     without network and without using the API quota
+# Usage:
+#     python -m utils.MockQWeather --port 8765 --latency 0.05 --jitter 0.02 --error-rate 0.01
+#     QWEATHER_BASE_URL=http://127.0.0.1:8765 python Interface.py
+# By Monster Kid
+
+import os
+import sys
+import json
+import time
+import zlib
+import random
+import datetime
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from utils.RateLimiter import RateLimiter
+
+class MockQWeather(ThreadingHTTPServer):
+    """
+    A local HTTP server with the QWeather routes used by GetWeather
+    - Responses are read from the fixtures directory if there's one, otherwise they are synthetic
+      (stable for a location, updateTime moves forward like the real API)
+    - Latency, jitter, error rate and hangs can be set for all the endpoints or for each one
+    - Rate limits are those of the API: 429 when the requests are too fast, 402 when the daily budget is used up
+    Methods:
+        - start: serve in a daemon thread
+        - stop: stop serving
+        - stats: number of requests of each endpoint and code
+        - load_fixture: load the recorded response of an endpoint
+        - make_response: make a synthetic response
+    """
+
+    # listen backlog, the default(5) drops the connections of a fan-out and they are retried after 1 second
+    request_queue_size = 128
+    # route -> endpoint(keys of GetWeather.HF_TTL)
+    ROUTES = {
+        '/v2/city/lookup': 'location',
+        '/v7/weather/now': 'now',
+        '/v7/weather/7d': '7d',
+        '/v7/weather/24h': '24h',
+        '/v7/minutely/5m': 'rain',
+        '/v7/warning/now': 'warning',
+        '/v7/indices/3d': 'indices',
+        '/v7/air/now': 'air',
+        '/v7/air/5d': 'air_forecast',
+    }
+    # The provider updates each endpoint every this many seconds, updateTime is aligned to it
+    UPDATE_PERIODS = {
+        'now': 10 * 60,
+        '7d': 60 * 60,
+        '24h': 60 * 60,
+        'rain': 5 * 60,
+        'warning': 5 * 60,
+        'indices': 60 * 60,
+        'air': 60 * 60,
+        'air_forecast': 60 * 60,
+    }
+    # Time zone of the synthetic responses
+    TIMEZONE = datetime.timezone(datetime.timedelta(hours=8))
+    REFER = {'sources': ['QWeather'], 'license': ['QWeather Developers License']}
+    # Texts of the synthetic responses {language: ...}
+    TEXTS = {
+        'en': {
+            'weather': ['Sunny', 'Cloudy', 'Overcast', 'Light Rain', 'Showers', 'Snow'],
+            'wind': ['N', 'NE', 'E', 'SE', 'S', 'SW', 'W', 'NW'],
+            'moon': ['New Moon', 'Waxing Crescent', 'First Quarter', 'Full Moon', 'Last Quarter'],
+            'air': ['Excellent', 'Good', 'Lightly Polluted', 'Moderately Polluted'],
+            'indices': [('Sports', 'Suitable'), ('Car Washing', 'Not Suitable'), ('Dressing', 'Warm')],
+            'rain': ['No precipitation within 2 hours', 'Light rain in 30 minutes'],
+        },
+        'zh': {
+            'weather': ['晴', '多云', '阴', '小雨', '阵雨', '雪'],
+            'wind': ['北风', '东北风', '东风', '东南风', '南风', '西南风', '西风', '西北风'],
+            'moon': ['新月', '峨眉月', '上弦月', '满月', '下弦月'],
+            'air': ['优', '良', '轻度污染', '中度污染'],
+            'indices': [('运动指数', '适宜'), ('洗车指数', '不宜'), ('穿衣指数', '较舒适')],
+            'rain': ['未来两小时无降水', '30分钟后有小雨'],
+        },
+    }
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 8765, latency=0, jitter=0, error_rate=0,
+                 error_codes: list = None, hang_rate=0, hang_time: float = 30, rate: float = 0, burst: int = 10,
+                 daily_budget: int = 0, fixtures_dir: str = None, seed: int = None):
+        """
+        Init MockQWeather
+        Parameters:
+            :param host, port: address to listen on, port 0 picks a free port
+            :param latency: seconds before answering, a number or {endpoint: seconds}
+            :param jitter: random extra latency in [0, jitter] seconds, a number or {endpoint: seconds}
+            :param error_rate: probability of answering an error code, a number or {endpoint: probability}
+            :param error_codes: codes answered as errors, one is picked at random(list of str), default ['500']
+            :param hang_rate: probability of answering after hang_time(a stuck request), a number or {endpoint: probability}
+            :param hang_time: seconds a stuck request takes(float)
+            :param rate: max requests per second before answering 429, 0 means unlimited(float)
+            :param burst: max number of requests at once before answering 429(int)
+            :param daily_budget: max requests before answering 402, 0 means unlimited(int)
+            :param fixtures_dir: directory of the recorded responses, refer to load_fixture(str)
+            :param seed: seed of the random errors and latencies(int)
+        """
+
+        super().__init__((host, port), MockQWeatherHandler)
+        self.daemon_threads = True
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_codes = error_codes or ['500']
+        self.hang_rate = hang_rate
+        self.hang_time = hang_time
+        # the server side of the limits, rate 0 means only the daily budget is limited
+        self.limiter = None
+        if rate > 0 or daily_budget > 0:
+            self.limiter = RateLimiter(rate, burst, daily_budget) if rate > 0 else \
+                RateLimiter(float('inf'), float('inf'), daily_budget)
+        self.fixtures_dir = fixtures_dir
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # {endpoint: {code: count}}
+        self.counts = {}
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        """
+        Base URL of the server, pass it to GetWeather(base_url=...)
+        """
+        return 'http://{}:{}'.format(*self.server_address[:2])
+
+    @staticmethod
+    def get_value(value, endpoint: str) -> float:
+        """
+        Get a setting of an endpoint, the setting is a number or {endpoint: number}
+        """
+        if isinstance(value, dict):
+            return value.get(endpoint, 0)
+        return value
+
+    def start(self):
+        """
+        Serve in a daemon thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stop serving
+        """
+        self.shutdown()
+        self.server_close()
+
+    def count(self, endpoint: str, code: str):
+        """
+        Count an answered request
+        """
+        with self.lock:
+            codes = self.counts.setdefault(endpoint, {})
+            codes[code] = codes.get(code, 0) + 1
+
+    def stats(self) -> dict:
+        """
+        Number of requests of each endpoint and code
+        Return:
+            :return: {'requests', 'endpoints': {endpoint: {code: count}}, 'limiter'}(dict)
+        """
+        with self.lock:
+            endpoints = {endpoint: dict(codes) for endpoint, codes in self.counts.items()}
+        return {
+            'requests': sum(sum(codes.values()) for codes in endpoints.values()),
+            'endpoints': endpoints,
+            'limiter': self.limiter.state() if self.limiter is not None else None,
+        }
+
+    def answer(self, endpoint: str, query: dict) -> dict:
+        """
+        Answer a request: wait, then return an error or the response
+        Runs in the thread of the request
+        Parameters:
+            :param endpoint: name of the endpoint(str)
+            :param query: query of the request, {name: value}(dict)
+        Return:
+            :return: the json response(dict)
+        """
+
+        with self.lock:
+            delay = self.get_value(self.latency, endpoint) + self.random.uniform(0, self.get_value(self.jitter, endpoint))
+            hang = self.random.random() < self.get_value(self.hang_rate, endpoint)
+            error = self.random.random() < self.get_value(self.error_rate, endpoint)
+            error_code = self.random.choice(self.error_codes)
+        time.sleep(self.hang_time if hang else delay)
+
+        if 'key' not in query:
+            return {'code': '401'}
+        if 'location' not in query:
+            return {'code': '400'}
+        if self.limiter is not None:
+            code, _ = self.limiter.reserve(wait=False)
+            if code is not None:
+                return {'code': code}
+        if error:
+            return {'code': error_code}
+        data = self.load_fixture(endpoint, query['location'])
+        if data is None:
+            data = self.make_response(endpoint, query['location'], query.get('lang', 'zh'))
+        return data
+
+    def load_fixture(self, endpoint: str, location: str) -> dict:
+        """
+        Load the recorded response of an endpoint
+        <fixtures_dir>/<endpoint>-<location>.json is used for the location, <fixtures_dir>/<endpoint>.json for the others
+        Return:
+            :return: the response, None if there's no fixture(dict)
+        """
+
+        if self.fixtures_dir is None:
+            return None
+        for name in [endpoint + '-' + location, endpoint]:
+            path = os.path.join(self.fixtures_dir, name + '.json')
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        return None
+
+    def make_response(self, endpoint: str, location: str, language: str) -> dict:
+        """
+        Make a synthetic response with the fields of the real one
+        The values are stable for a location, and updateTime is aligned to the update period of the endpoint
+        Parameters:
+            :param endpoint: name of the endpoint(str)
+            :param location: location of the request, city name, id or "lon,lat"(str)
+            :param language: 'zh' or 'en'(str)
+        Return:
+            :return: the response(dict)
+        """
+
+        texts = self.TEXTS.get(language, self.TEXTS['en'])
+        period = self.UPDATE_PERIODS.get(endpoint, 3600)
+        now = datetime.datetime.now(self.TIMEZONE)
+        update_time = datetime.datetime.fromtimestamp(time.time() // period * period, self.TIMEZONE)
+        # the values only change when the provider updates them
+        rng = random.Random(zlib.crc32('{}|{}|{}'.format(endpoint, location, update_time).encode()))
+        base_temp = zlib.crc32(location.encode()) % 30 - 5
+
+        def minutes(dt):
+            return dt.strftime('%Y-%m-%dT%H:%M') + '+08:00'
+
+        def wind():
+            degree = rng.randrange(360)
+            return {'wind360': str(degree), 'windDir': texts['wind'][degree * 8 // 360],
+                    'windScale': str(rng.randint(1, 6)), 'windSpeed': str(rng.randint(1, 40))}
+
+        if endpoint == 'location':
+            checksum = zlib.crc32(location.encode())
+            return {'code': '200', 'location': [{
+                'name': location, 'id': str(100000000 + checksum % 100000000),
+                'lat': '{:.2f}'.format(checksum % 18000 / 100 - 90), 'lon': '{:.2f}'.format(checksum % 36000 / 100 - 180),
+                'adm2': location, 'adm1': location, 'country': 'Mock', 'tz': 'Asia/Shanghai', 'utcOffset': '+08:00',
+                'isDst': '0', 'type': 'city', 'rank': '10', 'fxLink': ''}], 'refer': self.REFER}
+
+        data = {'code': '200', 'updateTime': minutes(update_time), 'fxLink': '', 'refer': self.REFER}
+        if endpoint == 'now':
+            temp = base_temp + rng.randint(-3, 3)
+            data['now'] = {'obsTime': minutes(update_time), 'temp': str(temp), 'feelsLike': str(temp - rng.randint(0, 3)),
+                           'icon': '100', 'text': rng.choice(texts['weather']), **wind(),
+                           'humidity': str(rng.randint(20, 95)), 'precip': '0.0', 'pressure': str(rng.randint(990, 1030)),
+                           'vis': str(rng.randint(5, 30)), 'cloud': str(rng.randint(0, 100)), 'dew': str(temp - 5)}
+        elif endpoint == '7d':
+            data['daily'] = []
+            for day in range(7):
+                temp_max = base_temp + rng.randint(0, 8)
+                day_wind, night_wind = wind(), wind()
+                data['daily'].append({
+                    'fxDate': (now + datetime.timedelta(days=day)).strftime('%Y-%m-%d'),
+                    'sunrise': '06:{:02d}'.format(rng.randint(0, 59)), 'sunset': '18:{:02d}'.format(rng.randint(0, 59)),
+                    'moonrise': '{:02d}:{:02d}'.format(rng.randint(0, 23), rng.randint(0, 59)),
+                    'moonset': '{:02d}:{:02d}'.format(rng.randint(0, 23), rng.randint(0, 59)),
+                    'moonPhase': rng.choice(texts['moon']), 'moonPhaseIcon': '800',
+                    'tempMax': str(temp_max), 'tempMin': str(temp_max - rng.randint(4, 12)),
+                    'iconDay': '100', 'textDay': rng.choice(texts['weather']),
+                    'iconNight': '150', 'textNight': rng.choice(texts['weather']),
+                    'wind360Day': day_wind['wind360'], 'windDirDay': day_wind['windDir'],
+                    'windScaleDay': day_wind['windScale'], 'windSpeedDay': day_wind['windSpeed'],
+                    'wind360Night': night_wind['wind360'], 'windDirNight': night_wind['windDir'],
+                    'windScaleNight': night_wind['windScale'], 'windSpeedNight': night_wind['windSpeed'],
+                    'humidity': str(rng.randint(20, 95)), 'precip': '0.0', 'pressure': str(rng.randint(990, 1030)),
+                    'vis': str(rng.randint(5, 30)), 'cloud': str(rng.randint(0, 100)), 'uvIndex': str(rng.randint(1, 10))})
+        elif endpoint == '24h':
+            data['hourly'] = []
+            for hour in range(1, 25):
+                temp = base_temp + rng.randint(-3, 5)
+                data['hourly'].append({
+                    'fxTime': minutes(update_time.replace(minute=0) + datetime.timedelta(hours=hour)),
+                    'temp': str(temp), 'icon': '100', 'text': rng.choice(texts['weather']), **wind(),
+                    'humidity': str(rng.randint(20, 95)), 'pop': str(rng.randint(0, 100)), 'precip': '0.0',
+                    'pressure': str(rng.randint(990, 1030)), 'cloud': str(rng.randint(0, 100)), 'dew': str(temp - 5)})
+        elif endpoint == 'rain':
+            raining = rng.random() < 0.3
+            data['summary'] = texts['rain'][raining]
+            data['minutely'] = [{'fxTime': minutes(update_time + datetime.timedelta(minutes=5 * i)),
+                                 'precip': '{:.2f}'.format(rng.uniform(0, 0.5) if raining and i >= 6 else 0),
+                                 'type': 'rain'} for i in range(24)]
+        elif endpoint == 'warning':
+            data['warning'] = []
+        elif endpoint == 'indices':
+            data['daily'] = []
+            for day in range(3):
+                for i, (name, category) in enumerate(texts['indices']):
+                    data['daily'].append({'date': (now + datetime.timedelta(days=day)).strftime('%Y-%m-%d'),
+                                          'type': str(i + 1), 'name': name, 'level': str(rng.randint(1, 4)),
+                                          'category': category, 'text': ''})
+        elif endpoint == 'air':
+            aqi = rng.randint(10, 180)
+            data['now'] = {'pubTime': minutes(update_time), 'aqi': str(aqi), 'level': str(min(aqi // 50 + 1, 4)),
+                           'category': texts['air'][min(aqi // 50, 3)], 'primary': 'NA' if aqi <= 50 else 'PM2.5',
+                           'pm10': str(rng.randint(5, 150)), 'pm2p5': str(rng.randint(5, 120)),
+                           'no2': str(rng.randint(5, 80)), 'so2': str(rng.randint(1, 20)),
+                           'co': '{:.1f}'.format(rng.uniform(0.2, 1.5)), 'o3': str(rng.randint(10, 150))}
+            data['station'] = []
+        elif endpoint == 'air_forecast':
+            data['daily'] = []
+            for day in range(5):
+                aqi = rng.randint(10, 180)
+                data['daily'].append({'fxDate': (now + datetime.timedelta(days=day)).strftime('%Y-%m-%d'),
+                                      'aqi': str(aqi), 'level': str(min(aqi // 50 + 1, 4)),
+                                      'category': texts['air'][min(aqi // 50, 3)],
+                                      'primary': 'NA' if aqi <= 50 else 'PM2.5'})
+        return data
+
+
+class MockQWeatherHandler(BaseHTTPRequestHandler):
+    """
+    Request handler of MockQWeather, one thread per request
+    """
+
+    # keep-alive, like the real API
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # quiet, the requests are counted in stats
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/stats':
+            self.send_json(self.server.stats())
+            return
+        endpoint = self.server.ROUTES.get(url.path)
+        if endpoint is None:
+            self.send_json({'code': '404'}, status=404)
+            return
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        data = self.server.answer(endpoint, query)
+        self.server.count(endpoint, data.get('code'))
+        self.send_json(data)
+
+    def send_json(self, data: dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up(e.g. deadline or hedged request)
+            pass
+
+
+def record_fixtures(fixtures_dir: str, city_name: str, language: str = 'en'):
+    """
+    Record the real responses of a city as fixtures, it uses 9 requests of the API quota
+    Parameters:
+        :param fixtures_dir: directory of the fixtures(str)
+        :param city_name: English name of the city(str)
+        :param language: 'zh' or 'en'(str)
+    """
+
+    from GetWeather import GetWeather
+    get_weather = GetWeather(language, base_url='')
+    os.makedirs(fixtures_dir, exist_ok=True)
+    location = get_weather.fetch('location', city_name, get_weather.hf_url_location + '&location=' + city_name)
+    city = location['location'][0]
+    lat, lon = str(round(float(city['lat']), 2)), str(round(float(city['lon']), 2))
+    responses = {
+        'location': location,
+        'now': get_weather.get_hf_current(city['id']),
+        '7d': get_weather.get_hf_7days(city['id']),
+        '24h': get_weather.get_hf_24hours(city['id']),
+        'rain': get_weather.get_hf_rain(lat, lon),
+        'warning': get_weather.get_hf_warning(city['id']),
+        'indices': get_weather.get_hf_indices(city['id']),
+        'air': get_weather.get_hf_air(city['id']),
+        'air_forecast': get_weather.get_hf_air_forecast(city['id']),
+    }
+    for endpoint, data in responses.items():
+        with open(os.path.join(fixtures_dir, endpoint + '.json'), 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+    get_weather.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in of the QWeather API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0, help='seconds before answering')
+    parser.add_argument('--jitter', type=float, default=0, help='random extra latency, in seconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='probability of answering an error code')
+    parser.add_argument('--error-codes', default='500', help='comma separated error codes, e.g. 500,429')
+    parser.add_argument('--hang-rate', type=float, default=0, help='probability of a stuck request')
+    parser.add_argument('--hang-time', type=float, default=30, help='seconds a stuck request takes')
+    parser.add_argument('--rate', type=float, default=0, help='max requests per second, 0 means unlimited')
+    parser.add_argument('--burst', type=int, default=10)
+    parser.add_argument('--daily-budget', type=int, default=0, help='max requests before 402, 0 means unlimited')
+    parser.add_argument('--fixtures', default=None, help='directory of the recorded responses')
+    parser.add_argument('--record', default=None, metavar='CITY',
+                        help='record the real responses of CITY into --fixtures and exit')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.record is not None:
+        if args.fixtures is None:
+            parser.error('--record needs --fixtures')
+        record_fixtures(args.fixtures, args.record)
+        sys.exit(0)
+
+    server = MockQWeather(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                          args.error_codes.split(','), args.hang_rate, args.hang_time, args.rate, args.burst,
+                          args.daily_budget, args.fixtures, args.seed)
+    print('Serving the QWeather API on', server.url, '(stats at /stats)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -0,0 +1,214 @@
+# RateLimiter.py
+# Description: a thread-safe token-bucket rate limiter with a daily budget,
+#     and an exponential backoff with jitter when the API answers 429 or 402
+# By Monster Kid
+
+import time
+import random
+import datetime
+import threading
+import multiprocessing
+
+class RateLimiter(object):
+    """
+    RateLimiter: limit the requests sent to HeFeng API
+    - Token bucket: at most `rate` requests per second, bursts of `burst` requests
+    - Daily budget: at most `daily_budget` requests per day(HeFeng free plan allows 1000)
+    - Backoff: when the API answers 429(too many requests), stop sending requests for an
+      exponentially growing time with jitter. 402(max limit reached) means the budget of today is used up
+    Methods:
+        - reserve: reserve a request, return the code to answer instead(if blocked) and the delay before sending it
+        - report: report the code of a response
+        - next_delay: suggest the delay of the next scheduled refresh
+        - state: get the state of the limiter
+    """
+
+    # codes of HeFeng API that the limiter acts on
+    CODE_TOO_MANY_REQUESTS = '429'
+    CODE_MAX_LIMIT_REACHED = '402'
+
+    def __init__(self, rate: float = 5, burst: int = 10, daily_budget: int = 1000,
+                 backoff_base: float = 2, backoff_max: float = 600):
+        """
+        Init RateLimiter
+        Parameters:
+            :param rate: max requests per second(float)
+            :param burst: max number of requests sent at once(int)
+            :param daily_budget: max requests per day, 0 means unlimited(int)
+            :param backoff_base: backoff after the first 429, in seconds(float)
+            :param backoff_max: max backoff, in seconds(float)
+        """
+
+        self.rate = rate
+        self.burst = burst
+        self.daily_budget = daily_budget
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        # token bucket
+        self.tokens = burst
+        self.last_refill = time.monotonic()
+        # daily budget
+        self.today = datetime.date.today()
+        self.daily_used = 0
+        # backoff
+        self.failures = 0
+        self.backoff_until = 0
+        # number of requests blocked by the limiter
+        self.blocked = 0
+
+    def new_day(self):
+        """
+        Reset the daily budget if the day changed. Must be called with the lock held
+        """
+        today = datetime.date.today()
+        if today != self.today:
+            self.today = today
+            self.daily_used = 0
+
+    def reserve(self, wait: bool = True) -> tuple:
+        """
+        Reserve a request
+        Parameters:
+            :param wait: if False and there's no token now, the request is blocked instead of delayed(bool)
+        Return:
+            :return: (code, delay)(tuple)
+            - code: None if the request can be sent, otherwise the code to answer instead('429' or '402')
+            - delay: seconds to wait before sending the request
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            self.new_day()
+            # backing off
+            if now < self.backoff_until:
+                self.blocked += 1
+                return self.CODE_TOO_MANY_REQUESTS, 0
+            # budget of today is used up
+            if self.daily_budget and self.daily_used >= self.daily_budget:
+                self.blocked += 1
+                return self.CODE_MAX_LIMIT_REACHED, 0
+            # refill the bucket, then take a token. If there's no token, wait for it
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+            self.last_refill = now
+            if not wait and self.tokens < 1:
+                self.blocked += 1
+                return self.CODE_TOO_MANY_REQUESTS, 0
+            self.tokens -= 1
+            self.daily_used += 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0
+            return None, delay
+
+    def report(self, code: str):
+        """
+        Report the code of a response
+        Parameters:
+            :param code: code of the response(str)
+        """
+
+        with self.lock:
+            if code == self.CODE_TOO_MANY_REQUESTS:
+                # exponential backoff with jitter: a random time in [backoff / 2, backoff]
+                self.failures += 1
+                backoff = min(self.backoff_max, self.backoff_base * 2 ** (self.failures - 1))
+                backoff = backoff / 2 + random.uniform(0, backoff / 2)
+                self.backoff_until = max(self.backoff_until, time.monotonic() + backoff)
+            elif code == self.CODE_MAX_LIMIT_REACHED:
+                # the server says the budget is used up, believe it until tomorrow
+                self.new_day()
+                self.daily_used = max(self.daily_used, self.daily_budget)
+                self.failures += 1
+            elif code == '200':
+                self.failures = 0
+
+    def seconds_to_tomorrow(self) -> float:
+        """
+        Seconds until the daily budget is reset
+        """
+        now = datetime.datetime.now()
+        tomorrow = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time())
+        return (tomorrow - now).total_seconds()
+
+    def next_delay(self, interval: float) -> float:
+        """
+        Suggest the delay of the next scheduled refresh
+        The interval is doubled for each consecutive failure, at least until the backoff ends,
+        and if the budget of today is used up, wait until tomorrow
+        Parameters:
+            :param interval: the normal interval, in seconds(float)
+        Return:
+            :return: the delay, in seconds(float)
+        """
+
+        with self.lock:
+            self.new_day()
+            if self.daily_budget and self.daily_used >= self.daily_budget:
+                return max(interval, self.seconds_to_tomorrow())
+            delay = min(interval * 2 ** min(self.failures, 6), max(interval, self.backoff_max))
+            return max(delay, self.backoff_until - time.monotonic())
+
+    def state(self) -> dict:
+        """
+        Get the state of the limiter
+        Return:
+            :return: {'rate', 'tokens', 'daily_used', 'daily_budget', 'failures', 'backoff', 'blocked'}(dict)
+            backoff is the remaining backoff in seconds
+        """
+
+        with self.lock:
+            self.new_day()
+            now = time.monotonic()
+            return {
+                'rate': self.rate,
+                'tokens': min(self.burst, self.tokens + (now - self.last_refill) * self.rate),
+                'daily_used': self.daily_used,
+                'daily_budget': self.daily_budget,
+                'failures': self.failures,
+                'backoff': max(0, self.backoff_until - now),
+                'blocked': self.blocked,
+            }
+
+
+
+def shared_field(index: int, convert=float):
+    """
+    Property of SharedRateLimiter, reading and writing an item of its shared memory
+    """
+    return property(lambda self: convert(self.values[index]),
+                    lambda self, value: self.values.__setitem__(index, value))
+
+
+def shared_date_field(index: int):
+    """
+    Property of SharedRateLimiter holding a date, stored as an ordinal
+    """
+    return property(lambda self: datetime.date.fromordinal(int(self.values[index])),
+                    lambda self, value: self.values.__setitem__(index, value.toordinal()))
+
+
+class SharedRateLimiter(RateLimiter):
+    """
+    SharedRateLimiter: a RateLimiter shared by many processes, e.g. the shards of BatchWeather
+    The state(tokens, daily budget, backoff) is in shared memory and guarded by a process lock,
+    so all the processes together respect one rate and one daily budget.
+    Give it to the processes when they are created(e.g. an argument of multiprocessing.Process)
+    time.monotonic is system-wide, so the times of the processes can be compared
+    """
+
+    # state of the limiter, in shared memory
+    tokens = shared_field(0)
+    last_refill = shared_field(1)
+    daily_used = shared_field(2, int)
+    failures = shared_field(3, int)
+    backoff_until = shared_field(4)
+    blocked = shared_field(5, int)
+    today = shared_date_field(6)
+
+    def __init__(self, rate: float = 5, burst: int = 10, daily_budget: int = 1000,
+                 backoff_base: float = 2, backoff_max: float = 600):
+        """
+        Init SharedRateLimiter, refer to RateLimiter
+        """
+        self.values = multiprocessing.RawArray('d', 7)
+        super().__init__(rate, burst, daily_budget, backoff_base, backoff_max)
+        self.lock = multiprocessing.Lock()
@@ -0,0 +1,149 @@
+# RefreshScheduler.py
+# Description: a scheduler thread, which refreshes each section of the weather on its own cadence
+#     instead of refreshing everything at one global interval
+# By Monster Kid
+
+import time
+import threading
+
+class RefreshScheduler(threading.Thread):
+    """
+    A thread that refreshes each section of the weather on its own cadence
+    - Each section has an interval, e.g. minutely rain every 5 minutes, 7 days forecast every 4 hours
+    - Schedules are aligned to the updateTime of the data: the provider publishes new data at most every
+      PROVIDER_PERIODS seconds, so a section is not refreshed before updateTime + its provider period
+    - Sections that are due at the same time are refreshed with one call of the function
+    Methods:
+        - set_interval: set the interval of a section
+        - reschedule: recompute the schedule of some or all sections, e.g. after the city changed
+        - stop: stop the thread
+    """
+
+    # Default intervals of each section in seconds, 'now' is the interval set by the user
+    DEFAULT_INTERVALS = {
+        'now': 300,
+        'rain': 5 * 60,
+        'warning': 5 * 60,
+        '24h': 60 * 60,
+        'air': 60 * 60,
+        '7d': 4 * 60 * 60,
+        'indices': 4 * 60 * 60,
+        'air_forecast': 6 * 60 * 60,
+    }
+    # Shortest time between two updates of each section by the provider(HeFeng), in seconds
+    # 0 means the section can be updated at any time
+    PROVIDER_PERIODS = {
+        'now': 10 * 60,
+        'rain': 5 * 60,
+        'warning': 0,
+        '24h': 60 * 60,
+        'air': 60 * 60,
+        '7d': 60 * 60,
+        'indices': 60 * 60,
+        'air_forecast': 60 * 60,
+    }
+    # Refresh a bit later than the data is expected, in seconds
+    SLACK = 30
+
+    def __init__(self, function, update_time_function=None, intervals: dict = None, delay_function=None):
+        """
+        Init RefreshScheduler
+        Parameters:
+            :param function: function(sections), refresh the given sections(list)
+            :param update_time_function: function(section) -> unix time the provider updated the section, or None
+            :param intervals: interval of each section in seconds, default is DEFAULT_INTERVALS(dict)
+            :param delay_function: function(interval) -> delay, to slow down the refreshes(e.g. when rate limited)
+        """
+
+        super().__init__()
+        # set the thread as daemon
+        self.daemon = True
+        self.function = function
+        self.update_time_function = update_time_function
+        self.delay_function = delay_function
+        self.intervals = dict(self.DEFAULT_INTERVALS)
+        self.intervals.update(intervals or {})
+        self.lock = threading.Lock()
+        # next refresh time of each section(monotonic time)
+        now = time.monotonic()
+        self.next_due = {section: now + interval for section, interval in self.intervals.items()}
+        # the stop event(used to stop the thread) and the wake event(used to recompute the schedule)
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+
+    def get_interval(self, section: str) -> float:
+        """
+        Get the interval of a section, slowed down by delay_function
+        """
+        interval = self.intervals[section]
+        if self.delay_function is not None:
+            interval = self.delay_function(interval)
+        return interval
+
+    def compute_next_due(self, section: str, now: float) -> float:
+        """
+        Compute the next refresh time of a section(monotonic time)
+        It's `interval` from now, or later if the provider cannot have new data by then
+        """
+
+        next_due = now + self.get_interval(section)
+        period = self.PROVIDER_PERIODS.get(section, 0)
+        update_time = self.update_time_function(section) if self.update_time_function else None
+        if update_time is None or period <= 0:
+            return next_due
+        # new data is expected one provider period after the last update, convert the unix time to monotonic time
+        expected = update_time - time.time() + now + period + self.SLACK
+        return max(next_due, expected)
+
+    def set_interval(self, section: str, interval: float):
+        """
+        Set the interval of a section, e.g. when the user changed the update interval
+        """
+        with self.lock:
+            self.intervals[section] = interval
+            self.next_due[section] = self.compute_next_due(section, time.monotonic())
+        self._wake_event.set()
+
+    def reschedule(self, sections: list = None):
+        """
+        Recompute the schedule of some sections, e.g. after the city changed and all sections were refreshed
+            :param sections: the sections to reschedule, None means all(list)
+        """
+        with self.lock:
+            now = time.monotonic()
+            for section in (self.intervals if sections is None else sections):
+                self.next_due[section] = self.compute_next_due(section, now)
+        self._wake_event.set()
+
+    def stop(self):
+        """
+        Stop the thread
+        """
+        self._stop_event.set()
+        self._wake_event.set()
+
+    def run(self):
+        """
+        Run the thread
+        """
+
+        while not self._stop_event.is_set():
+            # sleep until the first section is due, or until the schedule changed
+            with self.lock:
+                timeout = max(0, min(self.next_due.values()) - time.monotonic())
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+            if self._stop_event.is_set():
+                break
+            # refresh all the due sections with one call
+            with self.lock:
+                now = time.monotonic()
+                due = [section for section, due_time in self.next_due.items() if due_time <= now]
+            if not due:
+                continue
+            self.function(due)
+            # schedule the next refreshes, aligned to the new update time
+            with self.lock:
+                now = time.monotonic()
+                for section in due:
+                    self.next_due[section] = self.compute_next_due(section, now)
@@ -0,0 +1,125 @@
+# ResponseCache.py
+# Description: a thread-safe in-memory cache of API responses,
+#     with a TTL per endpoint and a size-bounded LRU eviction
+# By Monster Kid
+
+import time
+import threading
+from collections import OrderedDict
+
+class ResponseCache(object):
+    """
+    ResponseCache: cache API responses in memory
+    Key of the cache is (endpoint, location, language), each endpoint has its own TTL
+    When the cache is full, the least recently used entry is evicted
+    Methods:
+        - get: get a response from the cache, None if missing or expired
+        - put: put a response into the cache
+        - invalidate: remove entries from the cache
+        - stats: get hit/miss counters of the cache
+    """
+
+    def __init__(self, ttl: dict, max_size: int = 256, default_ttl: float = 0):
+        """
+        Init ResponseCache
+        Parameters:
+            :param ttl: time to live of each endpoint in seconds(dict {endpoint: seconds})
+            :param max_size: max number of entries(int)
+            :param default_ttl: time to live of endpoints not in ttl, 0 means not cached(float)
+        """
+
+        self.ttl = dict(ttl)
+        self.max_size = max_size
+        self.default_ttl = default_ttl
+        # entries: OrderedDict {key: (expire_time, response)}, the last one is the most recently used
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_ttl(self, endpoint: str) -> float:
+        """
+        Get the TTL of an endpoint
+        """
+        return self.ttl.get(endpoint, self.default_ttl)
+
+    def get(self, key: tuple):
+        """
+        Get a response from the cache
+        Parameters:
+            :param key: (endpoint, location, language)(tuple)
+        Return:
+            :return: the cached response, None if it is missing or expired
+        """
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expire_time, response = entry
+            # expired entry is removed
+            if time.monotonic() >= expire_time:
+                del self.entries[key]
+                self.misses += 1
+                return None
+            # mark as most recently used
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return response
+
+    def put(self, key: tuple, response, ttl: float = None):
+        """
+        Put a response into the cache
+        Parameters:
+            :param key: (endpoint, location, language)(tuple)
+            :param response: the response to cache
+            :param ttl: time to live in seconds, default is the TTL of the endpoint(float)
+        """
+
+        if ttl is None:
+            ttl = self.get_ttl(key[0])
+        # TTL 0 means do not cache
+        if ttl <= 0 or self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (time.monotonic() + ttl, response)
+            self.entries.move_to_end(key)
+            # evict the least recently used entries
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, endpoint: str = None):
+        """
+        Remove entries from the cache
+        Parameters:
+            :param endpoint: only remove entries of this endpoint, None means remove all(str)
+        """
+
+        with self.lock:
+            if endpoint is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if key[0] == endpoint]:
+                del self.entries[key]
+
+    def stats(self) -> dict:
+        """
+        Get the counters of the cache
+        Return:
+            :return: {'size', 'max_size', 'hits', 'misses', 'evictions', 'hit_rate'}(dict)
+        """
+
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,149 @@
+# ResponseStore.py
+# Description: a persistent store of the last good API responses, based on SQLite
+#     It's used to render the weather immediately on startup and to work offline
+# By Monster Kid
+
+import json
+import time
+import sqlite3
+import threading
+
+class ResponseStore(object):
+    """
+    ResponseStore: store the last good response of each city, language and endpoint in a SQLite file
+    Methods:
+        - save: save a response
+        - load: load a response and the time it was saved
+        - save_weather: save all the good responses of a weather dict
+        - load_weather: load a weather dict and the time of its oldest response
+        - save_location: save id, latitude and longitude of a city
+        - load_location: load id, latitude and longitude of a city
+        - close: close the database
+    """
+
+    # Seconds a write waits for another process to release the database(e.g. the shards of BatchWeather)
+    BUSY_TIMEOUT = 30
+
+    def __init__(self, path: str):
+        """
+        Init ResponseStore, create the table if it does not exist
+        The database is in WAL mode, so many processes can share the file: readers never block,
+        a writer waits up to BUSY_TIMEOUT seconds for the others instead of failing with "database is locked"
+        Parameters:
+            :param path: path of the SQLite file(str)
+        """
+
+        self.path = path
+        # the connection is shared by the UI thread and the event loop thread, so protect it with a lock
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=self.BUSY_TIMEOUT, check_same_thread=False)
+        with self.lock:
+            self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'city TEXT, language TEXT, endpoint TEXT, data TEXT, saved_at REAL, '
+                'PRIMARY KEY (city, language, endpoint))'
+            )
+            # location of a city never changes, it's stored forever
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS locations (city TEXT PRIMARY KEY, id TEXT, lat TEXT, lon TEXT)'
+            )
+
+    def save(self, city: str, language: str, endpoint: str, data: dict, saved_at: float = None):
+        """
+        Save a response
+        Parameters:
+            :param city: English name of the city(str)
+            :param language: language of the response(str)
+            :param endpoint: name of the endpoint(str)
+            :param data: the response(dict)
+            :param saved_at: the time the response was got, default is now(float, unix time)
+        """
+
+        saved_at = time.time() if saved_at is None else saved_at
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                                    (city, language, endpoint, json.dumps(data, ensure_ascii=False), saved_at))
+
+    def load(self, city: str, language: str, endpoint: str) -> tuple:
+        """
+        Load a response
+        Return:
+            :return: (response, saved_at), (None, None) if it does not exist(tuple)
+        """
+
+        with self.lock:
+            row = self.connection.execute(
+                'SELECT data, saved_at FROM responses WHERE city = ? AND language = ? AND endpoint = ?',
+                (city, language, endpoint)).fetchone()
+        if row is None:
+            return None, None
+        return json.loads(row[0]), row[1]
+
+    def save_weather(self, city: str, language: str, weather: dict):
+        """
+        Save all the good responses(code 200) of a weather dict
+        Parameters:
+            :param weather: weather dict, refer to WeatherAssistant.EMPTY_WEATHER_DICT(dict)
+        """
+
+        saved_at = time.time()
+        rows = [(city, language, endpoint, json.dumps(data, ensure_ascii=False), saved_at)
+                for endpoint, data in weather.items() if data is not None and data.get('code') == '200']
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)', rows)
+
+    def load_weather(self, city: str, language: str, endpoints: list) -> tuple:
+        """
+        Load a weather dict
+        Parameters:
+            :param endpoints: keys of the weather dict(list)
+        Return:
+            :return: (weather dict, saved time of the oldest response), missing responses are None.
+                If there's no response at all, the time is None(tuple)
+        """
+
+        weather = {endpoint: None for endpoint in endpoints}
+        with self.lock:
+            rows = self.connection.execute(
+                'SELECT endpoint, data, saved_at FROM responses WHERE city = ? AND language = ?',
+                (city, language)).fetchall()
+        saved_at = None
+        for endpoint, data, time_saved in rows:
+            if endpoint in weather:
+                weather[endpoint] = json.loads(data)
+                saved_at = time_saved if saved_at is None else min(saved_at, time_saved)
+        return weather, saved_at
+
+    def save_location(self, city: str, location: dict):
+        """
+        Save id, latitude and longitude of a city
+        Parameters:
+            :param city: English name of the city(str)
+            :param location: {'id', 'lat', 'lon'}(dict)
+        """
+
+        with self.lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO locations VALUES (?, ?, ?, ?)',
+                                    (city, location['id'], location['lat'], location['lon']))
+
+    def load_location(self, city: str) -> dict:
+        """
+        Load id, latitude and longitude of a city
+        Return:
+            :return: {'id', 'lat', 'lon'}, None if the city is unknown(dict)
+        """
+
+        with self.lock:
+            row = self.connection.execute('SELECT id, lat, lon FROM locations WHERE city = ?', (city,)).fetchone()
+        if row is None:
+            return None
+        return {'id': row[0], 'lat': row[1], 'lon': row[2]}
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self.lock:
+            self.connection.close()
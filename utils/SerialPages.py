@@ -298,6 +298,70 @@ class IndexPage(SerialPage):
         self.language = language
 
 
+class DiagnosticsPage(SerialPage):
+    """
+    DiagnosticsPage: a page to display where the time of a refresh goes
+    The data is the summary of the metrics, refer to WeatherAssistant.diagnostics
+    """
+
+    # number of pieces of data in a row
+    COLUMNS = 5
+
+    def __init__(self, parent, language = "English"):
+        super().__init__(parent, language)
+        self.title = language_dict[self.language]['diagnostics_title']
+        # data keys: times(ms) in the first row, counts in the second row
+        self.keys = ['refresh', 'location', 'fan_out', 'request', 'decode',
+                     'render', 'requests', 'errors', 'cache_hit', 'traffic']
+        self.subtitle = language_dict[self.language]['diagnostics_subtitle']
+        self.units = language_dict[self.language]['diagnostics_units']
+        # Title label
+        self.title_label = tk.Label(self, text=self.title)
+        self.title_label.grid(row=0, column=0, columnspan=self.COLUMNS, padx=10, pady=5)
+        # Create labels for each piece of data, two rows of subtitle and value
+        for i, key in enumerate(self.keys):
+            row, column = 1 + i // self.COLUMNS * 2, i % self.COLUMNS
+            self.columnconfigure(column, weight=1)
+            label = tk.Label(self, text=self.subtitle[i])
+            label.grid(row=row, column=column, padx=5)
+            setattr(self, f"{key}_label", label)
+            value_label = tk.Label(self, text=self.OCC)
+            value_label.grid(row=row + 1, column=column, padx=5)
+            setattr(self, key, value_label)
+
+    def update(self, **kwargs):
+        """
+        Update the page with new data, None means never measured
+        """
+        self.clear()
+        for i, key in enumerate(self.keys):
+            value = kwargs.get(key)
+            if value is None:
+                continue
+            text = "{:.1f}".format(value) if key in ('traffic', 'decode') else "{:.0f}".format(value)
+            getattr(self, key)['text'] = text + self.units[i]
+
+    def clear(self):
+        """
+        Clear the page
+        """
+        for key in self.keys:
+            getattr(self, key)['text'] = self.OCC
+
+    def set_language(self, language):
+        """
+        Set the language of the page
+        """
+        self.language = language
+        self.title = language_dict[self.language]['diagnostics_title']
+        self.subtitle = language_dict[self.language]['diagnostics_subtitle']
+        self.units = language_dict[self.language]['diagnostics_units']
+        self.title_label['text'] = self.title
+        for i, key in enumerate(self.keys):
+            getattr(self, key + '_label')['text'] = self.subtitle[i]
+            getattr(self, key)['text'] = self.OCC
+
+
 # ---------------- Chart pages ----------------
 
 
@@ -322,30 +386,30 @@ class Chart7DaysPage(SerialPage):
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
 
-    def update(self, **kwargs):
+    def update(self, daily):
         """
         Update the chart with new data
+            :param daily: forecast of the next days(WeatherModel.DailySeries)
         """
         # Clear the chart
         self.clear()
-        # Retrieve daily weather data from kwargs
-        data = kwargs['daily']
 
         # Plot min and max temperature
-        x = np.arange(len(data))
-        y1 = [int(data[i]['tempMax']) for i in range(len(data))]
+        x = np.arange(len(daily))
+        y1 = daily.temp_max
         self.ax.plot(x, y1)
-        y2 = [int(data[i]['tempMin']) for i in range(len(data))]
+        y2 = daily.temp_min
         self.ax.plot(x, y2)
         self.ax.scatter(x, y1)
         self.ax.scatter(x, y2)
 
         # Plot the temperature value on the chart, adjust the offset of the text
-        y1_span = max(y1) - min(y2)
-        for i in range(len(data)):
+        y_min = int(y2.min())
+        y1_span = int(y1.max()) - y_min
+        for i in range(len(daily)):
             # Adjust the offset of the text based on its position
-            y_offset_1 = 10 if y1_span and (y1[i] - min(y2)) / y1_span < 0.8 else -20
-            y_offset_2 = -20 if y1_span and (y2[i] - min(y2)) / y1_span > 0.2 else 10
+            y_offset_1 = 10 if y1_span and (y1[i] - y_min) / y1_span < 0.8 else -20
+            y_offset_2 = -20 if y1_span and (y2[i] - y_min) / y1_span > 0.2 else 10
             # Plot the text
             self.ax.annotate(str(y1[i]) + "°C", (x[i], y1[i]), textcoords="offset points", xytext=(0, y_offset_1),
                              ha='center')
@@ -353,10 +417,9 @@ class Chart7DaysPage(SerialPage):
                              ha='center')
 
         # Set x-axis labels: date, day of week, humidity, wind
-        x_labels = [data[i]['fxDate'][5:] for i in range(len(data))]
-        for i in range(len(data)):
-            x_labels[i] += "\n" + data[i]['textDay'] + "\n" + data[i]['humidity'] + "%\n" \
-                + data[i]['windDirDay'] + data[i]['windScaleDay'] + language_dict[self.language]['chart_wind_unit']
+        wind_unit = language_dict[self.language]['chart_wind_unit']
+        x_labels = [daily.date[i] + "\n" + daily.text[i] + "\n" + str(daily.humidity[i]) + "%\n"
+                    + daily.wind_dir[i] + daily.wind_scale[i] + wind_unit for i in range(len(daily))]
         self.ax.set_xticks(x)
         self.ax.set_xticklabels(x_labels)
 
@@ -460,9 +523,10 @@ class Chart24HoursPage(SerialPage):
         # Adjust the scroll region
         self.canvas.config(scrollregion=self.canvas.bbox("all"))
         
-    def update(self, **kwargs):
+    def update(self, hourly):
         """
         Update the chart with new data
+            :param hourly: forecast of the next 24 hours(WeatherModel.HourlySeries)
         """
 
         # Clear the chart
@@ -473,26 +537,24 @@ class Chart24HoursPage(SerialPage):
         self.title = language_dict[self.language]['24h_title']
         self.ax.set_title(self.title)
         self.ax.set_yticks([])
-        # Retrieve hourly weather data from kwargs
-        data = kwargs['hourly']
 
         # Plot temperature
-        x = np.arange(len(data))
-        y1 = [int(data[i]['temp']) for i in range(len(data))]
+        x = np.arange(len(hourly))
+        y1 = hourly.temp
         self.ax.plot(x, y1, color='red')
         self.ax.scatter(x, y1, color='red')
         # Plot the temperature value on the chart, adjust the offset of the text
-        span = max(y1) - min(y1)
-        for i in range(len(data)):
-            y_offset = 10 if span and (y1[i] - min(y1)) / span < 0.8 else -20
+        y_min = int(y1.min())
+        span = int(y1.max()) - y_min
+        for i in range(len(hourly)):
+            y_offset = 10 if span and (y1[i] - y_min) / span < 0.8 else -20
             self.ax.annotate(str(y1[i]) + "°C", (x[i], y1[i]), textcoords="offset points", xytext=(0, y_offset),
                              ha='center', color='red')
 
         # x-axis labels: time, weather, humidity, wind
-        x_labels = [data[i]['fxTime'][11:16] for i in range(len(data))]
-        for i in range(len(data)):
-            x_labels[i] += "\n" + data[i]['text'] + "\n" + data[i]['humidity'] + "%\n" \
-                + data[i]['windDir'] + data[i]['windScale'] + language_dict[self.language]['chart_wind_unit']
+        wind_unit = language_dict[self.language]['chart_wind_unit']
+        x_labels = [hourly.time[i] + "\n" + hourly.text[i] + "\n" + str(hourly.humidity[i]) + "%\n"
+                    + hourly.wind_dir[i] + hourly.wind_scale[i] + wind_unit for i in range(len(hourly))]
         self.ax.set_xticks(x)
         self.ax.set_xticklabels(x_labels)  # Rotate x-axis labels for better visibility
 
@@ -549,19 +611,18 @@ class ChartRainPage(SerialPage):
         self.canvas.draw()
         self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=1)
     
-    def update(self, **kwargs):
+    def update(self, minutely):
         """
         Update the chart with new data
+            :param minutely: precipitation of the next 2 hours(WeatherModel.MinutelySeries)
         """
 
         # Clear the chart
         self.clear()
-        # Retrieve 5-minutely weather data from kwargs
-        data = kwargs['minutely']
 
         # Plot precipitation
-        x = np.arange(len(data))
-        y1 = [float(data[i]['precip']) for i in range(len(data))]
+        x = np.arange(len(minutely))
+        y1 = minutely.precip
         self.ax.plot(x, y1)
         # Plot the precipitation value on the chart, adjust the offset of the text
         # span = max(y1) - min(y1)
@@ -571,16 +632,14 @@ class ChartRainPage(SerialPage):
         #         self.ax.annotate(str(y1[i]), (x[i], y1[i]), textcoords="offset points", xytext=(0, y_offset), ha='center')
 
         # Set y-axis range and x-axis labels
-        self.ax.set_ylim(-0.1, max(max(y1), 1) * 1.1)
+        self.ax.set_ylim(-0.1, max(float(y1.max()) if len(y1) else 0, 1) * 1.1)
         self.ax.set_yticks([])
         # x-axis labels: time
-        x_labels = [data[i]['fxTime'][11:16] for i in range(len(data))]
         self.ax.set_xticks(x[::6])
-        self.ax.set_xticklabels(x_labels[::6])
+        self.ax.set_xticklabels(minutely.time[::6])
 
         # Update the title
-        title = kwargs['summary']
-        self.ax.set_title(title)
+        self.ax.set_title(minutely.summary)
         # Draw the chart
         self.canvas.draw()
     
@@ -742,6 +801,8 @@ class SerialDisplay(tk.Frame):
 
 # Test code
 if __name__ == "__main__":
+    from utils.WeatherModel import DailySeries, HourlySeries, MinutelySeries
+
     root = tk.Tk()
     root.title("Serial Display")
 
@@ -758,30 +819,38 @@ if __name__ == "__main__":
     tempdata = []
     for i in range(7):
         tempdata.append({
-            'date': '2020-01-01',
-            'tempMax': np.random.randint(0, 100),
-            'tempMin': np.random.randint(0, 100),
-            'name': 'test',
-            'category': 'test'
+            'fxDate': '2020-01-0' + str(i + 1),
+            'tempMax': np.random.randint(50, 100),
+            'tempMin': np.random.randint(0, 50),
+            'humidity': '50',
+            'textDay': 'test',
+            'windDirDay': 'test',
+            'windScaleDay': '1-3'
         })
-    chart_7days_page.update(daily=tempdata)
+    chart_7days_page.update(DailySeries.parse({'daily': tempdata}))
     serial_display.pack(padx=20, pady=20)
     temp24data = []
     for i in range(24):
         temp24data.append({
-            'temp': np.random.randint(0, 100)
+            'fxTime': '2020-01-01T{:02d}:00+08:00'.format(i),
+            'temp': np.random.randint(0, 100),
+            'humidity': '50',
+            'text': 'test',
+            'windDir': 'test',
+            'windScale': '1-3'
         })
     chart_24hours_page = Chart24HoursPage(serial_display)
     serial_display.add_page(chart_24hours_page)
-    chart_24hours_page.update(hourly=temp24data)
+    chart_24hours_page.update(HourlySeries.parse({'hourly': temp24data}))
     tempRaindata = []
     for i in range(24):
         tempRaindata.append({
+            'fxTime': '2020-01-01T{:02d}:{:02d}+08:00'.format(i // 12, i % 12 * 5),
             'precip': np.random.randint(0, 100)
         })
     chart_rain_page = ChartRainPage(serial_display)
     serial_display.add_page(chart_rain_page)
-    chart_rain_page.update(minutely=tempRaindata)
+    chart_rain_page.update(MinutelySeries.parse({'minutely': tempRaindata, 'summary': 'test'}))
     
 
     root.mainloop()
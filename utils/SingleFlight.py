@@ -0,0 +1,99 @@
+# SingleFlight.py
+# Description: single-flight request coalescing
+#     Concurrent calls with the same key share one in-flight call and its result
+# By Monster Kid
+
+import asyncio
+import threading
+from concurrent.futures import Future
+
+class SingleFlight(object):
+    """
+    SingleFlight for threads
+    The first caller of a key(the leader) runs the function, the others wait for its result
+    Methods:
+        - do: run a function once for all the concurrent callers of a key
+    """
+
+    def __init__(self):
+        # in-flight calls {key: Future}
+        self.calls = {}
+        self.lock = threading.Lock()
+        # number of calls that shared the result of another call
+        self.shared = 0
+
+    def do(self, key, function):
+        """
+        Run function once for all the concurrent callers of key
+        Parameters:
+            :param key: key of the call(hashable)
+            :param function: function without arguments
+        Return:
+            :return: result of the function, exceptions are raised to all the callers
+        """
+
+        with self.lock:
+            future = self.calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self.calls[key] = future
+            else:
+                self.shared += 1
+        # followers wait for the leader
+        if not leader:
+            return future.result()
+        # leader runs the function
+        try:
+            result = function()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+
+class AsyncSingleFlight(object):
+    """
+    SingleFlight for coroutines, must be used in one event loop
+    The call runs as a task, so a caller being cancelled(e.g. timeout) does not cancel it for the others
+    Methods:
+        - do: run a coroutine once for all the concurrent callers of a key
+    """
+
+    def __init__(self):
+        # in-flight calls {key: Task}
+        self.calls = {}
+        # number of calls that shared the result of another call
+        self.shared = 0
+
+    def done_callback(self, key, task):
+        """
+        Remove the finished task, and retrieve its exception to avoid "never retrieved" warnings
+        """
+        if self.calls.get(key) is task:
+            del self.calls[key]
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key, coro_function):
+        """
+        Run coro_function once for all the concurrent callers of key
+        Parameters:
+            :param key: key of the call(hashable)
+            :param coro_function: coroutine function without arguments
+        Return:
+            :return: result of the coroutine, exceptions are raised to all the callers
+        """
+
+        task = self.calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(coro_function())
+            self.calls[key] = task
+            task.add_done_callback(lambda t: self.done_callback(key, t))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
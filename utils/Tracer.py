@@ -0,0 +1,165 @@
+# Tracer.py
+# Description: lightweight span tracing, exported in Chrome trace-event format
+#     Open the exported file in chrome://tracing or https://ui.perfetto.dev to see one refresh as a timeline
+# By Monster Kid
+
+import os
+import json
+import time
+import asyncio
+import threading
+
+class Tracer(object):
+    """
+    Tracer: record spans(name, start, duration) of the stages of a refresh
+    - When disabled, span returns a shared no-op context manager, so tracing costs a function call
+    - Spans of a thread are on the row of the thread, spans of an asyncio task on the row of the task,
+      so the parallel requests of a fan-out are displayed side by side
+    Methods:
+        - start: clear the recorded spans and start recording
+        - stop: stop recording
+        - span: context manager, record the time of a block
+        - export: write the recorded spans to a Chrome trace-event json file
+        - clear: remove the recorded spans
+    """
+
+    def __init__(self, enabled: bool = False, max_events: int = 100000):
+        """
+        Init Tracer
+        Parameters:
+            :param enabled: whether to record spans(bool)
+            :param max_events: spans after this number are dropped, so a forgotten trace does not eat the memory(int)
+        """
+
+        self.enabled = enabled
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.events = []
+        # row of each thread or task {ident: tid}
+        self.rows = {}
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+
+    def start(self):
+        """
+        Clear the recorded spans and start recording
+        """
+        self.clear()
+        self.enabled = True
+
+    def stop(self):
+        """
+        Stop recording, the recorded spans are kept until exported or cleared
+        """
+        self.enabled = False
+
+    def clear(self):
+        """
+        Remove the recorded spans
+        """
+        with self.lock:
+            self.events = []
+            self.rows = {}
+            self.origin = time.perf_counter()
+
+    def span(self, name: str, **args):
+        """
+        Context manager, record the time of a block
+        e.g. with tracer.span('update_labels'): ...
+        Parameters:
+            :param name: name of the span(str)
+            :param args: arguments displayed with the span
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, args)
+
+    def get_row(self) -> int:
+        """
+        Get the row(tid) of the current asyncio task, or of the current thread
+        """
+
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            task = None
+        if task is not None:
+            ident, row_name = ('task', id(task)), 'task ' + task.get_name()
+        else:
+            ident, row_name = ('thread', threading.get_ident()), threading.current_thread().name
+        with self.lock:
+            tid = self.rows.get(ident)
+            if tid is None:
+                tid = len(self.rows) + 1
+                self.rows[ident] = tid
+                # metadata: name of the row
+                self.events.append({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid,
+                                    'args': {'name': row_name}})
+        return tid
+
+    def add(self, name: str, tid: int, start: float, end: float, args: dict):
+        """
+        Add a complete span, start and end are perf_counter times
+        """
+        event = {'name': name, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                 'ts': (start - self.origin) * 1e6, 'dur': (end - start) * 1e6, 'args': args}
+        with self.lock:
+            if len(self.events) < self.max_events:
+                self.events.append(event)
+
+    def export(self, path: str) -> int:
+        """
+        Write the recorded spans to a Chrome trace-event json file
+        Parameters:
+            :param path: the file(str)
+        Return:
+            :return: number of the recorded spans(int)
+        """
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+        return sum(1 for event in events if event['ph'] == 'X')
+
+
+class Span(object):
+    """
+    A span being recorded, returned by Tracer.span
+    """
+
+    __slots__ = ('tracer', 'name', 'args', 'tid', 'start')
+
+    def __init__(self, tracer: Tracer, name: str, args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.tid = self.tracer.get_row()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        end = time.perf_counter()
+        args = self.args
+        if exc_type is not None:
+            args = dict(args, error=exc_type.__name__)
+        self.tracer.add(self.name, self.tid, self.start, end, args)
+        return False
+
+
+class NullSpan(object):
+    """
+    No-op span, returned by Tracer.span when tracing is disabled
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
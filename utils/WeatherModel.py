@@ -0,0 +1,212 @@
+# WeatherModel.py
+# Description: typed, compact model of the weather responses
+#     Each response is parsed once when it arrives. The series(daily, hourly, minutely) are kept as NumPy arrays,
+#     so the charts plot them directly and no number is parsed again on the UI thread
+# By Monster Kid
+
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def to_dict(record) -> dict:
+    """
+    Convert a record or a series to a dict that can be dumped to json, arrays and tuples become lists
+    """
+    data = {}
+    for name in record.__slots__:
+        value = getattr(record, name)
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, tuple):
+            value = list(value)
+        data[name] = value
+    return data
+
+
+class NowRecord(object):
+    """
+    Current weather, parsed from the 'now' response
+    """
+
+    __slots__ = ('temp', 'text', 'update_time', 'source')
+
+    def __init__(self, temp: int, text: str, update_time: str, source: str):
+        """
+        Init NowRecord
+        Parameters:
+            :param temp: temperature in °C(int)
+            :param text: description of the weather(str)
+            :param update_time: the time the provider updated the weather, e.g. 2021-02-16 16:00(str)
+            :param source: sources and license of the data(str)
+        """
+        self.temp = temp
+        self.text = text
+        self.update_time = update_time
+        self.source = source
+
+    @classmethod
+    def parse(cls, data: dict):
+        """
+        Parse a 'now' response
+        """
+        now = data['now']
+        # datetime string is ISO 8601 format, e.g. 2021-02-16T16:00+08:00
+        update_time = data['updateTime'][:10] + ' ' + data['updateTime'][11:16]
+        refer = data.get('refer') or {}
+        source = ' '.join(refer.get(key, [''])[0] for key in ('sources', 'license'))
+        return cls(int(now['temp']), now['text'], update_time, source)
+
+
+class DailySeries(object):
+    """
+    Forecast of the next days, parsed from the '7d' response
+    The numbers are arrays, the texts are tuples, one item per day
+    """
+
+    __slots__ = ('date', 'temp_max', 'temp_min', 'humidity', 'text', 'wind_dir', 'wind_scale', 'today')
+
+    @classmethod
+    def parse(cls, data: dict):
+        """
+        Parse a '7d' response
+        """
+        daily = data['daily']
+        series = cls()
+        series.date = tuple(day['fxDate'][5:] for day in daily)
+        series.temp_max = np.array([day['tempMax'] for day in daily], dtype=np.int16)
+        series.temp_min = np.array([day['tempMin'] for day in daily], dtype=np.int16)
+        series.humidity = np.array([day['humidity'] for day in daily], dtype=np.int16)
+        series.text = tuple(day['textDay'] for day in daily)
+        series.wind_dir = tuple(day['windDirDay'] for day in daily)
+        series.wind_scale = tuple(day['windScaleDay'] for day in daily)
+        # sunrise, sunset and the moon of today, displayed by the sun and moon page
+        series.today = dict(daily[0])
+        return series
+
+    def __len__(self):
+        return len(self.date)
+
+
+class HourlySeries(object):
+    """
+    Forecast of the next 24 hours, parsed from the '24h' response
+    """
+
+    __slots__ = ('time', 'temp', 'humidity', 'text', 'wind_dir', 'wind_scale')
+
+    @classmethod
+    def parse(cls, data: dict):
+        """
+        Parse a '24h' response
+        """
+        hourly = data['hourly']
+        series = cls()
+        series.time = tuple(hour['fxTime'][11:16] for hour in hourly)
+        series.temp = np.array([hour['temp'] for hour in hourly], dtype=np.int16)
+        series.humidity = np.array([hour['humidity'] for hour in hourly], dtype=np.int16)
+        series.text = tuple(hour['text'] for hour in hourly)
+        series.wind_dir = tuple(hour['windDir'] for hour in hourly)
+        series.wind_scale = tuple(hour['windScale'] for hour in hourly)
+        return series
+
+    def __len__(self):
+        return len(self.time)
+
+
+class MinutelySeries(object):
+    """
+    Precipitation of the next 2 hours, every 5 minutes, parsed from the 'rain' response
+    """
+
+    __slots__ = ('time', 'precip', 'summary')
+
+    @classmethod
+    def parse(cls, data: dict):
+        """
+        Parse a 'rain' response
+        """
+        minutely = data['minutely']
+        series = cls()
+        series.time = tuple(minute['fxTime'][11:16] for minute in minutely)
+        series.precip = np.array([minute['precip'] for minute in minutely], dtype=np.float32)
+        series.summary = data.get('summary', '')
+        return series
+
+    def __len__(self):
+        return len(self.time)
+
+
+class WeatherModel(object):
+    """
+    WeatherModel: the parsed weather of a city, one attribute per parsed section
+    An attribute is None if its section has no good response, or the response can not be parsed
+    The sections whose response could not be parsed are listed in `errors` and logged
+    Methods:
+        - parse: parse a weather dict, reusing the sections of a previous model that were not fetched again
+        - compact: drop the raw series from a weather dict, they are kept by the model
+    """
+
+    __slots__ = ('now', 'daily', 'hourly', 'minutely', 'errors')
+
+    # {section: (attribute, parser, key of the raw series in the response)}
+    SECTIONS = {
+        'now': ('now', NowRecord.parse, None),
+        '7d': ('daily', DailySeries.parse, 'daily'),
+        '24h': ('hourly', HourlySeries.parse, 'hourly'),
+        'rain': ('minutely', MinutelySeries.parse, 'minutely'),
+    }
+
+    def __init__(self):
+        self.now = None
+        self.daily = None
+        self.hourly = None
+        self.minutely = None
+        # sections whose good response could not be parsed by the last parse
+        self.errors = []
+
+    @classmethod
+    def parse(cls, weather: dict, previous=None, sections: list = None):
+        """
+        Parse a weather dict
+        Parameters:
+            :param weather: weather dict, refer to WeatherAssistant.EMPTY_WEATHER_DICT
+            :param previous: model of the same city, its sections not in `sections` are reused(WeatherModel)
+            :param sections: sections of the weather dict that changed, None means all
+        Return:
+            :return: the model(WeatherModel)
+        """
+
+        model = cls()
+        for section, (attribute, parser, _) in cls.SECTIONS.items():
+            if previous is not None and sections is not None and section not in sections:
+                setattr(model, attribute, getattr(previous, attribute))
+                continue
+            data = weather.get(section)
+            if data is None or data.get('code') != '200':
+                continue
+            try:
+                setattr(model, attribute, parser(data))
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                # a malformed response is displayed as no content
+                model.errors.append(section)
+                logger.warning('cannot parse the %s response: %s: %s', section, type(e).__name__, e)
+        return model
+
+    @classmethod
+    def compact(cls, weather: dict) -> dict:
+        """
+        Drop the raw series from a weather dict, the model keeps them as arrays
+        The responses are copied, they may be shared with the response cache
+        Parameters:
+            :param weather: weather dict
+        Return:
+            :return: weather dict whose responses keep their code, updateTime and the other small fields(dict)
+        """
+
+        weather = dict(weather)
+        for section, (_, _, key) in cls.SECTIONS.items():
+            data = weather.get(section)
+            if key is not None and data is not None and key in data:
+                weather[section] = {name: value for name, value in data.items() if name != key}
+        return weather
@@ -0,0 +1,182 @@
+# ResolveCityIds.py
+# Description: Resolve every city in all_city.csv to HeFeng location id, latitude and longitude
+#     The result is a sidecar index of all_city.csv, so the program doesn't need to look up locations
+#     It's a resumable, rate-limited batch job. Run it from the root directory of the program:
+#         python -m utils.get_all_cities.ResolveCityIds --qps 5
+#     Use --base-url to run it against a local stand-in server
+# By Monster Kid
+
+import os
+import csv
+import json
+import time
+import argparse
+import urllib.parse
+
+# HeFeng geo API
+BASE_URL = 'https://geoapi.qweather.com'
+LOOKUP_PATH = '/v2/city/lookup?'
+HF_KEY = '55c7da0804024e868a70beb00fcd8c03'
+# Input, output and checkpoint files
+ALL_CITY = 'data/all_city.csv'
+OUTPUT_FILE = 'data/city_locations.csv'
+CHECKPOINT_FILE = 'data/city_locations.checkpoint.jsonl'
+# Codes that mean "retry later"
+RETRY_CODES = ['429', '500']
+# Codes that fail every later request too: quota used up(402), bad key(401) or no permission(403)
+STOP_CODES = ['401', '402', '403']
+# Code of a name that does not exist, it's checkpointed as not found
+NOT_FOUND_CODE = '404'
+
+
+def requests_transport(timeout: float = 10):
+    """
+    Create the default transport: a function url -> decoded json, based on a requests session
+    Any function with the same signature can be used instead, e.g. to mock the API in tests
+    """
+    import requests
+    session = requests.Session()
+    return lambda url: session.get(url, timeout=timeout).json()
+
+
+def load_city_names(csv_file: str) -> list:
+    """
+    Load the names to resolve from all_city.csv, in file order and without duplicates
+    Both cities and states are resolved, because both of them can be added by the user
+    (refer to WeatherAssistant.load_all_cities)
+    """
+
+    names = []
+    seen = set()
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        # skip the header
+        next(f)
+        for line in f:
+            line = line.strip().split(',')
+            # line[1]: EnglishName, line[3]: StateNameEn, the state of some cities is "None"
+            for name in (line[3], line[1]):
+                name = name.strip()
+                if name and name != "None" and name not in seen:
+                    seen.add(name)
+                    names.append(name)
+    return names
+
+
+def load_checkpoint(checkpoint_file: str) -> dict:
+    """
+    Load resolved names from the checkpoint file
+    Return:
+        :return: {name: {'id', 'lat', 'lon'} or None if not found}
+    """
+
+    done = {}
+    if not os.path.exists(checkpoint_file):
+        return done
+    with open(checkpoint_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # the last line may be broken if the job was killed
+                continue
+            done[record['name']] = record['location']
+    return done
+
+
+def resolve_all(names: list, transport, base_url: str = BASE_URL, qps: float = 5, max_retries: int = 5,
+                checkpoint_file: str = CHECKPOINT_FILE, log=print) -> dict:
+    """
+    Resolve all the names, skipping the ones in the checkpoint file
+    Each result is appended to the checkpoint file at once, so the job can be killed and resumed at any time
+    Only answers are checkpointed: a location, or not found(404). On any other error the name is left to the
+    next run, and on 401, 402 or 403 the run stops, because the rest of the names would fail the same way
+    Parameters:
+        :param names: names to resolve(list)
+        :param transport: function url -> decoded json
+        :param base_url: base url of HeFeng geo API(str)
+        :param qps: max requests per second(float)
+        :param max_retries: max number of retries of a name when the API answers 429 or 500(int)
+        :param checkpoint_file: path of the checkpoint file(str)
+        :param log: logging function
+    Return:
+        :return: {name: {'id', 'lat', 'lon'} or None if not found}
+    """
+
+    done = load_checkpoint(checkpoint_file)
+    todo = [name for name in names if name not in done]
+    log(f'{len(done)} resolved, {len(todo)} to go')
+    interval = 1 / qps if qps > 0 else 0
+    next_time = time.monotonic()
+    with open(checkpoint_file, 'a', encoding='utf-8') as checkpoint:
+        for i, name in enumerate(todo):
+            location = None
+            for retry in range(max_retries + 1):
+                # rate limit: wait until the next slot
+                now = time.monotonic()
+                if now < next_time:
+                    time.sleep(next_time - now)
+                next_time = max(now, next_time) + interval
+
+                url = base_url + LOOKUP_PATH + 'key=' + HF_KEY + '&location=' + urllib.parse.quote(name)
+                try:
+                    data = transport(url)
+                    code = data.get('code')
+                except Exception as e:
+                    data, code = None, '500'
+                if code not in RETRY_CODES:
+                    break
+                # too many requests or server error: exponential backoff
+                time.sleep(min(60, interval * 2 ** retry + 1))
+            else:
+                # still failing, leave it to the next run
+                log(f'give up {name} for now')
+                continue
+
+            if code in STOP_CODES:
+                log(f'stop at {name}: code {code}, resume the job later')
+                break
+            if code == '200' and data.get('location'):
+                city = data['location'][0]
+                location = {'id': city['id'], 'lat': city['lat'], 'lon': city['lon']}
+            elif code != NOT_FOUND_CODE and code != '200':
+                # not an answer about the name, leave it to the next run
+                log(f'skip {name}: code {code}')
+                continue
+            done[name] = location
+            checkpoint.write(json.dumps({'name': name, 'location': location}, ensure_ascii=False) + '\n')
+            checkpoint.flush()
+            if (i + 1) % 100 == 0:
+                log(f'{i + 1}/{len(todo)}')
+    return done
+
+
+def write_index(done: dict, output_file: str = OUTPUT_FILE):
+    """
+    Write the sidecar index: EnglishName,id,lat,lon. Names not found are skipped
+    The file is replaced atomically, so the program never reads a half-written index
+    """
+
+    temp_file = output_file + '.tmp'
+    with open(temp_file, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['EnglishName', 'id', 'lat', 'lon'])
+        for name, location in done.items():
+            if location is not None:
+                writer.writerow([name, location['id'], location['lat'], location['lon']])
+    os.replace(temp_file, output_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Resolve all_city.csv to HeFeng location ids')
+    parser.add_argument('--input', default=ALL_CITY, help='all_city.csv')
+    parser.add_argument('--output', default=OUTPUT_FILE, help='sidecar index to write')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='checkpoint file, delete it to start over')
+    parser.add_argument('--base-url', default=BASE_URL, help='base url of the geo API, e.g. a local stand-in server')
+    parser.add_argument('--qps', type=float, default=5, help='max requests per second')
+    args = parser.parse_args()
+
+    names = load_city_names(args.input)
+    done = resolve_all(names, requests_transport(), base_url=args.base_url, qps=args.qps,
+                       checkpoint_file=args.checkpoint)
+    write_index(done, args.output)
+    print(f'{sum(location is not None for location in done.values())}/{len(names)} resolved, written to {args.output}')
@@ -5,7 +5,69 @@
 import re
 from assets.multi_lang_dict import *
 
-def predict_city(input_text: str, cities: dict, n_entries: int = 5, language: str = 'English') -> list:
+# characters kept in a normalized English name, and the pattern of the others
+ENGLISH_LETTERS_AND_SPACE = 'abcdefghijklmnopqrstuvwxyz '
+NON_ENGLISH_CHARS = re.compile(r'[^a-z ]')
+
+
+def normalize_name(text: str, language: str) -> str:
+    """
+    Normalize a name or an input text before matching: English is lowercased and only letters and spaces are kept
+    Most inputs are only letters and spaces, they are checked by str.strip and don't run the regex
+    """
+    if language == 'English':
+        text = text.lower()
+        if text.strip(ENGLISH_LETTERS_AND_SPACE):
+            text = NON_ENGLISH_CHARS.sub('', text)
+    return text
+
+
+class CityIndex(object):
+    """
+    CityIndex: a prefix index of the city dict, built once when the cities are loaded
+    - Each prefix of the search keys(normalized names) of each language has a bucket of the cities whose key
+      starts with it
+    - The buckets are filled in the order of the rank: Chinese cities first, then by English name,
+      so a bucket is already in the order of the predictions
+    The search keys and the ranks are the columns precomputed by WeatherAssistant.load_all_cities
+    A lookup is a dict lookup and a slice, O(m + k) for an input of length m and k predictions, instead of
+    normalizing every name. The buckets hold one entry per character of the keys
+    Methods:
+        - search: the cities whose name starts with a text, in the order of the predictions
+    """
+
+    def __init__(self, cities: dict):
+        """
+        Init CityIndex
+        Parameters:
+            :param cities: the city dict, refer to WeatherAssistant.load_all_cities(dict)
+        """
+
+        # cities in the order of the predictions
+        self.by_rank = sorted(cities.values(), key=lambda city: city['rank'])
+        # {language: {prefix: cities whose search key starts with the prefix, in the order of the predictions}}
+        self.buckets = {}
+        for language, alias in language_alias_dict.items():
+            buckets = {}
+            for city in self.by_rank:
+                key = city[alias]['SearchKey']
+                for end in range(1, len(key) + 1):
+                    buckets.setdefault(key[:end], []).append(city)
+            self.buckets[language] = buckets
+
+    def search(self, input_text: str, n_entries: int = 5, language: str = 'English') -> list:
+        """
+        The cities whose name starts with input_text, refer to predict_city
+        """
+
+        input_text = normalize_name(input_text, language)
+        if input_text == '':
+            return []
+        return self.buckets[language].get(input_text, [])[:n_entries]
+
+
+def predict_city(input_text: str, cities: dict, n_entries: int = 5, language: str = 'English',
+                 index: CityIndex = None) -> list:
     """
     Predict the city based on the user input  
     Input:
@@ -13,6 +75,7 @@ def predict_city(input_text: str, cities: dict, n_entries: int = 5, language: st
     - cities: the city dict
     - n_entries: the number of entries to return
     - language: the language of the input text, only support English and Chinese  
+    - index: prefix index of the city dict. If given, it's used instead of scanning the city dict
     Output:
     - match_list: the list of matched cities
     """
@@ -20,6 +83,9 @@ def predict_city(input_text: str, cities: dict, n_entries: int = 5, language: st
     # To Copilot: This is not based on AI
     # This is just a simple string matching algorithm
 
+    if index is not None:
+        return index.search(input_text, n_entries, language)
+
     if language == 'English':
         # convert to lower case
         input_text = input_text.lower()